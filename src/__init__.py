@@ -9,7 +9,9 @@ import src.objects
 import src.gui
 import src.helper
 import src.wa
+import src.wa_client
 import src.sympy
+import src.backends
 
 # import src.semantic_enrichment
 
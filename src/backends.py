@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__      = "Felix Petersen"
+__status__      = "Production"
+
+
+import copy
+import time
+import signal
+import _thread
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import src.objects
+from src.sympy import SympyTimeout
+
+
+# Results of SymPy which are escalated to WolframAlpha in the hybrid mode:
+UNDECIDED_RESULTS = ['None', 'sub and div different', 'Timeout']
+
+
+class Backends:
+    """
+    Combines the SymPy and the WolframAlpha helper classes.
+
+    In the hybrid mode every equation is checked locally using SymPy first and only sent to WolframAlpha if SymPy
+    can not decide it.
+
+    In the race mode both backends check every equation at the same time and the first decisive result is used.
+    """
+
+    # For statistics purposes (seconds per check of each backend in the race mode):
+    latencies = {'SymPy': [], 'WolframAlpha': []}
+
+    def __init__(self, args, wa, sp):
+        """
+        Initializer of the Backends.
+
+        :param args: `args`
+        :param wa: WA object
+        :param sp: SP object
+        """
+        self.args = args
+        self.wa = wa
+        self.sp = sp
+        self.executor = ThreadPoolExecutor(max_workers=max(1, args.wolfram_alpha_concurrency))
+
+    def should_escalate(self, query, lets, result):
+        """
+        :param query: Equation object which has been checked by SymPy
+        :param lets: List of (Let)s
+        :param result: result of SymPy
+        :return: True if the equation should be checked by WolframAlpha, too
+        """
+        if any(result.startswith(undecided) for undecided in UNDECIDED_RESULTS):
+            return True
+        # A False result may turn into True considering the lets of WolframAlpha:
+        if self.args.lets and result.startswith('False') and self.wa.lets_may_apply(query, lets):
+            return True
+        return False
+
+    def mirror_definition(self, query, lets, result, left_content, right_content):
+        """
+        Adds a definition which SymPy has recorded to the lets of WolframAlpha, too (locally, without a query), so
+        that the later equations which are escalated to WolframAlpha can use it.
+
+        :param query: Equation object which has been checked by SymPy
+        :param lets: List of (Let)s
+        :param result: result of SymPy
+        :param left_content: original LaTeX code of the left side (before SymPy modified it)
+        :param right_content: original LaTeX code of the right side
+        """
+        if not self.args.lets or not (':' in str(query.comparator) or result == 'new'):
+            return
+        sp_content = (query.left_content, query.right_content)
+        query.left_content = self.wa.prepare_content(left_content)
+        query.right_content = self.wa.prepare_content(right_content)
+        self.wa.consider_as_let(query, lets)
+        query.left_content, query.right_content = sp_content
+
+    def wa_query(self, query, lets):
+        """
+        Checks the equation using WolframAlpha and, if it is unavailable and `args.wa_fallback_sympy` is set, using SymPy.
+
+        :param query: Equation object to be checked
+        :param lets: List of (Let)s
+        :return: result
+        """
+        left_content = query.left_content
+        right_content = query.right_content
+
+        result = self.wa.wa_query(query, lets)
+        query.backend = 'WolframAlpha'
+
+        if result == 'Unavailable' and self.args.wa_fallback_sympy:
+            query.left_content = left_content
+            query.right_content = right_content
+            result = self.sp.sympy_query(query, lets)
+            query.backend = 'SymPy'
+
+        return result
+
+    def hybrid_query(self, query, lets):
+        """
+        Checks the equation using SymPy and, if SymPy can not decide it, using WolframAlpha.
+
+        :param query: Equation object to be checked
+        :param lets: List of (Let)s
+        :return: result
+        """
+        left_content = query.left_content
+        right_content = query.right_content
+
+        result = self.sp.sympy_query(query, lets)
+        query.backend = 'SymPy'
+        self.mirror_definition(query, lets, result, left_content, right_content)
+
+        if self.should_escalate(query, lets, result):
+            if self.args.verbose:
+                print('SymPy: ' + result + ' => WolframAlpha')
+            sp_result, sp_content, sp_reason = result, (query.left_content, query.right_content), query.reason
+            # SymPy has already modified the content (which would conflict the matrix translation for WA):
+            query.left_content = left_content
+            query.right_content = right_content
+            query.reason = ''
+            result = self.wa.wa_query(query, lets)
+            query.backend = 'WolframAlpha'
+
+            if result == 'Unavailable' and self.args.wa_fallback_sympy:
+                result = sp_result
+                query.left_content, query.right_content = sp_content
+                query.reason = sp_reason
+                query.backend = 'SymPy'
+
+        return result
+
+    def race_query(self, query, lets):
+        """
+        Checks the equation using SymPy (in the main thread) and WolframAlpha (in a worker thread) at the same time.
+
+        The first decisive result ('True' / 'False') wins: if WolframAlpha wins, SymPy is interrupted; if SymPy wins, the
+        result of WolframAlpha is ignored. WolframAlpha works on a snapshot of the lets, which is only committed if its
+        result is used. If none of them is decisive, the result is chosen like in the hybrid mode.
+
+        :param query: Equation object to be checked
+        :param lets: List of (Let)s
+        :return: result
+        """
+        sp_query = copy.copy(query)
+        wa_query = copy.copy(query)
+        # Lets created by WolframAlpha have to mark the original Equation:
+        wa_query.is_used = query.is_used
+        snapshot = LetsSnapshot(lets)
+
+        lock = threading.Lock()
+        state = {'sympy_running': True, 'wa_decisive_first': False}
+
+        def cancel_sympy(signum, frame):
+            if state['sympy_running']:
+                raise SympyTimeout()
+
+        def run_wa():
+            start = time.perf_counter()
+            try:
+                result = self.wa.wa_query(wa_query, snapshot.lets)
+            except Exception as e:
+                print('There was the following exception: ' + str(e))
+                result = 'None'
+            Backends.latencies['WolframAlpha'].append(time.perf_counter() - start)
+            if is_decisive(result):
+                with lock:
+                    if state['sympy_running']:
+                        state['wa_decisive_first'] = True
+                        _thread.interrupt_main(signal.SIGUSR1)
+            return result
+
+        handler = signal.signal(signal.SIGUSR1, cancel_sympy)
+        try:
+            wa_future = self.executor.submit(run_wa)
+            start = time.perf_counter()
+            try:
+                sp_result = self.sp.sympy_query(sp_query, lets)
+                with lock:
+                    state['sympy_running'] = False
+            except SympyTimeout:
+                sp_result = 'Cancelled'
+            finally:
+                state['sympy_running'] = False
+            Backends.latencies['SymPy'].append(time.perf_counter() - start)
+        finally:
+            signal.signal(signal.SIGUSR1, handler)
+
+        if is_decisive(sp_result) and not state['wa_decisive_first']:
+            winner, result = sp_query, sp_result
+            query.backend = 'SymPy'
+        else:
+            wa_result = wa_future.result()
+            if is_decisive(wa_result) or (self.should_escalate(sp_query, lets, sp_result) and
+                                          not (wa_result == 'Unavailable' and self.args.wa_fallback_sympy)):
+                winner, result = wa_query, wa_result
+                query.backend = 'WolframAlpha'
+                snapshot.commit()
+            else:
+                winner, result = sp_query, sp_result
+                query.backend = 'SymPy'
+
+        if self.args.verbose:
+            print(query.backend + ' wins: ' + result)
+
+        query.left_content = winner.left_content
+        query.right_content = winner.right_content
+        query.reason = winner.reason
+        query.interpretation_of_equation_to_latex = sp_query.interpretation_of_equation_to_latex
+        return result
+
+    def finish(self):
+        """
+        Waits for the WolframAlpha checks which are still running (e.g. of races SymPy has won), so that their results
+        are stored and their latencies are recorded, and cancels the unused prefetched queries.
+        """
+        self.executor.shutdown(wait=True)
+        self.wa.finish()
+
+
+def is_decisive(result):
+    return result.startswith('True') or result.startswith('False')
+
+
+class LetsSnapshot:
+    """
+    Copy of the lets on which WolframAlpha can work in the race mode without changing the original lets.
+
+    The calls of `Let.is_used` are recorded and only executed (together with the removed and added lets) by `commit`.
+    """
+
+    def __init__(self, lets):
+        self.original_lets = lets
+        self.lets = src.objects.Lets()
+        self.originals = {}
+        self.used = []
+        for let in lets:
+            let_copy = src.objects.Let(let.left, let.right, let.between, lambda let=let: self.used.append(let))
+            self.originals[let_copy] = let
+            self.lets.append(let_copy)
+
+    def commit(self):
+        """
+        Applies the changes of the snapshot to the original lets.
+        """
+        for let in self.used:
+            let.is_used()
+        remaining = [self.originals[let] for let in self.lets if let in self.originals]
+        for let in list(self.original_lets):
+            if let not in remaining:
+                self.original_lets.remove(let)
+        for let in self.lets:
+            if let not in self.originals:
+                self.original_lets.append(let)
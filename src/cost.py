@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__      = "Felix Petersen"
+__status__      = "Production"
+
+
+import os
+import copy
+import json
+
+import sympy
+
+import src.numeric
+import src.intervals
+
+
+# Strategies of `SP.sympy_check`:
+# - 'numeric': numerical evaluation of integrals, sums, products and limits (`src.numeric`)
+# - 'interval': interval arithmetic for inequalities (`src.intervals`)
+# - 'simplify': symbolic simplification of `left - right` and `left / right`
+STRATEGIES = ['numeric', 'interval', 'simplify']
+
+# Number of recorded runs of a strategy (within a class of equations) after which the timings replace the priors:
+MIN_RUNS = 3
+# Estimated seconds of the equations which are not parsed (unsupported commands etc.) resp. of matrix equations:
+REJECT_COST = 0.001
+MATRIX_COST = 0.05
+
+INFINITIES = (sympy.oo, -sympy.oo, sympy.zoo)
+
+
+def depth(expr):
+    if not expr.args:
+        return 1
+    return 1 + max(depth(arg) for arg in expr.args)
+
+
+def features(left, right, comparator):
+    """
+    Features of a parsed equation which determine the cost of its check.
+
+    :param left: left side (SymPy expression)
+    :param right: right side (SymPy expression)
+    :param comparator: Comparator
+    :return: dict with the number of operations, the depth, the number of heavy nodes (integrals, sums, products,
+             limits, derivatives), the number of symbols and whether the equation is an inequality resp. contains
+             infinity
+    """
+    return {
+        'ops': sympy.count_ops(left) + sympy.count_ops(right),
+        'depth': max(depth(left), depth(right)),
+        'heavy': len(left.atoms(*src.numeric.HEAVY_NODES, sympy.Derivative)) +
+                 len(right.atoms(*src.numeric.HEAVY_NODES, sympy.Derivative)),
+        'symbols': len(left.free_symbols | right.free_symbols),
+        'inequality': str(comparator) in src.intervals.INEQUALITIES,
+        'infinite': left.has(*INFINITIES) or right.has(*INFINITIES),
+    }
+
+
+def feature_class(features):
+    """
+    :return: name of the class of similar equations, whose timings are recorded together
+    """
+    if features['heavy']:
+        kind = 'heavy'
+    elif features['inequality']:
+        kind = 'inequality'
+    else:
+        kind = 'plain'
+    if features['ops'] < 10:
+        size = 'small'
+    elif features['ops'] < 40:
+        size = 'medium'
+    else:
+        size = 'large'
+    return kind + ' ' + size
+
+
+def prior(strategy, features):
+    """
+    Estimate of a strategy without recorded timings.
+
+    :return: tuple of the seconds and the probability that the result is decisive
+    """
+    if strategy == 'numeric':
+        return 0.2 * features['heavy'], 0.8
+    if strategy == 'interval':
+        return 0.02 * 2 ** min(features['symbols'], 10), 0.7
+    seconds = 0.005 + 0.001 * features['ops'] + 0.002 * features['depth'] + 2.0 * features['heavy']
+    return seconds, 0.1 if features['inequality'] else 0.9
+
+
+def is_decisive(strategy, result, remaining):
+    """
+    Whether the result of a strategy ends the route.
+
+    A 'False' of the simplification is only decisive if no other strategy is left: the simplified difference of
+    integrals, sums etc. (resp. of the sides of an inequality) is often just not recognized as 0 (resp. as positive),
+    so the order of the strategies must not turn the verdict of the numerical evaluation or the interval arithmetic
+    into 'False'.
+
+    :param strategy: name of the strategy
+    :param result: result of the strategy or None
+    :param remaining: list of the strategies which are left in the route
+    :return: True if no further strategy is tried
+    """
+    if result is None:
+        return False
+    if result.startswith('True'):
+        return True
+    return result.startswith('False') and (strategy != 'simplify' or not remaining)
+
+
+def is_applicable(strategy, features, comparator):
+    # Only the numerical evaluation handles infinity (as a bound or the point of a limit) reliably:
+    if features['infinite'] and strategy != 'numeric':
+        return False
+    if strategy == 'numeric':
+        return bool(features['heavy']) and str(comparator) in ['=', '\\equiv', '\\neq']
+    if strategy == 'interval':
+        return features['inequality']
+    return True
+
+
+class Timings:
+    """
+    Recorded timings of the strategies per class of equations (`feature_class`).
+
+    If a file is given, the timings are loaded from it and can be saved to it (JSON), so that the estimates improve
+    with every run. The estimates only use the timings which have been loaded (the ones recorded during the run are
+    only saved), so that the order of the strategies does not depend on the order of the documents.
+    """
+
+    def __init__(self, file=None):
+        """
+        :param file: JSON file of the timings or None
+        """
+        self.file = file
+        # class -> strategy -> [number of runs, seconds, number of decisive results]
+        self.timings = {}
+        if file and os.path.isfile(file):
+            with open(file, 'r') as f:
+                self.timings = json.load(f)
+        self.loaded = copy.deepcopy(self.timings)
+
+    def record(self, features, strategy, seconds, decisive):
+        runs = self.timings.setdefault(feature_class(features), {}).setdefault(strategy, [0, 0.0, 0])
+        runs[0] += 1
+        runs[1] += seconds
+        runs[2] += 1 if decisive else 0
+
+    def expected(self, strategy, features):
+        """
+        :return: tuple of the expected seconds and the probability that the result of the strategy is decisive
+        """
+        runs = self.loaded.get(feature_class(features), {}).get(strategy)
+        if runs is None or runs[0] < MIN_RUNS:
+            return prior(strategy, features)
+        # Laplace smoothing, so that no strategy becomes impossible:
+        return runs[1] / runs[0], (runs[2] + 1) / (runs[0] + 2)
+
+    def route(self, features, comparator):
+        """
+        Orders the applicable strategies by their expected seconds per decisive result (cheapest first).
+
+        :return: list of strategies
+        """
+        strategies = [strategy for strategy in STRATEGIES if is_applicable(strategy, features, comparator)]
+
+        def cost_per_decision(strategy):
+            seconds, probability = self.expected(strategy, features)
+            return seconds / probability
+
+        return sorted(strategies, key=cost_per_decision)
+
+    def estimate(self, features, comparator):
+        """
+        :return: expected seconds of the check (the next strategy is only used if the previous ones were not decisive)
+        """
+        seconds = 0
+        reached = 1
+        for strategy in self.route(features, comparator):
+            strategy_seconds, probability = self.expected(strategy, features)
+            seconds += reached * strategy_seconds
+            reached *= 1 - probability
+        return seconds
+
+    def save(self):
+        """
+        Writes the timings to their file (if there is one).
+        """
+        if not self.file:
+            return
+        with open(self.file, 'w') as f:
+            json.dump(self.timings, f, indent=1)
+
+
+# Registry of the timings (one per file, shared by all documents of the process):
+timings = {}
+
+
+def get_timings(file=None):
+    """
+    :param file: JSON file of the timings or None
+    :return: Timings
+    """
+    if file not in timings:
+        timings[file] = Timings(file)
+    return timings[file]
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__      = "Felix Petersen"
+__status__      = "Production"
+
+
+import os
+import json
+from collections import OrderedDict
+
+import sympy
+
+
+# Nodes whose evaluation (`doit`) is memoized:
+HEAVY_NODES = (sympy.Integral, sympy.Sum, sympy.Product, sympy.Limit, sympy.Derivative)
+# Maximal number of entries (the least recently used entries are dropped):
+MAX_SIZE = 1024
+
+
+class DoitCache:
+    """
+    Bounded cache (LRU) of the evaluated forms of integrals, sums, products, limits and derivatives, keyed by their
+    `srepr`.
+
+    If a file is given, the cache is loaded from it and can be saved to it (JSON of `srepr` -> `srepr`), so that the
+    evaluations are shared between the runs.
+    """
+
+    # For statistics purposes:
+    statistics = {'hits': 0, 'misses': 0}
+
+    def __init__(self, file=None, max_size=MAX_SIZE):
+        """
+        :param file: JSON file of the persistent cache or None
+        :param max_size: maximal number of entries
+        """
+        self.file = file
+        self.max_size = max_size
+        # srepr -> evaluated SymPy expression (resp. its srepr if it has been loaded and not been used yet)
+        self.entries = OrderedDict()
+        if file and os.path.isfile(file):
+            with open(file, 'r') as f:
+                for key, value in json.load(f).items():
+                    self.entries[key] = value
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def evaluate(self, node):
+        """
+        :param node: heavy node (its arguments have already been evaluated)
+        :return: `node.doit()` (from the cache if possible)
+        """
+        key = sympy.srepr(node)
+        if key in self.entries:
+            DoitCache.statistics['hits'] += 1
+            self.entries.move_to_end(key)
+            value = self.entries[key]
+            if isinstance(value, str):
+                value = sympy.sympify(value)
+                self.entries[key] = value
+            return value
+        DoitCache.statistics['misses'] += 1
+        value = node.doit()
+        self.entries[key] = value
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        return value
+
+    def apply(self, expr):
+        """
+        Evaluates the heavy nodes of an expression bottom-up (inner ones first).
+
+        :param expr: SymPy expression
+        :return: the expression with the heavy nodes replaced by their evaluated forms
+        """
+        if not isinstance(expr, sympy.Basic) or not expr.has(*HEAVY_NODES):
+            return expr
+        args = [self.apply(arg) for arg in expr.args]
+        if args != list(expr.args):
+            expr = expr.func(*args)
+        if isinstance(expr, HEAVY_NODES):
+            expr = self.evaluate(expr)
+        return expr
+
+    def save(self):
+        """
+        Writes the cache to its file (if there is one).
+        """
+        if not self.file:
+            return
+        entries = {}
+        for key, value in self.entries.items():
+            entries[key] = value if isinstance(value, str) else sympy.srepr(value)
+        with open(self.file, 'w') as f:
+            json.dump(entries, f)
+
+
+# Registry of the caches (one per file, so that it is shared by all documents of the process):
+caches = {}
+
+
+def get_doit_cache(file=None):
+    """
+    :param file: JSON file of the persistent cache or None
+    :return: DoitCache
+    """
+    if file not in caches:
+        caches[file] = DoitCache(file)
+    return caches[file]
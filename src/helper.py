@@ -151,7 +151,14 @@ def list_to_or_regex(list):
     return regex[:-1]
 
 
-def get_as_long_as_correct_parentheses_from_left(input):
+delimiters_only_one_direction = ['=', '\\equiv', '\\neq', '\\geq', '\\leq', '<', '>']
+delimiters_both_directions = []
+for delimiter in delimiters_only_one_direction:
+    delimiters_both_directions.append(delimiter)
+    delimiters_both_directions.append(delimiter[::-1])
+
+
+def get_as_long_as_correct_parentheses_from_left(input, begin=0):
     """
     Takes a LaTeX math expression returns as much as possible while ensuring correct parentheses.
     Further it ensures that if there is currently no bracket it will be stopped by any maths comparator.
@@ -171,6 +178,7 @@ def get_as_long_as_correct_parentheses_from_left(input):
     ' \\\sum_{i=1}^9 (i^2) = 285 ) '
     
     :param input: LaTeX math expression
+    :param begin: position in `input` where the expression begins (avoids copying long prefixes)
     :return: correct subexpression of input
     """
 
@@ -178,21 +186,15 @@ def get_as_long_as_correct_parentheses_from_left(input):
     opening_to_closing = {'{': '}', '[': ']', '(': ')'}
     closing = '}])'
 
-    delimiters_only_one_direction = ['=', '\\equiv', '\\neq', '\\geq', '\\leq']
-    delimiters = []
-    for delimiter in delimiters_only_one_direction:
-        delimiters.append(delimiter)
-        delimiters.append(delimiter[::-1])
-
-    output = ''
-    pos = 0
-    for char in input:
+    pos = begin
+    while pos < len(input):
+        char = input[pos]
 
         # Stop if there is no paranthese missing and there is a delimiter:
         if len(parentheses_stack) == 0:
-            for delimiter in delimiters:
-                if input[pos:].find(delimiter) == 0:
-                    return output
+            for delimiter in delimiters_both_directions:
+                if input.startswith(delimiter, pos):
+                    return input[begin:pos]
 
         if char in opening_to_closing:
             parentheses_stack.append(opening_to_closing[char])
@@ -200,29 +202,43 @@ def get_as_long_as_correct_parentheses_from_left(input):
             if len(parentheses_stack) != 0 and char == parentheses_stack.pop():
                 pass
             elif len(parentheses_stack) == 0:
-                return output
+                return input[begin:pos]
             else:
                 return ''
-        output += char
         pos += 1
-    return output
+    return input[begin:]
 
 
-def get_as_long_as_correct_parentheses_from_right(input):
+def get_as_long_as_correct_parentheses_from_right(input, end=None):
     """
     The other direction of `get_as_long_as_correct_parentheses_from_left`.
-    Uses `get_as_long_as_correct_parentheses_from_left`.
+    Scans from `end` (default: the end of `input`) to the left.
     """
-    input = input.replace('{', '%temp%').replace('}', '{').replace('%temp%', '}')
-    input = input.replace('[', '%temp%').replace(']', '[').replace('%temp%', ']')
-    input = input.replace('(', '%temp%').replace(')', '(').replace('%temp%', ')')
-    input = input[::-1]
-    input = get_as_long_as_correct_parentheses_from_left(input)
-    input = input.replace('{', '%temp%').replace('}', '{').replace('%temp%', '}')
-    input = input.replace('[', '%temp%').replace(']', '[').replace('%temp%', ']')
-    input = input.replace('(', '%temp%').replace(')', '(').replace('%temp%', ')')
-    return input[::-1]
+    if end is None:
+        end = len(input)
 
+    parentheses_stack = []
+    closing_to_opening = {'}': '{', ']': '[', ')': '('}
+    opening = '{[('
 
+    pos = end
+    while pos > 0:
+        char = input[pos - 1]
 
+        # Stop if there is no paranthese missing and there is a delimiter:
+        if len(parentheses_stack) == 0:
+            for delimiter in delimiters_both_directions:
+                if input.endswith(delimiter, 0, pos):
+                    return input[pos:end]
 
+        if char in closing_to_opening:
+            parentheses_stack.append(closing_to_opening[char])
+        elif char in opening:
+            if len(parentheses_stack) != 0 and char == parentheses_stack.pop():
+                pass
+            elif len(parentheses_stack) == 0:
+                return input[pos:end]
+            else:
+                return ''
+        pos -= 1
+    return input[:end]
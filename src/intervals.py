@@ -0,0 +1,656 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__      = "Felix Petersen"
+__status__      = "Production"
+
+
+import math
+from mpmath import iv
+import mpmath
+import sympy
+
+import src.sampling
+
+try:
+    import numpy
+except ImportError:
+    # The boxes are evaluated one by one using mpmath
+    numpy = None
+
+
+# The symbols are considered within [-BOUND, BOUND] (resp. [0, BOUND] / [-BOUND, 0] if the domain implies the sign):
+BOUND = 10
+# Maximal number of boxes which are evaluated per inequality:
+MAX_BOXES = 4000
+# Maximal number of times a box is bisected:
+MAX_LEVELS = 40
+# Magnitudes of the points outside of the boxes which are tested for counterexamples:
+FAR_MAGNITUDES = [10 ** 2, 10 ** 4, 10 ** 6]
+
+INEQUALITIES = ['\\leq', '\\geq', '<', '>']
+
+# Names of symbols which are considered to be integers (indices) even without an assumption:
+INDEX_NAMES = ['i', 'j', 'k', 'l', 'm', 'n']
+
+# Functions which can be evaluated by the interval arithmetic:
+INTERVAL_FUNCTIONS = {
+    sympy.exp: iv.exp,
+    sympy.log: iv.log,
+    sympy.sin: iv.sin,
+    sympy.cos: iv.cos,
+    sympy.tan: iv.tan,
+}
+NAMESPACE = {
+    'mpf': iv.mpf,
+    'sqrt': iv.sqrt,
+    'exp': iv.exp,
+    'log': iv.log,
+    'sin': iv.sin,
+    'cos': iv.cos,
+    'tan': iv.tan,
+    'pi': iv.pi,
+    'E': iv.e,
+}
+
+
+class Box:
+    """
+    Box of values of the symbols (list of (lower, upper) tuples).
+    """
+
+    def __init__(self, bounds, level=0):
+        self.bounds = bounds
+        self.level = level
+
+    def intervals(self):
+        return [iv.mpf([lower, upper]) for lower, upper in self.bounds]
+
+    def midpoint(self):
+        return [(lower + upper) / 2 for lower, upper in self.bounds]
+
+    def split(self):
+        """
+        :return: the two halves of the box (divided along its widest side)
+        """
+        widths = [upper - lower for lower, upper in self.bounds]
+        i = widths.index(max(widths))
+        lower, upper = self.bounds[i]
+        middle = (lower + upper) / 2
+        return [Box(self.bounds[:i] + [(lower, middle)] + self.bounds[i + 1:], self.level + 1),
+                Box(self.bounds[:i] + [(middle, upper)] + self.bounds[i + 1:], self.level + 1)]
+
+
+class IntervalArray:
+    """
+    Intervals of a batch of boxes (numpy arrays of the lower and upper endpoints).
+
+    The endpoints are rounded outwards if a result is not exact (sums and products by their error-free
+    transformations, the other functions by some units in the last place), so that the result contains all values
+    like `iv.mpf`. An interval outside of the domain of a function has NaN endpoints.
+    """
+
+    def __init__(self, lower, upper):
+        self.lower = lower
+        self.upper = upper
+
+    @staticmethod
+    def wrap(value):
+        return value if isinstance(value, IntervalArray) else constant(value)
+
+    def __neg__(self):
+        return IntervalArray(-self.upper, -self.lower)
+
+    def __pos__(self):
+        return self
+
+    def __add__(self, other):
+        other = IntervalArray.wrap(other)
+        return IntervalArray(add_rounded(self.lower, other.lower)[0], add_rounded(self.upper, other.upper)[1])
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return self + (-IntervalArray.wrap(other))
+
+    def __rsub__(self, other):
+        return IntervalArray.wrap(other) + (-self)
+
+    def __mul__(self, other):
+        other = IntervalArray.wrap(other)
+        products = [mul_rounded(a, b) for a in [self.lower, self.upper] for b in [other.lower, other.upper]]
+        return IntervalArray(numpy.minimum.reduce([lower for lower, _ in products]),
+                             numpy.maximum.reduce([upper for _, upper in products]))
+
+    __rmul__ = __mul__
+
+    def reciprocal(self):
+        invalid = (self.lower <= 0) & (self.upper >= 0)
+        lower = numpy.where(invalid, numpy.nan, 1 / self.upper)
+        upper = numpy.where(invalid, numpy.nan, 1 / self.lower)
+        # The division is correctly rounded, so it is off by at most one unit in the last place:
+        return IntervalArray(numpy.where(is_exact_reciprocal(lower, self.upper), lower, down(lower)),
+                             numpy.where(is_exact_reciprocal(upper, self.lower), upper, up(upper)))
+
+    def __truediv__(self, other):
+        return self * IntervalArray.wrap(other).reciprocal()
+
+    def __rtruediv__(self, other):
+        return IntervalArray.wrap(other) * self.reciprocal()
+
+    def __pow__(self, exponent):
+        if isinstance(exponent, int):
+            if exponent < 0:
+                return (self ** -exponent).reciprocal()
+            if exponent == 0:
+                return constant(1)
+            negative_lower = power_rounded(-numpy.minimum(self.lower, 0), exponent)
+            positive_upper = power_rounded(numpy.maximum(self.upper, 0), exponent)
+            positive_lower = power_rounded(numpy.maximum(self.lower, 0), exponent)
+            negative_upper = power_rounded(-numpy.minimum(self.upper, 0), exponent)
+            if exponent % 2:
+                # Monotonic:
+                return IntervalArray(numpy.where(self.lower >= 0, positive_lower[0], -negative_lower[1]),
+                                     numpy.where(self.upper <= 0, -negative_upper[0], positive_upper[1]))
+            # Even powers have their minimum at 0:
+            lower = numpy.where(self.lower >= 0, positive_lower[0],
+                                numpy.where(self.upper <= 0, negative_upper[0], 0))
+            upper = numpy.maximum(negative_lower[1], positive_upper[1])
+            invalid = numpy.isnan(self.lower) | numpy.isnan(self.upper)
+            return IntervalArray(numpy.where(invalid, numpy.nan, lower), numpy.where(invalid, numpy.nan, upper))
+        return interval_exp(IntervalArray.wrap(exponent) * interval_log(self))
+
+    def __rpow__(self, base):
+        return IntervalArray.wrap(base) ** self
+
+
+def down(values, ulps=1):
+    for _ in range(ulps):
+        values = numpy.nextafter(values, -numpy.inf)
+    return values
+
+
+def up(values, ulps=1):
+    for _ in range(ulps):
+        values = numpy.nextafter(values, numpy.inf)
+    return values
+
+
+def add_rounded(a, b):
+    """
+    :return: tuple of the sum rounded downwards and upwards (by its rounding error, TwoSum)
+    """
+    total = a + b
+    b_part = total - a
+    error = (a - (total - b_part)) + (b - b_part)
+    unknown = numpy.isnan(error) & ~numpy.isnan(total)
+    return (numpy.where((error < 0) | unknown, down(total), total),
+            numpy.where((error > 0) | unknown, up(total), total))
+
+
+def split(a):
+    scaled = 134217729.0 * a
+    high = scaled - (scaled - a)
+    return high, a - high
+
+
+def product_error(a, b, product):
+    """
+    :return: `a * b - product` (exact unless it overflows resp. underflows, TwoProduct)
+    """
+    a_high, a_low = split(a)
+    b_high, b_low = split(b)
+    return ((a_high * b_high - product) + a_high * b_low + a_low * b_high) + a_low * b_low
+
+
+def mul_rounded(a, b):
+    """
+    :return: tuple of the product rounded downwards and upwards
+    """
+    product = a * b
+    error = product_error(a, b, product)
+    # The error is not exact (NaN) for huge factors and not representable for tiny products:
+    unknown = (numpy.isnan(error) | ((numpy.abs(product) < 1e-290) & (a != 0) & (b != 0))) & ~numpy.isnan(product)
+    return (numpy.where((error < 0) | unknown, down(product), product),
+            numpy.where((error > 0) | unknown, up(product), product))
+
+
+def power_rounded(a, exponent):
+    """
+    :param a: array of non-negative values
+    :return: tuple of `a ** exponent` rounded downwards and upwards (by repeated multiplication)
+    """
+    lower, upper = a, a
+    for _ in range(exponent - 1):
+        lower = mul_rounded(lower, a)[0]
+        upper = mul_rounded(upper, a)[1]
+    return lower, upper
+
+
+def is_exact_reciprocal(reciprocal, value):
+    return (reciprocal * value == 1) & (product_error(reciprocal, value, reciprocal * value) == 0)
+
+
+def is_exact_square(root, value):
+    return (root * root == value) & (product_error(root, root, root * root) == 0)
+
+
+def constant(value):
+    """
+    :param value: number (or the arguments of `mpmath.mpf`, which `lambdify` uses for rational and float constants)
+    :return: IntervalArray containing the number
+    """
+    with mpmath.workprec(113):
+        value = mpmath.mpf(value)
+        rounded = float(value)
+        exact = mpmath.mpf(rounded) == value
+    if exact:
+        return IntervalArray(rounded, rounded)
+    return IntervalArray(down(rounded), up(rounded))
+
+
+def contains_period(lower, upper, phase, period):
+    """
+    :return: True for the intervals which (possibly) contain a point `phase + k * period`
+    """
+    tolerance = 1e-9
+    return numpy.floor((upper - phase) / period + tolerance) >= numpy.ceil((lower - phase) / period - tolerance)
+
+
+def interval_exp(x):
+    return IntervalArray(numpy.where(x.lower == 0, 1, numpy.maximum(down(numpy.exp(x.lower), 2), 0)),
+                         numpy.where(x.upper == 0, 1, up(numpy.exp(x.upper), 2)))
+
+
+def interval_log(x):
+    lower = numpy.where(x.lower > 0, numpy.log(numpy.maximum(x.lower, 0)), numpy.nan)
+    upper = numpy.log(numpy.maximum(x.upper, 0))
+    return IntervalArray(numpy.where(x.lower == 1, 0, down(lower, 2)), numpy.where(x.upper == 1, 0, up(upper, 2)))
+
+
+def interval_sqrt(x):
+    lower = numpy.sqrt(numpy.maximum(x.lower, 0))
+    upper = numpy.sqrt(numpy.maximum(x.upper, 0))
+    # The square root is correctly rounded:
+    lower = numpy.where(is_exact_square(lower, x.lower), lower, down(lower))
+    upper = numpy.where(is_exact_square(upper, x.upper), upper, up(upper))
+    return IntervalArray(numpy.where(x.lower >= 0, lower, numpy.nan), numpy.where(x.upper >= 0, upper, numpy.nan))
+
+
+def interval_cos(x):
+    values = [numpy.cos(x.lower), numpy.cos(x.upper)]
+    lower = numpy.where(contains_period(x.lower, x.upper, math.pi, 2 * math.pi), -1,
+                        numpy.maximum(down(numpy.minimum(*values), 2), -1))
+    upper = numpy.where(contains_period(x.lower, x.upper, 0, 2 * math.pi), 1,
+                        numpy.minimum(up(numpy.maximum(*values), 2), 1))
+    invalid = numpy.isnan(x.lower) | numpy.isnan(x.upper)
+    return IntervalArray(numpy.where(invalid, numpy.nan, lower), numpy.where(invalid, numpy.nan, upper))
+
+
+def interval_sin(x):
+    return interval_cos(x - constant(mpmath.pi) * 0.5)
+
+
+def interval_tan(x):
+    # Not defined if the interval contains a pole:
+    invalid = contains_period(x.lower, x.upper, math.pi / 2, math.pi)
+    return IntervalArray(numpy.where(invalid, numpy.nan, numpy.where(x.lower == 0, 0, down(numpy.tan(x.lower), 2))),
+                         numpy.where(invalid, numpy.nan, numpy.where(x.upper == 0, 0, up(numpy.tan(x.upper), 2))))
+
+
+BATCH_NAMESPACE = {
+    'mpf': constant,
+    'sqrt': interval_sqrt,
+    'exp': interval_exp,
+    'log': interval_log,
+    'sin': interval_sin,
+    'cos': interval_cos,
+    'tan': interval_tan,
+    'pi': constant(mpmath.pi),
+    'E': constant(mpmath.e),
+}
+
+
+def compile_batch_function(expr, symbols):
+    """
+    :return: function(lower, upper) returning the lower and upper endpoints of the values of `expr` on a batch of
+             boxes (arrays of the shape (boxes, symbols)) or None if numpy is not available
+    """
+    if numpy is None:
+        return None
+    function = sympy.lambdify(symbols, expr, modules=[BATCH_NAMESPACE, 'mpmath'], dummify=True)
+
+    def evaluate(lower, upper):
+        with numpy.errstate(all='ignore'):
+            value = IntervalArray.wrap(function(*[IntervalArray(lower[:, j], upper[:, j])
+                                                  for j in range(len(symbols))]))
+        return (numpy.broadcast_to(value.lower, (lower.shape[0],)),
+                numpy.broadcast_to(value.upper, (lower.shape[0],)))
+
+    return evaluate
+
+
+def compile_point_function(expr, symbols):
+    """
+    :return: function(points) returning the (floating point) values of `expr` at a batch of points (array of the shape
+             (points, symbols))
+    """
+    function = sympy.lambdify(symbols, expr, 'numpy', dummify=True)
+
+    def evaluate(points):
+        with numpy.errstate(all='ignore'):
+            value = function(*[points[:, j] for j in range(len(symbols))])
+        return numpy.broadcast_to(numpy.asarray(value, dtype=float), (points.shape[0],))
+
+    return evaluate
+
+
+def may_be_invalid(values, comparator):
+    """
+    :param values: floating point values of `left - right`
+    :return: array of the values at which the comparator is not valid (or is close to its boundary)
+    """
+    tolerance = 1e-9 * (1 + numpy.abs(values))
+    if comparator in ['\\leq', '<']:
+        return values > -tolerance
+    return values < tolerance
+
+
+def classify_batch(lower, upper, comparator):
+    """
+    Like `classify` for a batch of intervals (NaN endpoints are neither valid nor invalid).
+
+    :return: tuple of the arrays of the intervals on which the comparator is valid resp. not valid for all values
+    """
+    if comparator == '\\leq':
+        return upper <= 0, lower > 0
+    if comparator == '\\geq':
+        return lower >= 0, upper < 0
+    if comparator == '<':
+        return upper < 0, lower >= 0
+    return lower > 0, upper <= 0
+
+
+def is_supported(expr):
+    """
+    :return: True if the expression only consists of numbers, symbols, sums, products, powers and the functions of
+             `INTERVAL_FUNCTIONS`
+    """
+    for node in sympy.preorder_traversal(expr):
+        if isinstance(node, (sympy.Symbol, sympy.Number, sympy.Add, sympy.Mul, sympy.Pow)):
+            continue
+        if node in [sympy.pi, sympy.E]:
+            continue
+        if isinstance(node, tuple(INTERVAL_FUNCTIONS)):
+            continue
+        return False
+    return True
+
+
+def compile_interval_function(expr, symbols):
+    """
+    :return: function(*intervals) returning the interval of the values of `expr` (rational constants are converted to
+             intervals, too, so that the result is rigorous)
+    """
+    return sympy.lambdify(symbols, expr, modules=[NAMESPACE, 'mpmath'], dummify=True)
+
+
+def classify(value, comparator):
+    """
+    :param value: interval of `left - right`
+    :return: True if the comparator is valid for all values, False if it is not valid for any value, else None
+    """
+    lower, upper = value.a, value.b
+    if mpmath.isnan(lower) or mpmath.isnan(upper):
+        return None
+    if comparator == '\\leq':
+        return True if upper <= 0 else (False if lower > 0 else None)
+    if comparator == '\\geq':
+        return True if lower >= 0 else (False if upper < 0 else None)
+    if comparator == '<':
+        return True if upper < 0 else (False if lower >= 0 else None)
+    return True if lower > 0 else (False if upper <= 0 else None)
+
+
+def evaluate(function, intervals):
+    """
+    :return: interval of the values or None if the box is (partially) outside of the domain
+    """
+    try:
+        value = function(*intervals)
+    except (ArithmeticError, ValueError, TypeError):
+        return None
+    if not isinstance(value, type(iv.mpf(0))):
+        value = iv.mpf(value)
+    return value
+
+
+def far_points(symbols, signs):
+    """
+    :return: list of points outside of the boxes (all symbols have the same magnitude from `FAR_MAGNITUDES`)
+    """
+    points = []
+    for magnitude in FAR_MAGNITUDES:
+        for sign in [1, -1]:
+            point = [magnitude * signs.get(symbol, sign) for symbol in symbols]
+            if point not in points:
+                points.append(point)
+    return points
+
+
+def outer_boxes(bounds):
+    """
+    :param bounds: bounds of the box around the origin (like in `check_inequality`)
+    :return: list of tuples of the index of a symbol, the direction (1 or -1) and the unbounded box in which this symbol
+             is beyond its bound in this direction (the others take any value of their sign); together they cover the
+             rest of the domain
+    """
+    domain = [(0 if lower == 0 else -mpmath.inf, 0 if upper == 0 else mpmath.inf) for lower, upper in bounds]
+    boxes = []
+    for i, (lower, upper) in enumerate(bounds):
+        if lower != 0:
+            boxes.append((i, -1, Box(domain[:i] + [(-mpmath.inf, lower)] + domain[i + 1:])))
+        if upper != 0:
+            boxes.append((i, 1, Box(domain[:i] + [(upper, mpmath.inf)] + domain[i + 1:])))
+    return boxes
+
+
+def is_valid_beyond(function, derivative, box, i, direction, comparator):
+    """
+    Checks an inequality on an unbounded box in which the symbol `i` goes to infinity in the given direction.
+
+    It is valid if it is valid for all values of the box or if it is valid at the bounded face of the box and the
+    difference of the sides is monotonic (by its derivative) away from the boundary of the inequality.
+
+    :param function: interval function of `left - right`
+    :param derivative: function returning the interval function of the derivative by the symbol `i` (or None)
+    :return: True if the inequality is proven on the box
+    """
+    value = evaluate(function, box.intervals())
+    if value is not None and classify(value, comparator):
+        return True
+    derivative = derivative(i)
+    if derivative is None:
+        return False
+    bound = box.bounds[i][0] if direction == 1 else box.bounds[i][1]
+    face = Box(box.bounds[:i] + [(bound, bound)] + box.bounds[i + 1:])
+    value = evaluate(function, face.intervals())
+    slope = evaluate(derivative, box.intervals())
+    if value is None or slope is None or not classify(value, comparator):
+        return False
+    # The difference has to decrease (`<`, `\\leq`) resp. increase (`>`, `\\geq`) in the direction:
+    return bool(classify(slope * direction, '\\leq' if comparator in ['<', '\\leq'] else '\\geq'))
+
+
+def is_counterexample(function, point, comparator):
+    """
+    :param point: list of the values of the symbols
+    :return: True if the inequality is not valid at the point
+    """
+    value = evaluate(function, [iv.mpf(x) for x in point])
+    return value is not None and classify(value, comparator) is False
+
+
+def is_index(symbol):
+    """
+    :return: True if the symbol is (probably) an integer, like the `n` of `n^2 \\geq n`
+    """
+    return bool(symbol.is_integer) or str(symbol) in INDEX_NAMES
+
+
+def at_integers(function, symbols, point, comparator):
+    """
+    A counterexample at which an index has a non-integer value does not disprove the inequality for integers, so the
+    indices are rounded.
+
+    :param point: list of the values of the symbols at which the inequality is not valid
+    :return: tuple of 'False' and the counterexample (dict of symbol -> value) or (None, None)
+    """
+    point = [round(value) if is_index(symbol) else value for symbol, value in zip(symbols, point)]
+    if is_counterexample(function, point, comparator):
+        return 'False', dict(zip(symbols, point))
+    return None, None
+
+
+def check_boxes(function, bounds, comparator):
+    """
+    Checks an inequality on the box `bounds` by bisection; the boxes of each level are evaluated one by one.
+
+    :param function: interval function of `left - right`
+    :param bounds: list of the (lower, upper) bounds of the symbols
+    :return: tuple of 'True' (valid on the whole box), 'False' or None (undecided) and the counterexample (list of the
+             values of the symbols) or None
+    """
+    boxes = [Box(bounds)]
+    n_boxes = 0
+    while boxes:
+        n_boxes += len(boxes)
+        if n_boxes > MAX_BOXES:
+            return None, None
+        next_boxes = []
+        for box in boxes:
+            value = evaluate(function, box.intervals())
+            valid = classify(value, comparator) if value is not None else None
+            if valid:
+                continue
+            midpoint = box.midpoint()
+            if valid is False or is_counterexample(function, midpoint, comparator):
+                return 'False', midpoint
+            if box.level >= MAX_LEVELS:
+                return None, None
+            next_boxes += box.split()
+        boxes = next_boxes
+    return 'True', None
+
+
+def check_boxes_batch(batch_function, point_function, function, bounds, comparator):
+    """
+    Like `check_boxes`, but all boxes of a level are evaluated at once (`compile_batch_function`, and the midpoints by
+    `compile_point_function`). The counterexamples are confirmed by `function` (mpmath).
+    """
+    lower = numpy.array([[bound[0] for bound in bounds]], dtype=float)
+    upper = numpy.array([[bound[1] for bound in bounds]], dtype=float)
+    n_boxes = 0
+    level = 0
+    while len(lower):
+        n_boxes += len(lower)
+        if n_boxes > MAX_BOXES:
+            return None, None
+        valid, invalid = classify_batch(*batch_function(lower, upper), comparator)
+        midpoints = (lower + upper) / 2
+        invalid |= may_be_invalid(point_function(midpoints), comparator)
+        for i in numpy.flatnonzero(invalid):
+            midpoint = midpoints[i].tolist()
+            if is_counterexample(function, midpoint, comparator):
+                return 'False', midpoint
+        undecided = ~valid
+        if not undecided.any():
+            break
+        if level >= MAX_LEVELS:
+            return None, None
+        lower, upper = split_batch(lower[undecided], upper[undecided])
+        level += 1
+    return 'True', None
+
+
+def split_batch(lower, upper):
+    """
+    Like `Box.split` for a batch of boxes (the halves of a box follow each other).
+    """
+    rows = numpy.arange(lower.shape[0])
+    widest = numpy.argmax(upper - lower, axis=1)
+    middle = (lower[rows, widest] + upper[rows, widest]) / 2
+    lower_halves = upper.copy()
+    lower_halves[rows, widest] = middle
+    upper_halves = lower.copy()
+    upper_halves[rows, widest] = middle
+    return (numpy.stack([lower, upper_halves], axis=1).reshape(-1, lower.shape[1]),
+            numpy.stack([lower_halves, upper], axis=1).reshape(-1, lower.shape[1]))
+
+
+def check_inequality(left, right, comparator):
+    """
+    Checks an inequality (`\\leq`, `\\geq`, `<`, `>`) using interval arithmetic.
+
+    The difference of the sides is evaluated on boxes of the symbols, beginning with the box [-BOUND, BOUND]^n. Boxes
+    on which the inequality is valid for all values are proven, boxes on which it is not valid for any value (or whose
+    midpoint violates it) are counterexamples; all other boxes are bisected. The boxes are processed level by level.
+
+    The inequality is only considered proven if all boxes are proven and it is valid on the unbounded boxes outside of
+    them, too (`outer_boxes`, `is_valid_beyond`); else it is undecided. A counterexample (also at some far points outside
+    of the boxes, `far_points`) disproves it.
+
+    :param left: left side (SymPy expression)
+    :param right: right side (SymPy expression)
+    :param comparator: Comparator
+    :return: tuple of 'True', 'False' or None (if it could not be decided) and the counterexample (dict of
+             symbol -> value) or None
+    """
+    comparator = str(comparator)
+    if comparator not in INEQUALITIES:
+        return None, None
+    expr = left - right
+    if not is_supported(expr):
+        return None, None
+    symbols = sorted(expr.free_symbols, key=str)
+    try:
+        function = compile_interval_function(expr, symbols)
+    except Exception:
+        return None, None
+
+    signs = src.sampling.symbol_signs(symbols, src.sampling.domain_constraints(expr))
+    bounds = []
+    for symbol in symbols:
+        sign = signs.get(symbol)
+        bounds.append((0, BOUND) if sign == 1 else ((-BOUND, 0) if sign == -1 else (-BOUND, BOUND)))
+
+    try:
+        batch_function = compile_batch_function(expr, symbols)
+        if batch_function is not None:
+            point_function = compile_point_function(expr, symbols)
+            res, counterexample = check_boxes_batch(batch_function, point_function, function, bounds, comparator)
+        else:
+            res, counterexample = check_boxes(function, bounds, comparator)
+    except Exception:
+        # e.g. an operation which is not supported by `IntervalArray`
+        res, counterexample = check_boxes(function, bounds, comparator)
+    if res == 'False':
+        return at_integers(function, symbols, counterexample, comparator)
+    if res is None:
+        return None, None
+
+    # The boxes are bounded, so the rest of the domain has to be checked, too:
+    for point in far_points(symbols, signs):
+        if is_counterexample(function, point, comparator):
+            return 'False', dict(zip(symbols, point))
+
+    def derivative(i):
+        try:
+            return compile_interval_function(sympy.diff(expr, symbols[i]), symbols)
+        except Exception:
+            return None
+
+    for i, direction, box in outer_boxes(bounds):
+        if not is_valid_beyond(function, derivative, box, i, direction, comparator):
+            return None, None
+    return 'True', None
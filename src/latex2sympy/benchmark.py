@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Parser microbenchmark on the corpus of test.py (`GOOD_PAIRS`) plus generated long / nested inputs.
+
+Times lexing, parsing and the `convert_*` conversion of the ANTLR path separately, as well as `process_sympy`
+(incl. the fast path), and measures the allocations per input. The results are written to a JSON file, so that
+two runs can be compared (`--compare`). No CAS time (simplification etc.) is included.
+
+Usage (from the repository root):
+`python -m src.latex2sympy.benchmark -o bench.json`
+`python -m src.latex2sympy.benchmark -o bench_new.json --compare bench.json`
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tracemalloc
+
+import antlr4
+import sympy
+
+from src.latex2sympy.gen.PSParser import PSParser
+from src.latex2sympy.gen.PSLexer import PSLexer
+from src.latex2sympy.process_latex import process_sympy, convert_relation, MathErrorListener
+from src.latex2sympy.fast_parser import parse_simple
+
+# test.py imports `process_latex` relative to its directory:
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from test import GOOD_PAIRS
+
+STAGES = ['lex', 'parse', 'convert', 'antlr_total', 'process_sympy']
+
+
+def generated_inputs():
+    """
+    Long and nested inputs which are not part of the test corpus.
+
+    :return: list of LaTeX strings
+    """
+    inputs = []
+    for n in [10, 50, 200]:
+        inputs.append(' + '.join('x_{' + str(i) + '}' for i in range(n)))
+        inputs.append(' '.join('(x - ' + str(i) + ')' for i in range(n)))
+    for depth in [5, 20, 50]:
+        inputs.append('(' * depth + 'x' + ' + 1)' * depth)
+        inputs.append('\\frac{1}{' * depth + 'x' + '}' * depth)
+        inputs.append('\\sin(' * depth + 'x' + ')' * depth)
+    inputs.append(' + '.join(str(i) + 'x^{' + str(i) + '}' for i in range(30)) + ' = 0')
+    inputs.append('\\int_0^1 ' + ' + '.join('\\frac{x^' + str(i) + '}{' + str(i + 1) + '}' for i in range(20)) + ' dx')
+    return inputs
+
+
+def time_stages(latex):
+    """
+    Times the stages of the ANTLR path for one input.
+
+    :param latex: LaTeX string
+    :return: dict of stage -> seconds
+    """
+    matherror = MathErrorListener(latex)
+
+    start = time.perf_counter()
+    lex = PSLexer(antlr4.InputStream(latex))
+    lex.removeErrorListeners()
+    lex.addErrorListener(matherror)
+    tokens = antlr4.CommonTokenStream(lex)
+    tokens.fill()
+    lexed = time.perf_counter()
+
+    parser = PSParser(tokens)
+    parser.removeErrorListeners()
+    parser.addErrorListener(matherror)
+    relation = parser.math().relation()
+    parsed = time.perf_counter()
+
+    convert_relation(relation)
+    converted = time.perf_counter()
+
+    process_sympy(latex)
+    processed = time.perf_counter()
+
+    return {'lex': lexed - start, 'parse': parsed - lexed, 'convert': converted - parsed,
+            'antlr_total': converted - start, 'process_sympy': processed - converted}
+
+
+def percentiles(values):
+    values = sorted(values)
+    def percentile(p):
+        return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+    return {'p50': percentile(50), 'p90': percentile(90), 'p99': percentile(99), 'mean': sum(values) / len(values)}
+
+
+def benchmark_input(latex, repeat):
+    """
+    Benchmarks one input.
+
+    :param latex: LaTeX string
+    :param repeat: number of timed repetitions
+    :return: dict with the latency percentiles per stage and the allocations
+    """
+    result = {'latex': latex, 'fast_path': parse_simple(latex) is not None}
+    try:
+        time_stages(latex)  # warm-up
+    except Exception as e:
+        result['error'] = str(e).split('\n')[0]
+        return result
+
+    timings = {stage: [] for stage in STAGES}
+    for _ in range(repeat):
+        for stage, seconds in time_stages(latex).items():
+            timings[stage].append(seconds)
+    for stage in STAGES:
+        result[stage] = percentiles(timings[stage])
+
+    tracemalloc.start()
+    snapshot_before = tracemalloc.take_snapshot()
+    process_sympy(latex)
+    snapshot_after = tracemalloc.take_snapshot()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stats = snapshot_after.compare_to(snapshot_before, 'filename')
+    result['alloc_peak_bytes'] = peak
+    result['alloc_blocks'] = sum(stat.count_diff for stat in stats if stat.count_diff > 0)
+
+    return result
+
+
+def summarize(results):
+    summary = {}
+    ok = [result for result in results if 'error' not in result]
+    for stage in STAGES:
+        summary[stage] = percentiles([result[stage]['p50'] for result in ok])
+        summary[stage]['sum_of_p50'] = sum(result[stage]['p50'] for result in ok)
+    summary['alloc_peak_bytes'] = percentiles([result['alloc_peak_bytes'] for result in ok])
+    summary['n_inputs'] = len(results)
+    summary['n_errors'] = len(results) - len(ok)
+    summary['n_fast_path'] = len([result for result in results if result['fast_path']])
+    return summary
+
+
+def compare(summary, old_summary):
+    print('stage            sum of p50 (old -> new)')
+    for stage in STAGES:
+        old = old_summary[stage]['sum_of_p50']
+        new = summary[stage]['sum_of_p50']
+        print('%-16s %10.6fs -> %10.6fs  (x%.2f)' % (stage, old, new, old / new if new else float('inf')))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Microbenchmark of the LaTeX parser (separate from the CAS time).')
+    parser.add_argument('-o', '--output', help='JSON file for the results', type=str, default='parser_benchmark.json')
+    parser.add_argument('-n', '--repeat', help='number of repetitions per input', type=int, default=20)
+    parser.add_argument('-c', '--compare', help='JSON file of a previous run to compare with', type=str)
+    parser.add_argument('--no_generated', help='only use the corpus of test.py', action="store_true", default=False)
+    args = parser.parse_args()
+
+    inputs = [latex for latex, _ in GOOD_PAIRS]
+    if not args.no_generated:
+        inputs += generated_inputs()
+
+    results = []
+    for latex in inputs:
+        results.append(benchmark_input(latex, args.repeat))
+
+    summary = summarize(results)
+    output = {
+        'python': platform.python_version(),
+        'sympy': sympy.__version__,
+        'repeat': args.repeat,
+        'summary': summary,
+        'inputs': results
+    }
+    with open(args.output, 'w') as file:
+        json.dump(output, file, indent=2)
+
+    for stage in STAGES:
+        print('%-16s p50 %.6fs  p90 %.6fs  p99 %.6fs' % (stage, summary[stage]['p50'], summary[stage]['p90'],
+                                                          summary[stage]['p99']))
+    print(str(summary['n_fast_path']) + ' of ' + str(summary['n_inputs']) + ' inputs use the fast path, '
+          + str(summary['n_errors']) + ' could not be parsed.')
+    print('Results written to ' + args.output)
+
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            compare(summary, json.load(file)['summary'])
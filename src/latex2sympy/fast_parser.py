@@ -0,0 +1,312 @@
+import re
+import sympy
+
+# Fast path for short arithmetic / polynomial expressions.
+#
+# `parse_simple` builds exactly the same SymPy trees as `convert_relation` in process_latex.py, but without ANTLR.
+# It is a non-recursive precedence parser: every group (`(...)`, `[...]`, `{...}`, the arguments of `\frac` and
+# exponents in braces) is an explicit frame on a stack. Anything outside of the supported subset (functions,
+# `\int`, `\sum`, `\lim`, `\sqrt`, derivatives, `|...|`, `!`, ...) makes it return None, so that the caller can
+# fall back to the ANTLR parser, which also reports the syntax errors.
+
+token_regex = re.compile(r'[ \t\r\n]*(?:'
+                         r'(?P<number>[0-9]+(?:\.[0-9]+)?)'
+                         r'|(?P<command>\\[a-zA-Z]+)'
+                         r'|(?P<letter>[a-zA-Z])'
+                         r'|(?P<char>[-+*/:()\[\]{}^_=<>]))')
+differential_regex = re.compile(r'd[ \t\r\n]*\\?[a-zA-Z]')
+
+COMMAND_TOKENS = {'\\times': '*', '\\cdot': '*', '\\div': '/', '\\frac': 'frac', '\\leq': '<=', '\\geq': '>='}
+
+# Commands with a meaning in PS.g4 which are not supported by the fast path:
+UNSUPPORTED_COMMANDS = {
+    '\\lim', '\\to', '\\rightarrow', '\\Rightarrow', '\\longrightarrow', '\\Longrightarrow',
+    '\\int', '\\sum', '\\prod', '\\log', '\\ln', '\\sin', '\\cos', '\\tan', '\\csc', '\\sec', '\\cot',
+    '\\arcsin', '\\arccos', '\\arctan', '\\arccsc', '\\arcsec', '\\arccot',
+    '\\sinh', '\\cosh', '\\tanh', '\\arsinh', '\\arcosh', '\\artanh',
+    '\\sqrt', '\\mathit', '\\partial'
+}
+
+CLOSING = {'(': ')', '[': ']', '{': '}'}
+
+RELATIONS = {
+    '=': sympy.Eq,
+    '<': sympy.StrictLessThan,
+    '<=': sympy.LessThan,
+    '>': sympy.StrictGreaterThan,
+    '>=': sympy.GreaterThan
+}
+
+
+class Unsupported(Exception):
+    pass
+
+
+def tokenize(latex):
+    """
+    Splits the LaTeX expression into tokens of the supported subset.
+
+    :param latex: LaTeX math expression
+    :return: list of `(kind, text)` tuples
+    """
+    tokens = []
+    pos = 0
+    end = len(latex.rstrip(' \t\r\n'))
+    while pos < end:
+        match = token_regex.match(latex, pos)
+        if not match:
+            raise Unsupported()
+        pos = match.end()
+        if match.group('number'):
+            tokens.append(('number', match.group('number')))
+        elif match.group('command'):
+            command = match.group('command')
+            if command in COMMAND_TOKENS:
+                tokens.append((COMMAND_TOKENS[command], command))
+            elif command in UNSUPPORTED_COMMANDS:
+                raise Unsupported()
+            else:
+                tokens.append(('symbol', command))
+        elif match.group('letter'):
+            if differential_regex.match(latex, match.start('letter')):
+                raise Unsupported()
+            tokens.append(('letter', match.group('letter')))
+        else:
+            char = match.group('char')
+            tokens.append((char, char))
+    return tokens
+
+
+class Frame:
+    """
+    State of one `expr` which is parsed (the whole input or a group).
+    """
+
+    def __init__(self, kind, closing, value=None):
+        self.kind = kind
+        self.closing = closing
+        # The upper part of a `\frac` resp. the base of an exponent:
+        self.value = value
+        self.relation = None
+        self.relation_left = None
+        self.add_acc = None
+        self.add_op = None
+        self.mp_acc = None
+        self.mp_op = None
+        self.signs = []
+        self.postfixes = []
+        self.current = None
+        self.expect_operand = True
+
+    def push_comp(self, comp):
+        if self.current is not None:
+            self.postfixes.append(self.current)
+        self.current = comp
+        self.expect_operand = False
+
+    def reduce_unary(self):
+        if self.expect_operand:
+            raise Unsupported()
+        self.postfixes.append(self.current)
+        self.current = None
+        value = convert_postfixes(self.postfixes)
+        for sign in reversed(self.signs):
+            if sign == '-':
+                value = sympy.Mul(-1, value, evaluate=False)
+        self.postfixes = []
+        self.signs = []
+        if self.mp_op == '*':
+            value = sympy.Mul(self.mp_acc, value, evaluate=False)
+        elif self.mp_op == '/':
+            value = sympy.Mul(self.mp_acc, sympy.Pow(value, -1, evaluate=False), evaluate=False)
+        self.mp_acc = value
+        self.mp_op = None
+
+    def reduce_mp(self):
+        self.reduce_unary()
+        value = self.mp_acc
+        if self.add_op == '+':
+            value = sympy.Add(self.add_acc, value, evaluate=False)
+        elif self.add_op == '-':
+            value = sympy.Add(self.add_acc, -1 * value, evaluate=False)
+        self.add_acc = value
+        self.add_op = None
+        self.mp_acc = None
+
+    def reduce(self):
+        self.reduce_mp()
+        if self.relation:
+            return RELATIONS[self.relation](self.relation_left, self.add_acc)
+        return self.add_acc
+
+
+def convert_postfixes(postfixes):
+    """
+    Implicit multiplication like `convert_postfix_list` (including its special case of `x` as multiplication sign).
+    """
+    res = postfixes[-1]
+    for i in range(len(postfixes) - 2, -1, -1):
+        if i > 0 and str(postfixes[i]) == 'x' and \
+                len(postfixes[i - 1].atoms(sympy.Symbol)) == 0 and len(postfixes[i + 1].atoms(sympy.Symbol)) == 0:
+            continue
+        res = sympy.Mul(postfixes[i], res, evaluate=False)
+    return res
+
+
+def parse_simple(latex, make_symbol=sympy.Symbol):
+    """
+    Parses simple arithmetic / polynomial LaTeX like `2x^2 + 3`, `\\frac{a}{b}` or `(x+1)(x-1)`.
+
+    >>> parse_simple("2x^2 + 3")
+    2*x**2 + 3
+    >>> parse_simple("\\\\sin x") is None
+    True
+
+    :param latex: LaTeX math expression
+    :param make_symbol: function creating the symbols (e.g. for interning)
+    :return: SymPy expression or None if `latex` is not within the supported subset
+    """
+    try:
+        tokens = tokenize(latex)
+        n_tokens = len(tokens)
+        stack = [Frame('top', None)]
+        pos = 0
+        while pos < n_tokens:
+            frame = stack[-1]
+            kind, text = tokens[pos]
+            pos += 1
+
+            if kind in ('number', 'letter', 'symbol'):
+                atom, pos = make_atom(tokens, pos - 1, make_symbol)
+                if kind != 'number' and pos < n_tokens and tokens[pos][0] == '(':
+                    # Function call like `f(x)`
+                    raise Unsupported()
+                frame.push_comp(atom)
+            elif kind in CLOSING:
+                if not frame.expect_operand and frame.current is not None:
+                    frame.postfixes.append(frame.current)
+                    frame.current = None
+                stack.append(Frame('group', CLOSING[kind]))
+            elif kind == 'frac':
+                if pos >= n_tokens or tokens[pos][0] != '{':
+                    raise Unsupported()
+                if frame.current is not None:
+                    frame.postfixes.append(frame.current)
+                    frame.current = None
+                stack.append(Frame('frac_upper', '}'))
+                pos += 1
+            elif kind == '^':
+                if frame.current is None or pos >= n_tokens:
+                    raise Unsupported()
+                if tokens[pos][0] == '{':
+                    stack.append(Frame('exp', '}', frame.current))
+                    frame.current = None
+                    pos += 1
+                    continue
+                if tokens[pos][0] not in ('number', 'letter', 'symbol'):
+                    raise Unsupported()
+                if pos + 1 < n_tokens and tokens[pos + 1][0] == '_':
+                    raise Unsupported()
+                exponent, pos = make_atom(tokens, pos, make_symbol)
+                if pos < n_tokens and tokens[pos][0] in ('_', '('):
+                    raise Unsupported()
+                frame.current = sympy.Pow(frame.current, exponent, evaluate=False)
+            elif kind in ('+', '-') and frame.expect_operand:
+                frame.signs.append(kind)
+            elif kind in ('+', '-'):
+                frame.reduce_mp()
+                frame.add_op = kind
+                frame.expect_operand = True
+            elif kind in ('*', '/', ':'):
+                frame.reduce_unary()
+                frame.mp_op = '/' if kind == ':' else kind
+                frame.expect_operand = True
+            elif kind in RELATIONS:
+                if frame.kind != 'top' or frame.relation:
+                    raise Unsupported()
+                frame.relation_left = frame.reduce()
+                frame.relation = kind
+                frame.add_acc = None
+                frame.expect_operand = True
+            elif kind == frame.closing:
+                value = frame.reduce()
+                stack.pop()
+                parent = stack[-1]
+                if frame.kind == 'group':
+                    parent.push_comp(value)
+                elif frame.kind == 'frac_upper':
+                    if pos >= n_tokens or tokens[pos][0] != '{':
+                        raise Unsupported()
+                    stack.append(Frame('frac_lower', '}', value))
+                    pos += 1
+                    continue
+                elif frame.kind == 'frac_lower':
+                    parent.push_comp(sympy.Mul(frame.value, sympy.Pow(value, -1, evaluate=False), evaluate=False))
+                elif frame.kind == 'exp':
+                    parent.current = sympy.Pow(frame.value, value, evaluate=False)
+                if pos < n_tokens and tokens[pos][0] == '_':
+                    raise Unsupported()
+            else:
+                raise Unsupported()
+
+        if len(stack) != 1:
+            raise Unsupported()
+        return stack[0].reduce()
+    except Unsupported:
+        return None
+
+
+def make_atom(tokens, pos, make_symbol):
+    """
+    Converts the atom at `pos` like `convert_atom` (subscripts only with a single number, letter or symbol).
+
+    :return: tuple of the atom and the position after it
+    """
+    kind, text = tokens[pos]
+    pos += 1
+    if kind == 'number':
+        return make_number(text), pos
+
+    name = text if kind == 'letter' else text[1:]
+    if pos < len(tokens) and tokens[pos][0] == '_':
+        pos += 1
+        in_braces = pos < len(tokens) and tokens[pos][0] == '{'
+        if in_braces:
+            pos += 1
+        if pos >= len(tokens):
+            raise Unsupported()
+        subscript_kind, subscript_text = tokens[pos]
+        pos += 1
+        if subscript_kind == 'number' and '.' not in subscript_text:
+            subscript = str(make_number(subscript_text))
+        elif subscript_kind == 'letter':
+            subscript = subscript_text
+        elif subscript_kind == 'symbol':
+            subscript = str(sympy.oo) if subscript_text == '\\infty' else subscript_text[1:]
+        else:
+            raise Unsupported()
+        if in_braces:
+            if pos >= len(tokens) or tokens[pos][0] != '}':
+                raise Unsupported()
+            pos += 1
+        elif pos < len(tokens) and tokens[pos][0] == '_':
+            raise Unsupported()
+        name += '_{' + subscript + '}'
+
+    if kind == 'symbol' and text == '\\infty':
+        # Like `convert_atom`, which ignores the subscript of `\infty`
+        return sympy.oo, pos
+    return make_symbol(name), pos
+
+
+def make_number(text):
+    """
+    Converts a number token like `sympy.Number`, but falls back to the ANTLR parser for the tokens SymPy rejects
+    (like `02`), so that the error is raised there.
+
+    :return: SymPy number
+    """
+    try:
+        return sympy.Number(text)
+    except sympy.SympifyError:
+        raise Unsupported()
@@ -0,0 +1,44 @@
+import re
+
+# LIM_APPROACH_SYM is only valid within the subscript of `\lim`:
+LIMIT_COMMANDS = {'to', 'rightarrow', 'Rightarrow', 'longrightarrow', 'Longrightarrow'}
+
+# Commands which are lexed as SYMBOL, but would only be parsed into nonsense (e.g. `x \in A` into the product
+# `x*in*A`). Every other unknown command (like `\alpha`, `\mathbb`, `\cdots` or `\left`) is let through to the
+# parser, which accepts it as SYMBOL:
+UNSUPPORTED_COMMANDS = {
+    'in', 'notin', 'ni', 'subset', 'subseteq', 'supset', 'supseteq', 'cup', 'cap', 'setminus',
+    'forall', 'exists', 'land', 'lor', 'neg', 'implies', 'iff', 'mid'
+}
+
+# Characters the lexer of PS.g4 does not accept:
+character_regex = re.compile(r'[^ \t\r\n+\-*/(){}\[\]|_^:!=<>,.0-9a-zA-Z\\]')
+command_regex = re.compile(r'\\([a-zA-Z]+|.?)', re.DOTALL)
+
+
+def find_unsupported(latex):
+    """
+    Cheap token-level pre-scan of a LaTeX math expression against the lexer of PS.g4.
+
+    Avoids building the ANTLR lexer and parser for expressions which can not be parsed (or only into nonsense).
+
+    >>> find_unsupported(r"\\frac{a}{b} + \\alpha")
+    >>> find_unsupported(r"x_1 + \\cdots + x_n")
+    >>> find_unsupported(r"x \\in \\mathbb{R}")
+    'unsupported command \\\\in'
+
+    :param latex: LaTeX math expression
+    :return: reason why the expression is not supported or None if it is (possibly) supported
+    """
+    match = character_regex.search(latex)
+    if match:
+        return 'unsupported character ' + match.group(0)
+    for match in command_regex.finditer(latex):
+        command = match.group(1)
+        if command in LIMIT_COMMANDS:
+            if '\\lim' in latex:
+                continue
+        elif command.isalpha() and command not in UNSUPPORTED_COMMANDS:
+            continue
+        return 'unsupported command \\' + command
+    return None
@@ -8,9 +8,41 @@ from src.latex2sympy.gen.PSListener import PSListener
 
 from sympy.printing.str import StrPrinter
 
+from src.latex2sympy.fast_parser import parse_simple
+
+
+class ParseContext:
+    """
+    State of one call of `process_sympy` resp. `process_sympy_many`, passed through the `convert_*` functions.
+
+    Interns the symbols as well as the subscripted names, so that a batch shares them.
+    """
+    def __init__(self):
+        self.symbol_table = {}
+        self.str_printer = StrPrinter()
+
+    def make_symbol(self, name):
+        if name not in self.symbol_table:
+            self.symbol_table[name] = sympy.Symbol(name)
+        return self.symbol_table[name]
+
+    def subscript_name(self, subscript):
+        return self.str_printer.doprint(subscript)
+
 
 def process_sympy(sympy):
 
+    context = ParseContext()
+
+    # Simple expressions do not need the ANTLR parser:
+    expr = parse_simple(sympy, context.make_symbol)
+    if expr is not None:
+        return expr
+
+    return process_sympy_antlr(sympy, context)
+
+def process_sympy_antlr(sympy, context=None):
+
     matherror = MathErrorListener(sympy)
 
     stream = antlr4.InputStream(sympy)
@@ -27,10 +59,52 @@ def process_sympy(sympy):
 
 
     relation = parser.math().relation()
-    expr = convert_relation(relation)
+    expr = convert_relation(relation, context)
 
     return expr
 
+def process_sympy_many(latex_list):
+    """
+    Parses a list of LaTeX strings in one call.
+
+    The lexer and parser objects are reused and symbols as well as subscripted names are
+    interned in a per-batch `ParseContext`.
+
+    :param latex_list: list of LaTeX strings
+    :return: list of `(expr, None)` resp. `(None, exception)` tuples, one per item
+    """
+    matherror = MathErrorListener('')
+
+    lex = PSLexer(antlr4.InputStream(''))
+    lex.removeErrorListeners()
+    lex.addErrorListener(matherror)
+
+    parser = PSParser(antlr4.CommonTokenStream(lex))
+    parser.removeErrorListeners()
+    parser.addErrorListener(matherror)
+
+    context = ParseContext()
+    results = []
+    for latex in latex_list:
+        try:
+            expr = parse_simple(latex, context.make_symbol)
+        except Exception as e:
+            results.append((None, e))
+            continue
+        if expr is not None:
+            results.append((expr, None))
+            continue
+
+        matherror.src = latex
+        lex.inputStream = antlr4.InputStream(latex)
+        parser.setTokenStream(antlr4.CommonTokenStream(lex))
+        try:
+            results.append((convert_relation(parser.math().relation(), context), None))
+        except Exception as e:
+            results.append((None, e))
+
+    return results
+
 class MathErrorListener(ErrorListener):
     def __init__(self, src):
         super(ErrorListener, self).__init__()
@@ -57,12 +131,14 @@ class MathErrorListener(ErrorListener):
             err = fmt % ("I don't understand this", self.src, marker)
         raise Exception(err)
 
-def convert_relation(rel):
+def convert_relation(rel, context=None):
+    if context is None:
+        context = ParseContext()
     if rel.expr():
-        return convert_expr(rel.expr())
+        return convert_expr(rel.expr(), context)
 
-    lh = convert_relation(rel.relation(0))
-    rh = convert_relation(rel.relation(1))
+    lh = convert_relation(rel.relation(0), context)
+    rh = convert_relation(rel.relation(1), context)
     if rel.LT():
         return sympy.StrictLessThan(lh, rh)
     elif rel.LTE():
@@ -74,22 +150,22 @@ def convert_relation(rel):
     elif rel.EQUAL():
         return sympy.Eq(lh, rh)
 
-def convert_expr(expr):
-    return convert_add(expr.additive())
+def convert_expr(expr, context):
+    return convert_add(expr.additive(), context)
 
-def convert_add(add):
+def convert_add(add, context):
     if add.ADD():
-       lh = convert_add(add.additive(0))
-       rh = convert_add(add.additive(1))
+       lh = convert_add(add.additive(0), context)
+       rh = convert_add(add.additive(1), context)
        return sympy.Add(lh, rh, evaluate=False)
     elif add.SUB():
-        lh = convert_add(add.additive(0))
-        rh = convert_add(add.additive(1))
+        lh = convert_add(add.additive(0), context)
+        rh = convert_add(add.additive(1), context)
         return sympy.Add(lh, -1 * rh, evaluate=False)
     else:
-        return convert_mp(add.mp())
+        return convert_mp(add.mp(), context)
 
-def convert_mp(mp):
+def convert_mp(mp, context):
     if hasattr(mp, 'mp'):
         mp_left = mp.mp(0)
         mp_right = mp.mp(1)
@@ -98,20 +174,20 @@ def convert_mp(mp):
         mp_right = mp.mp_nofunc(1)
 
     if mp.MUL() or mp.CMD_TIMES() or mp.CMD_CDOT():
-        lh = convert_mp(mp_left)
-        rh = convert_mp(mp_right)
+        lh = convert_mp(mp_left, context)
+        rh = convert_mp(mp_right, context)
         return sympy.Mul(lh, rh, evaluate=False)
     elif mp.DIV() or mp.CMD_DIV() or mp.COLON():
-        lh = convert_mp(mp_left)
-        rh = convert_mp(mp_right)
+        lh = convert_mp(mp_left, context)
+        rh = convert_mp(mp_right, context)
         return sympy.Mul(lh, sympy.Pow(rh, -1, evaluate=False), evaluate=False)
     else:
         if hasattr(mp, 'unary'):
-            return convert_unary(mp.unary())
+            return convert_unary(mp.unary(), context)
         else:
-            return convert_unary(mp.unary_nofunc())
+            return convert_unary(mp.unary_nofunc(), context)
 
-def convert_unary(unary):
+def convert_unary(unary, context):
     if hasattr(unary, 'unary'):
         nested_unary = unary.unary()
     else:
@@ -124,44 +200,44 @@ def convert_unary(unary):
         postfix = unary.postfix()
 
     if unary.ADD():
-        return convert_unary(nested_unary)
+        return convert_unary(nested_unary, context)
     elif unary.SUB():
-        return sympy.Mul(-1, convert_unary(nested_unary), evaluate=False)
+        return sympy.Mul(-1, convert_unary(nested_unary, context), evaluate=False)
     elif postfix:
-        return convert_postfix_list(postfix)
+        return convert_postfix_list(postfix, context)
 
-def convert_postfix_list(arr, i=0):
+def convert_postfix_list(arr, context, i=0):
     if i >= len(arr):
         raise Exception("Index out of bounds")
 
-    res = convert_postfix(arr[i])
+    res = convert_postfix(arr[i], context)
     if isinstance(res, sympy.Expr):
         if i == len(arr) - 1:
             return res # nothing to multiply by
         else:
             if i > 0:
-                left = convert_postfix(arr[i - 1])
-                right = convert_postfix(arr[i + 1])
+                left = convert_postfix(arr[i - 1], context)
+                right = convert_postfix(arr[i + 1], context)
                 if isinstance(left, sympy.Expr) and isinstance(right, sympy.Expr):
-                    left_syms  = convert_postfix(arr[i - 1]).atoms(sympy.Symbol)
-                    right_syms = convert_postfix(arr[i + 1]).atoms(sympy.Symbol)
+                    left_syms  = convert_postfix(arr[i - 1], context).atoms(sympy.Symbol)
+                    right_syms = convert_postfix(arr[i + 1], context).atoms(sympy.Symbol)
                     # if the left and right sides contain no variables and the
                     # symbol in between is 'x', treat as multiplication.
                     if len(left_syms) == 0 and len(right_syms) == 0 and str(res) == "x":
-                        return convert_postfix_list(arr, i + 1)
+                        return convert_postfix_list(arr, context, i + 1)
             # multiply by next
-            return sympy.Mul(res, convert_postfix_list(arr, i + 1), evaluate=False)
+            return sympy.Mul(res, convert_postfix_list(arr, context, i + 1), evaluate=False)
     else: # must be derivative
         wrt = res[0]
         if i == len(arr) - 1:
             raise Exception("Expected expression for derivative")
         else:
-            expr = convert_postfix_list(arr, i + 1)
+            expr = convert_postfix_list(arr, context, i + 1)
             return sympy.Derivative(expr, wrt)
 
-def do_subs(expr, at):
+def do_subs(expr, at, context):
     if at.expr():
-        at_expr = convert_expr(at.expr())
+        at_expr = convert_expr(at.expr(), context)
         syms = at_expr.atoms(sympy.Symbol)
         if len(syms) == 0:
             return expr
@@ -169,17 +245,17 @@ def do_subs(expr, at):
             sym = next(iter(syms))
             return expr.subs(sym, at_expr)
     elif at.equality():
-        lh = convert_expr(at.equality().expr(0))
-        rh = convert_expr(at.equality().expr(1))
+        lh = convert_expr(at.equality().expr(0), context)
+        rh = convert_expr(at.equality().expr(1), context)
         return expr.subs(lh, rh)
 
-def convert_postfix(postfix):
+def convert_postfix(postfix, context):
     if hasattr(postfix, 'exp'):
         exp_nested = postfix.exp()
     else:
         exp_nested = postfix.exp_nofunc()
 
-    exp = convert_exp(exp_nested)
+    exp = convert_exp(exp_nested, context)
     for op in postfix.postfix_op():
         if op.BANG():
             if isinstance(exp, list):
@@ -190,9 +266,9 @@ def convert_postfix(postfix):
             at_b = None
             at_a = None
             if ev.eval_at_sup():
-                at_b = do_subs(exp, ev.eval_at_sup())
+                at_b = do_subs(exp, ev.eval_at_sup(), context)
             if ev.eval_at_sub():
-                at_a = do_subs(exp, ev.eval_at_sub())
+                at_a = do_subs(exp, ev.eval_at_sub(), context)
             if at_b != None and at_a != None:
                 exp = sympy.Add(at_b, -1 * at_a, evaluate=False)
             elif at_b != None:
@@ -202,50 +278,50 @@ def convert_postfix(postfix):
 
     return exp
 
-def convert_exp(exp):
+def convert_exp(exp, context):
     if hasattr(exp, 'exp'):
         exp_nested = exp.exp()
     else:
         exp_nested = exp.exp_nofunc()
 
     if exp_nested:
-        base = convert_exp(exp_nested)
+        base = convert_exp(exp_nested, context)
         if isinstance(base, list):
             raise Exception("Cannot raise derivative to power")
         if exp.atom():
-            exponent = convert_atom(exp.atom())
+            exponent = convert_atom(exp.atom(), context)
         elif exp.expr():
-            exponent = convert_expr(exp.expr())
+            exponent = convert_expr(exp.expr(), context)
         return sympy.Pow(base, exponent, evaluate=False)
     else:
         if hasattr(exp, 'comp'):
-            return convert_comp(exp.comp())
+            return convert_comp(exp.comp(), context)
         else:
-            return convert_comp(exp.comp_nofunc())
+            return convert_comp(exp.comp_nofunc(), context)
 
-def convert_comp(comp):
+def convert_comp(comp, context):
     if comp.group():
-        return convert_expr(comp.group().expr())
+        return convert_expr(comp.group().expr(), context)
     elif comp.abs_group():
-        return sympy.Abs(convert_expr(comp.abs_group().expr()), evaluate=False)
+        return sympy.Abs(convert_expr(comp.abs_group().expr(), context), evaluate=False)
     elif comp.atom():
-        return convert_atom(comp.atom())
+        return convert_atom(comp.atom(), context)
     elif comp.frac():
-        return convert_frac(comp.frac())
+        return convert_frac(comp.frac(), context)
     elif comp.func():
-        return convert_func(comp.func())
+        return convert_func(comp.func(), context)
 
-def convert_atom(atom):
+def convert_atom(atom, context):
     if atom.LETTER():
         subscriptName = ''
         if atom.subexpr():
             subscript = None
             if atom.subexpr().expr():           # subscript is expr
-                subscript = convert_expr(atom.subexpr().expr())
+                subscript = convert_expr(atom.subexpr().expr(), context)
             else:                               # subscript is atom
-                subscript = convert_atom(atom.subexpr().atom())
-            subscriptName = '_{' + StrPrinter().doprint(subscript) + '}'
-        return sympy.Symbol(atom.LETTER().getText() + subscriptName)
+                subscript = convert_atom(atom.subexpr().atom(), context)
+            subscriptName = '_{' + context.subscript_name(subscript) + '}'
+        return context.make_symbol(atom.LETTER().getText() + subscriptName)
     elif atom.SYMBOL():
         s = atom.SYMBOL().getText()[1:]
         if s == "infty":
@@ -254,21 +330,21 @@ def convert_atom(atom):
             if atom.subexpr():
                 subscript = None
                 if atom.subexpr().expr():           # subscript is expr
-                    subscript = convert_expr(atom.subexpr().expr())
+                    subscript = convert_expr(atom.subexpr().expr(), context)
                 else:                               # subscript is atom
-                    subscript = convert_atom(atom.subexpr().atom())
-                subscriptName = StrPrinter().doprint(subscript)
+                    subscript = convert_atom(atom.subexpr().atom(), context)
+                subscriptName = context.subscript_name(subscript)
                 s += '_{' + subscriptName + '}'
-            return sympy.Symbol(s)
+            return context.make_symbol(s)
     elif atom.NUMBER():
         s = atom.NUMBER().getText().replace(",", "")
         return sympy.Number(s)
     elif atom.DIFFERENTIAL():
         var = get_differential_var(atom.DIFFERENTIAL())
-        return sympy.Symbol('d' + var.name)
+        return context.make_symbol('d' + var.name)
     elif atom.mathit():
         text = rule2text(atom.mathit().mathit_text())
-        return sympy.Symbol(text)
+        return context.make_symbol(text)
 
 def rule2text(ctx):
     stream = ctx.start.getInputStream()
@@ -279,7 +355,7 @@ def rule2text(ctx):
 
     return stream.getText(startIdx, stopIdx)
 
-def convert_frac(frac):
+def convert_frac(frac, context):
     diff_op = False
     partial_op = False
     lower_itv = frac.lower.getSourceInterval()
@@ -317,16 +393,16 @@ def convert_frac(frac):
         if expr_top:
             return sympy.Derivative(expr_top, wrt)
 
-    expr_top = convert_expr(frac.upper)
-    expr_bot = convert_expr(frac.lower)
+    expr_top = convert_expr(frac.upper, context)
+    expr_bot = convert_expr(frac.lower, context)
     return sympy.Mul(expr_top, sympy.Pow(expr_bot, -1, evaluate=False), evaluate=False)
 
-def convert_func(func):
+def convert_func(func, context):
     if func.func_normal():
         if func.L_PAREN(): # function called with parenthesis
-            arg = convert_func_arg(func.func_arg())
+            arg = convert_func_arg(func.func_arg(), context)
         else:
-            arg = convert_func_arg(func.func_arg_noparens())
+            arg = convert_func_arg(func.func_arg_noparens(), context)
 
         name = func.func_normal().start.text[1:]
 
@@ -341,7 +417,7 @@ def convert_func(func):
 
         if (name=="log" or name=="ln"):
             if func.subexpr():
-                base = convert_expr(func.subexpr().expr())
+                base = convert_expr(func.subexpr().expr(), context)
             elif name == "log":
                 base = 10
             elif name == "ln":
@@ -352,9 +428,9 @@ def convert_func(func):
         should_pow = True
         if func.supexpr():
             if func.supexpr().expr():
-                func_pow = convert_expr(func.supexpr().expr())
+                func_pow = convert_expr(func.supexpr().expr(), context)
             else:
-                func_pow = convert_atom(func.supexpr().atom())
+                func_pow = convert_atom(func.supexpr().atom(), context)
 
         if name in ["sin", "cos", "tan", "csc", "sec", "cot", "sinh", "cosh", "tanh"]:
                 if func_pow == -1:
@@ -376,45 +452,45 @@ def convert_func(func):
         if func.subexpr():
             subscript = None
             if func.subexpr().expr():                   # subscript is expr
-                subscript = convert_expr(func.subexpr().expr())
+                subscript = convert_expr(func.subexpr().expr(), context)
             else:                                       # subscript is atom
-                subscript = convert_atom(func.subexpr().atom())
-            subscriptName = StrPrinter().doprint(subscript)
+                subscript = convert_atom(func.subexpr().atom(), context)
+            subscriptName = context.subscript_name(subscript)
             fname += '_{' + subscriptName + '}'
         input_args = func.args()
         output_args = []
         while input_args.args():                        # handle multiple arguments to function
-            output_args.append(convert_expr(input_args.expr()))
+            output_args.append(convert_expr(input_args.expr(), context))
             input_args = input_args.args()
-        output_args.append(convert_expr(input_args.expr()))
+        output_args.append(convert_expr(input_args.expr(), context))
         return sympy.Function(fname)(*output_args)
     elif func.FUNC_INT():
-        return handle_integral(func)
+        return handle_integral(func, context)
     elif func.FUNC_SQRT():
-        expr = convert_expr(func.base)
+        expr = convert_expr(func.base, context)
         if func.root:
-            r = convert_expr(func.root)
+            r = convert_expr(func.root, context)
             return sympy.root(expr, r)
         else:
             return sympy.sqrt(expr)
     elif func.FUNC_SUM():
-        return handle_sum_or_prod(func, "summation")
+        return handle_sum_or_prod(func, "summation", context)
     elif func.FUNC_PROD():
-        return handle_sum_or_prod(func, "product")
+        return handle_sum_or_prod(func, "product", context)
     elif func.FUNC_LIM():
-        return handle_limit(func)
+        return handle_limit(func, context)
 
-def convert_func_arg(arg):
+def convert_func_arg(arg, context):
     if hasattr(arg, 'expr'):
-        return convert_expr(arg.expr())
+        return convert_expr(arg.expr(), context)
     else:
-        return convert_mp(arg.mp_nofunc())
+        return convert_mp(arg.mp_nofunc(), context)
 
-def handle_integral(func):
+def handle_integral(func, context):
     if func.additive():
-        integrand = convert_add(func.additive())
+        integrand = convert_add(func.additive(), context)
     elif func.frac():
-        integrand = convert_frac(func.frac())
+        integrand = convert_frac(func.frac(), context)
     else:
         integrand = 1
 
@@ -438,25 +514,25 @@ def handle_integral(func):
 
     if func.subexpr():
         if func.subexpr().atom():
-            lower = convert_atom(func.subexpr().atom())
+            lower = convert_atom(func.subexpr().atom(), context)
         else:
-            lower = convert_expr(func.subexpr().expr())
+            lower = convert_expr(func.subexpr().expr(), context)
         if func.supexpr().atom():
-            upper = convert_atom(func.supexpr().atom())
+            upper = convert_atom(func.supexpr().atom(), context)
         else:
-            upper = convert_expr(func.supexpr().expr())
+            upper = convert_expr(func.supexpr().expr(), context)
         return sympy.Integral(integrand, (int_var, lower, upper))
     else:
         return sympy.Integral(integrand, int_var)
 
-def handle_sum_or_prod(func, name):
-    val      = convert_mp(func.mp())
-    iter_var = convert_expr(func.subeq().equality().expr(0))
-    start    = convert_expr(func.subeq().equality().expr(1))
+def handle_sum_or_prod(func, name, context):
+    val      = convert_mp(func.mp(), context)
+    iter_var = convert_expr(func.subeq().equality().expr(0), context)
+    start    = convert_expr(func.subeq().equality().expr(1), context)
     if func.supexpr().expr(): # ^{expr}
-        end = convert_expr(func.supexpr().expr())
+        end = convert_expr(func.supexpr().expr(), context)
     else: # ^atom
-        end = convert_atom(func.supexpr().atom())
+        end = convert_atom(func.supexpr().atom(), context)
 
 
     if name == "summation":
@@ -464,7 +540,7 @@ def handle_sum_or_prod(func, name):
     elif name == "product":
         return sympy.Product(val, (iter_var, start, end))
 
-def handle_limit(func):
+def handle_limit(func, context):
     sub = func.limit_sub()
     if sub.LETTER():
         var = sympy.Symbol(sub.LETTER().getText())
@@ -476,8 +552,8 @@ def handle_limit(func):
         direction = "-"
     else:
         direction = "+"
-    approaching = convert_expr(sub.expr())
-    content     = convert_mp(func.mp())
+    approaching = convert_expr(sub.expr(), context)
+    content     = convert_mp(func.mp(), context)
 
     return sympy.Limit(content, var, approaching, direction)
 
@@ -1,9 +1,11 @@
 from sympy import *
 from sympy.abc import x,y,z,a,b,c,f,t,k,n
 
-from process_latex import process_sympy
+from process_latex import process_sympy, process_sympy_antlr
+from fast_parser import parse_simple
 
 theta = Symbol('theta')
+f = Function('f')
 
 # shorthand definitions
 def _Add(a, b):
@@ -63,7 +65,7 @@ GOOD_PAIRS = [
     ("f(x, y)", f(x, y)),
     ("f(x, y, z)", f(x, y, z)),
     ("\\frac{d f(x)}{dx}", Derivative(f(x), x)),
-    ("\\frac{d\\theta(x)}{dx}", Derivative(theta(x), x)),
+    ("\\frac{d\\theta(x)}{dx}", Derivative(Function('theta')(x), x)),
     ("|x|", _Abs(x)),
     ("||x||", _Abs(Abs(x))),
     ("|x||y|", _Abs(x)*_Abs(y)),
@@ -96,7 +98,7 @@ GOOD_PAIRS = [
     ("x_{b}", Symbol('x_{b}')),
     ("h_\\theta", Symbol('h_{theta}')),
     ("h_{\\theta}", Symbol('h_{theta}')),
-    ("h_{\\theta}(x_0, x_1)", Symbol('h_{theta}')(Symbol('x_{0}'), Symbol('x_{1}'))),
+    ("h_{\\theta}(x_0, x_1)", Function('h_{theta}')(Symbol('x_{0}'), Symbol('x_{1}'))),
     ("x!", _factorial(x)),
     ("100!", _factorial(100)),
     ("\\theta!", _factorial(theta)),
@@ -139,6 +141,7 @@ GOOD_PAIRS = [
     ("\\log_{a^2} x", _log(x, _Pow(a, 2))),
     ("[x]", x),
     ("[a + b]", _Add(a, b)),
+    ("\\infty_2 x", _Mul(oo, x)),
     ("\\frac{d}{dx} [ \\tan x ]", Derivative(tan(x), x))
 ]
 
@@ -166,6 +169,8 @@ BAD_STRINGS = [
     "_",
     "^",
     "a // b",
+    "02",
+    "x_{02}",
     "a \\cdot \\cdot b",
     "a \\div \\div b",
     "|",
@@ -187,23 +192,48 @@ BAD_STRINGS = [
     "\\frac{(2 + x}{1 - x)}"
 ]
 
-total = 0
-passed = 0
-for s, eq in GOOD_PAIRS:
-    total += 1
-    try:
-        if process_sympy(s) != eq:
-            print("ERROR: \"%s\" did not parse to %s" % (s, eq))
+if __name__ == "__main__":
+    total = 0
+    passed = 0
+    for s, eq in GOOD_PAIRS:
+        total += 1
+        try:
+            if process_sympy(s) != eq:
+                print("ERROR: \"%s\" did not parse to %s" % (s, eq))
+            else:
+                passed += 1
+        except Exception as e:
+            print("ERROR: Exception when parsing \"%s\"" % s)
+    for s in BAD_STRINGS:
+        total += 1
+        try:
+            process_sympy(s)
+            print("ERROR: Exception should have been raised for \"%s\"" % s)
+        except Exception:
+            passed += 1 
+
+    print("%d/%d STRINGS PASSED" % (passed, total))
+
+    # The fast path has to produce exactly the same trees (or fall back):
+    total = 0
+    passed = 0
+    for s, eq in GOOD_PAIRS:
+        expr = parse_simple(s)
+        if expr is None:
+            continue
+        total += 1
+        if expr != eq or srepr(expr) != srepr(process_sympy_antlr(s)):
+            print("ERROR: fast path parsed \"%s\" to %s" % (s, expr))
         else:
             passed += 1
-    except Exception as e:
-        print("ERROR: Exception when parsing \"%s\"" % s)
-for s in BAD_STRINGS:
-    total += 1
-    try:
-        process_sympy(s)
-        print("ERROR: Exception should have been raised for \"%s\"" % s)
-    except Exception:
-        passed += 1 
+    for s in BAD_STRINGS:
+        try:
+            expr = parse_simple(s)
+        except Exception:
+            expr = "an exception"
+        if expr is None:
+            continue
+        total += 1
+        print("ERROR: fast path parsed \"%s\" to %s" % (s, expr))
 
-print("%d/%d STRINGS PASSED" % (passed, total))
+    print("%d/%d STRINGS PASSED THE FAST PATH" % (passed, total))
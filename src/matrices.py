@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__      = "Felix Petersen"
+__status__      = "Production"
+
+
+import re
+import sympy
+
+import src.objects
+import src.sampling
+
+try:
+    import numpy
+except ImportError:
+    # Matrix equations can only be checked using WolframAlpha
+    numpy = None
+
+
+matrix_environment_regex = re.compile(r'\\(begin|end)\{(matrix|bmatrix|pmatrix|vmatrix)\}')
+# Sizing of parentheses (the parser would read `\left` as a symbol, so `\det\left(A\right)` would be no function):
+sizing_regex = re.compile(r'\\(left|right)(?=[()\[\]|])')
+
+# Name of the symbols which replace the matrices (`\mathit` only allows letters, a lowercase `d` would start a
+# differential):
+PLACEHOLDER_PREFIX = 'MATRIX'
+# Number of letters of the index within the placeholder names (fixed, so that the names sort like the indices when an
+# evaluated product is reordered):
+PLACEHOLDER_WIDTH = 4
+# Number of random points of the symbols at which the matrix equations are evaluated (all at once):
+SAMPLES = 8
+# Relative tolerance of the comparison of the entries:
+TOLERANCE = 1e-8
+
+
+class Inconclusive(Exception):
+    """
+    The matrix equation can not be evaluated; the message is the reason.
+    """
+    pass
+
+
+def placeholder_name(index):
+    """
+    >>> placeholder_name(27)
+    'MATRIXAABB'
+
+    :param index: number of the matrix within the equation
+    :return: name of the placeholder (the index in base 26 with the letters `A` to `Z` as digits)
+    """
+    if index >= 26 ** PLACEHOLDER_WIDTH:
+        raise Inconclusive('too many matrices')
+    letters = ''
+    for _ in range(PLACEHOLDER_WIDTH):
+        index, digit = divmod(index, 26)
+        letters = chr(ord('A') + digit) + letters
+    return PLACEHOLDER_PREFIX + letters
+
+
+def extract_matrices(latex, matrices):
+    """
+    Replaces the matrix environments by placeholders (`\\mathit{MATRIX...}`).
+
+    :param latex: LaTeX math expression
+    :param matrices: dict of placeholder name -> (matrix type, list of rows of LaTeX cells), which is extended
+    :return: LaTeX with placeholders (without the commands removed by `query_replacer`)
+    """
+    result = ''
+    position = 0
+    opened = None
+    for match in matrix_environment_regex.finditer(latex):
+        kind, matrix_type = match.groups()
+        if kind == 'begin':
+            if opened is not None:
+                raise Inconclusive('nested matrices')
+            opened = (matrix_type, match.end())
+            result += latex[position:match.start()]
+        else:
+            if opened is None or opened[0] != matrix_type:
+                raise Inconclusive('unbalanced matrix environments')
+            name = placeholder_name(len(matrices))
+            matrices[name] = (matrix_type, split_cells(latex[opened[1]:match.start()]))
+            result += ' \\mathit{' + name + '} '
+            opened = None
+        position = match.end()
+    if opened is not None:
+        raise Inconclusive('unbalanced matrix environments')
+    return sizing_regex.sub('', src.objects.query_replacer(result + latex[position:]))
+
+
+def split_cells(content):
+    """
+    Splits the content of a matrix environment into its cells (like `WA.format_wa_matrix`).
+
+    :return: list of rows (lists of LaTeX strings)
+    """
+    rows = []
+    for row in content.split('\\\\'):
+        cells = [src.objects.query_replacer(cell).strip() for cell in row.split('&')]
+        if cells != ['']:
+            rows.append(cells)
+    if not rows or any(len(row) != len(rows[0]) for row in rows) or any(cell == '' for row in rows for cell in row):
+        raise Inconclusive('malformed matrix')
+    return rows
+
+
+def evaluate_scalar(expr, symbols, values):
+    """
+    :return: array of the values of a scalar expression at all points
+    """
+    function = sympy.lambdify(symbols, expr, 'numpy', dummify=True)
+    value = function(*values.T)
+    return numpy.broadcast_to(numpy.asarray(value, dtype=complex), (values.shape[0],))
+
+
+def as_matrix(value):
+    if value.ndim != 3:
+        raise Inconclusive('scalar where a matrix is expected')
+    return value
+
+
+def multiply(left, right):
+    if left.ndim == 3 and right.ndim == 3:
+        if left.shape[2] != right.shape[1]:
+            raise Inconclusive('matrix dimensions do not match')
+        return numpy.matmul(left, right)
+    if left.ndim == 3:
+        return left * right[:, None, None]
+    if right.ndim == 3:
+        return left[:, None, None] * right
+    return left * right
+
+
+def determinant(value):
+    value = as_matrix(value)
+    if value.shape[1] != value.shape[2]:
+        raise Inconclusive('determinant of a non-square matrix')
+    return numpy.linalg.det(value)
+
+
+def inverse(value):
+    value = as_matrix(value)
+    if value.shape[1] != value.shape[2]:
+        raise Inconclusive('inverse of a non-square matrix')
+    try:
+        return numpy.linalg.inv(value)
+    except numpy.linalg.LinAlgError:
+        raise Inconclusive('singular matrix')
+
+
+def evaluate(expr, matrices, symbols, values):
+    """
+    Evaluates an expression containing matrix placeholders at all points at once (products of matrices are matrix
+    products in the order of the factors, `^T` is the transpose, `^{-1}` the inverse, `|A|` and `\\det(A)` are
+    determinants).
+
+    :param expr: SymPy expression (not evaluated, so that the order of the factors is kept)
+    :param matrices: dict of placeholder Symbol -> array (points x rows x columns)
+    :param symbols: list of the scalar Symbols
+    :param values: array of the points (points x symbols)
+    :return: array (points) resp. (points x rows x columns)
+    """
+    if not expr.free_symbols & set(matrices):
+        return evaluate_scalar(expr, symbols, values)
+    if expr in matrices:
+        return matrices[expr]
+    if isinstance(expr, sympy.Add):
+        terms = [evaluate(arg, matrices, symbols, values) for arg in expr.args]
+        if any(term.shape != terms[0].shape for term in terms):
+            raise Inconclusive('sum of matrices of different dimensions')
+        return sum(terms[1:], terms[0])
+    if isinstance(expr, sympy.Mul):
+        result = evaluate(expr.args[0], matrices, symbols, values)
+        for arg in expr.args[1:]:
+            result = multiply(result, evaluate(arg, matrices, symbols, values))
+        return result
+    if isinstance(expr, sympy.Pow):
+        base = as_matrix(evaluate(expr.base, matrices, symbols, values))
+        if expr.exp == sympy.Symbol('T'):
+            return numpy.swapaxes(base, 1, 2)
+        if not (expr.exp.is_number and expr.exp.is_integer):
+            raise Inconclusive('non-integer power of a matrix')
+        exponent = int(expr.exp)
+        if exponent < 0:
+            base = inverse(base)
+        if base.shape[1] != base.shape[2]:
+            raise Inconclusive('power of a non-square matrix')
+        return numpy.linalg.matrix_power(base, abs(exponent))
+    if isinstance(expr, sympy.Abs) or (isinstance(expr, sympy.Function) and str(expr.func) == 'det'):
+        return determinant(evaluate(expr.args[0], matrices, symbols, values))
+    raise Inconclusive('unsupported matrix operation ' + str(expr.func))
+
+
+def check_matrix_equation(left_content, right_content, comparator, parse_segments, rng):
+    """
+    Checks an equation containing matrix environments numerically.
+
+    The matrices are replaced by placeholders, the cells and the remaining expression are parsed separately and both
+    sides are evaluated using NumPy at `SAMPLES` random points of the symbols at once (no symbolic simplification).
+
+    :param left_content: LaTeX of the left side
+    :param right_content: LaTeX of the right side
+    :param comparator: Comparator
+    :param parse_segments: function parsing a list of LaTeX strings (`SP.parse_segments`)
+    :param rng: `random.Random` for the values of the symbols
+    :return: tuple of the result ('True', 'False' or 'None') and the reason if it is 'None'
+    """
+    if numpy is None:
+        return 'None', 'matrices need numpy'
+    if str(comparator) not in ['=', '\\equiv', '\\neq']:
+        return 'None', 'matrix inequality'
+    try:
+        environments = {}
+        left_content = extract_matrices(left_content, environments)
+        right_content = extract_matrices(right_content, environments)
+
+        cells = [cell for _, rows in environments.values() for row in rows for cell in row]
+        parsed = parse_segments([left_content, right_content] + cells)
+        for expr, error in parsed:
+            if error:
+                raise Inconclusive('matrix could not be parsed')
+        parsed = iter(expr for expr, _ in parsed)
+        left = next(parsed)
+        right = next(parsed)
+        parsed_environments = {}
+        for name, (matrix_type, rows) in environments.items():
+            parsed_environments[name] = (matrix_type, [[next(parsed) for _ in row] for row in rows])
+
+        placeholders = set(sympy.Symbol(name) for name in environments)
+        expressions = [left, right] + [cell for _, rows in parsed_environments.values() for row in rows for cell in row]
+        symbols = sorted(set().union(*(expr.free_symbols for expr in expressions)) - placeholders, key=str)
+
+        sampler = src.sampling.Sampler(symbols, expressions[2:], rng)
+        points = []
+        for _ in range(SAMPLES):
+            point = sampler.draw()
+            if point is None:
+                raise Inconclusive('no valid values for the matrix entries')
+            points.append(point)
+        values = numpy.array(points, dtype=float).reshape(SAMPLES, len(symbols))
+
+        matrices = {}
+        with numpy.errstate(all='ignore'):
+            for name, (matrix_type, rows) in parsed_environments.items():
+                matrix = numpy.stack([numpy.stack([evaluate_scalar(cell, symbols, values) for cell in row], axis=-1)
+                                      for row in rows], axis=-2)
+                matrices[sympy.Symbol(name)] = determinant(matrix) if matrix_type == 'vmatrix' else matrix
+            left_value = evaluate(left, matrices, symbols, values)
+            right_value = evaluate(right, matrices, symbols, values)
+    except Inconclusive as e:
+        return 'None', str(e)
+    except Exception:
+        # e.g. functions which can not be translated to NumPy
+        return 'None', 'matrix could not be evaluated'
+
+    # A 1x1 matrix (e.g. a scalar product) is compared like a scalar:
+    if left_value.shape[1:] == (1, 1) and right_value.ndim == 1:
+        left_value = left_value[:, 0, 0]
+    if right_value.shape[1:] == (1, 1) and left_value.ndim == 1:
+        right_value = right_value[:, 0, 0]
+    if left_value.shape != right_value.shape:
+        # A matrix is never equal to a scalar or a matrix of different dimensions:
+        return ('True' if str(comparator) == '\\neq' else 'False'), ''
+    axes = tuple(range(1, left_value.ndim))
+    scale = numpy.maximum(1, numpy.maximum(abs(left_value), abs(right_value)))
+    equal = numpy.all(abs(left_value - right_value) <= TOLERANCE * scale, axis=axes)
+    finite = numpy.all(numpy.isfinite(left_value) & numpy.isfinite(right_value), axis=axes)
+    if not numpy.any(finite):
+        return 'None', 'matrix could not be evaluated'
+    equal = bool(numpy.all(equal[finite]))
+    if str(comparator) == '\\neq':
+        equal = not equal
+    return ('True' if equal else 'False'), ''
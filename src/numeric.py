@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__      = "Felix Petersen"
+__status__      = "Production"
+
+
+import mpmath
+import sympy
+
+
+# Number of conclusive random points which are needed to accept an equation:
+SAMPLES = 3
+# Relative tolerance of the comparison of the two sides:
+TOLERANCE = 1e-8
+# Maximal relative error estimate of the quadrature at a conclusive point:
+MAX_ERROR = 1e-6
+# Distance of the lower bound from the point at which an indefinite integral is differentiated:
+INDEFINITE_BASE_DISTANCE = 0.1
+# Number of consecutive integer values of the bound of sums and products which are tested:
+BOUND_SAMPLES = 12
+# Maximal number of terms of a sum or product:
+MAX_TERMS = 100000
+# Working precision (decimal digits) of the sequences approaching a limit:
+LIMIT_DPS = 60
+# Distances from the limit point (resp. points towards infinity) of the sequence: 10^(-3k)
+LIMIT_STEPS = 6
+
+# Nodes which are evaluated by the strategies of this module:
+HEAVY_NODES = (sympy.Integral, sympy.Sum, sympy.Product, sympy.Limit)
+
+
+class Inconclusive(Exception):
+    """
+    The expression can not be evaluated numerically (at this point).
+    """
+    pass
+
+
+def real_value(value, infinite=False):
+    """
+    :param value: mpmath number
+    :param infinite: allow infinite values (bounds of integrals, sums and products and points of limits)
+    :return: the real part if the imaginary part is negligible
+    """
+    if isinstance(value, mpmath.mpc):
+        if abs(value.imag) > TOLERANCE * max(1, abs(value.real)):
+            raise Inconclusive()
+        value = value.real
+    if mpmath.isnan(value) or (mpmath.isinf(value) and not infinite):
+        raise Inconclusive()
+    return value
+
+
+def top_level_nodes(expr, types):
+    """
+    :return: list of the subexpressions of the given types which are not within another such subexpression
+    """
+    if isinstance(expr, types):
+        return [expr]
+    nodes = []
+    for arg in expr.args:
+        for node in top_level_nodes(arg, types):
+            if node not in nodes:
+                nodes.append(node)
+    return nodes
+
+
+def compile_expression(expr, symbols, infinite=False):
+    """
+    Compiles the expression to a function which evaluates it numerically (integrals by adaptive quadrature, sums and
+    products term by term, limits along a sequence).
+
+    :param expr: SymPy expression
+    :param symbols: list of the Symbols which are the arguments of the function
+    :param infinite: allow an infinite value (for bounds and points of limits like `\\infty`)
+    :return: function(*values, base=None) returning the value and the accumulated error estimate (`base` is the lower
+             bound of the indefinite integrals, see `compile_integral`)
+    """
+    nodes = top_level_nodes(expr, HEAVY_NODES)
+    dummies = [sympy.Dummy() for _ in nodes]
+    node_functions = [compile_node(node, symbols) for node in nodes]
+    rest = sympy.lambdify(symbols + dummies, expr.xreplace(dict(zip(nodes, dummies))), 'mpmath', dummify=True)
+
+    def evaluate(*values, base=None):
+        node_values = []
+        error = 0
+        for node_function in node_functions:
+            node_value, node_error = node_function(*values, base=base)
+            node_values.append(node_value)
+            error += node_error
+        try:
+            return real_value(rest(*values, *node_values), infinite), error
+        except (ArithmeticError, ValueError, TypeError):
+            raise Inconclusive()
+
+    return evaluate
+
+
+def compile_node(node, symbols):
+    if isinstance(node, sympy.Integral):
+        return compile_integral(node, symbols)
+    if isinstance(node, sympy.Limit):
+        return compile_limit(node, symbols)
+    return compile_sum_or_product(node, symbols)
+
+
+def compile_integral(integral, symbols):
+    """
+    Compiles an Integral like `compile_expression`.
+
+    An indefinite integral `\\int f dx` is evaluated as the integral from `base` to `x` (`base` is fixed while the
+    derivative is computed, by default it is `x - INDEFINITE_BASE_DISTANCE`).
+    """
+    if len(integral.limits) != 1:
+        raise Inconclusive()
+    limit = integral.limits[0]
+    variable = sympy.Dummy()
+    integrand = compile_expression(integral.function.xreplace({limit[0]: variable}), symbols + [variable])
+    if len(limit) == 3:
+        lower = compile_expression(limit[1], symbols, infinite=True)
+        upper = compile_expression(limit[2], symbols, infinite=True)
+    elif limit[0] in symbols:
+        lower = None
+        upper = compile_expression(limit[0], symbols)
+    else:
+        raise Inconclusive()
+
+    def evaluate(*values, base=None):
+        upper_value = upper(*values, base=base)[0]
+        if lower:
+            lower_value = lower(*values, base=base)[0]
+        else:
+            lower_value = base if base is not None else upper_value - INDEFINITE_BASE_DISTANCE
+        try:
+            value, error = mpmath.quad(lambda t: integrand(*values, t, base=base)[0], [lower_value, upper_value],
+                                       error=True)
+        except (ArithmeticError, ValueError, TypeError):
+            raise Inconclusive()
+        return real_value(value), error
+
+    return evaluate
+
+
+def integer_value(value):
+    if not mpmath.isinf(value):
+        if abs(value - mpmath.nint(value)) > TOLERANCE:
+            raise Inconclusive()
+        return int(mpmath.nint(value))
+    return value
+
+
+def compile_sum_or_product(node, symbols):
+    """
+    Compiles a Sum or Product like `compile_expression`.
+
+    The partial sum (resp. product) is kept, so that consecutive calls with a growing upper bound (and otherwise the
+    same values) only add the new terms (running accumulation).
+    """
+    if len(node.limits) != 1:
+        raise Inconclusive()
+    index, lower, upper = node.limits[0]
+    is_sum = isinstance(node, sympy.Sum)
+    variable = sympy.Dummy()
+    term = compile_expression(node.function.xreplace({index: variable}), symbols + [variable])
+    lower = compile_expression(lower, symbols, infinite=True)
+    upper = compile_expression(upper, symbols, infinite=True)
+    # Values of the symbols and base, lower bound, upper bound and value of the last call:
+    state = {}
+
+    def evaluate(*values, base=None):
+        lower_value = integer_value(lower(*values, base=base)[0])
+        upper_value = integer_value(upper(*values, base=base)[0])
+        if mpmath.isinf(lower_value):
+            raise Inconclusive()
+        if mpmath.isinf(upper_value):
+            function = mpmath.nsum if is_sum else mpmath.nprod
+            try:
+                return real_value(function(lambda i: term(*values, i, base=base)[0], [lower_value, upper_value])), 0
+            except (ArithmeticError, ValueError, TypeError):
+                raise Inconclusive()
+        if upper_value < lower_value - 1 or upper_value - lower_value > MAX_TERMS:
+            raise Inconclusive()
+
+        if state.get('values') == (values, base) and state['lower'] == lower_value and state['upper'] <= upper_value:
+            i, value = state['upper'] + 1, state['value']
+        else:
+            i, value = lower_value, mpmath.mpf(0 if is_sum else 1)
+        for i in range(i, upper_value + 1):
+            if is_sum:
+                value += term(*values, i, base=base)[0]
+            else:
+                value *= term(*values, i, base=base)[0]
+        state.update(values=(values, base), lower=lower_value, upper=upper_value, value=value)
+        return real_value(value), 0
+
+    return evaluate
+
+
+def compile_limit(limit, symbols):
+    """
+    Compiles a Limit like `compile_expression`.
+
+    The limit is approximated along the sequence `a + 10^(-3k)` (resp. `a - 10^(-3k)`, `10^(3k)`, `-10^(3k)`) with a
+    high working precision; the difference of the last two elements is the error estimate.
+    """
+    content, variable, approaching, direction = limit.args
+    dummy = sympy.Dummy()
+    content = compile_expression(content.xreplace({variable: dummy}), symbols + [dummy])
+    approaching = compile_expression(approaching, symbols, infinite=True)
+    sign = -1 if str(direction) == '-' else 1
+
+    def evaluate(*values, base=None):
+        point = approaching(*values, base=base)[0]
+        sequence = []
+        with mpmath.workdps(LIMIT_DPS):
+            for k in range(1, LIMIT_STEPS + 1):
+                if mpmath.isinf(point):
+                    x = mpmath.mpf(10) ** (3 * k) * (1 if point > 0 else -1)
+                else:
+                    x = point + sign * mpmath.mpf(10) ** (-3 * k)
+                sequence.append(content(*values, x, base=base)[0])
+        value = sequence[-1]
+        error = abs(sequence[-1] - sequence[-2])
+        if error > MAX_ERROR * max(1, abs(value)):
+            # Does not converge (fast enough)
+            raise Inconclusive()
+        return real_value(+value), error
+
+    return evaluate
+
+
+def indefinite_variables(expr):
+    return set(integral.limits[0][0] for integral in expr.atoms(sympy.Integral) if len(integral.limits[0]) == 1)
+
+
+def compare(left_value, right_value, error, comparator):
+    """
+    :return: True / False if the comparator is valid resp. not valid, None if the error estimate is too large
+    """
+    scale = max(1, abs(left_value), abs(right_value))
+    if error > MAX_ERROR * scale:
+        return None
+    equal = abs(left_value - right_value) <= TOLERANCE * scale + 10 * error
+    if str(comparator) == '\\neq':
+        return not equal
+    return equal
+
+
+def bound_symbols(expr):
+    """
+    :return: set of the symbols within the bounds of sums and products (these have to be integers)
+    """
+    symbols = set()
+    for node in expr.atoms(sympy.Sum, sympy.Product):
+        for limit in node.limits:
+            for bound in limit[1:]:
+                symbols |= bound.free_symbols
+    return symbols
+
+
+def sample_points(symbols, integer_symbols, rng):
+    """
+    Values of the symbols at which the sides are compared.
+
+    If there are symbols in the bounds of sums or products, they run through consecutive integers (while the other
+    symbols keep their random values), so that the sums and products are accumulated; else all values are random.
+    Without symbols the sides are only evaluated once.
+
+    :return: generator of lists of mpmath numbers (in the order of `symbols`)
+    """
+    if not symbols:
+        yield []
+    elif integer_symbols:
+        reals = [mpmath.mpf(rng.uniform(0.5, 2)) for _ in symbols]
+        for n in range(BOUND_SAMPLES + 5):
+            yield [mpmath.mpf(n) if symbol in integer_symbols else real for symbol, real in zip(symbols, reals)]
+    else:
+        for _ in range(3 * SAMPLES):
+            yield [mpmath.mpf(rng.uniform(0.5, 2)) for _ in symbols]
+
+
+def check_numerically(left, right, comparator, rng):
+    """
+    Checks an equation containing integrals, sums, products or limits numerically.
+
+    Definite integrals are evaluated by adaptive quadrature (`mpmath.quad`) at random values of the remaining symbols
+    and compared considering the error estimates. For indefinite integrals both sides are differentiated numerically
+    with respect to the integration variable (so that the constant of integration does not matter). Sums and products
+    with a symbolic bound are compared for consecutive integer values of the bound, limits are approximated along a
+    sequence.
+
+    :param left: left side (SymPy expression)
+    :param right: right side (SymPy expression)
+    :param comparator: Comparator
+    :param rng: `random.Random` for the values of the symbols
+    :return: 'True', 'False' or None if the numerical check is inconclusive (or not applicable)
+    """
+    if str(comparator) not in ['=', '\\equiv', '\\neq']:
+        return None
+    if not (left.has(*HEAVY_NODES) or right.has(*HEAVY_NODES)):
+        return None
+    variables = indefinite_variables(left) | indefinite_variables(right)
+    integer_symbols = bound_symbols(left) | bound_symbols(right)
+    if len(variables) > 1 or (variables and integer_symbols):
+        return None
+
+    symbols = sorted(left.free_symbols | right.free_symbols, key=str)
+    try:
+        left_function = compile_expression(left, symbols)
+        right_function = compile_expression(right, symbols)
+    except Inconclusive:
+        return None
+    except Exception:
+        # e.g. functions which can not be translated to mpmath
+        return None
+
+    n_conclusive = 0
+    needed = BOUND_SAMPLES if integer_symbols else SAMPLES if symbols else 1
+    for values in sample_points(symbols, integer_symbols, rng):
+        try:
+            if variables:
+                index = symbols.index(next(iter(variables)))
+                point = values[index]
+                base = point - INDEFINITE_BASE_DISTANCE
+
+                def side_at(function):
+                    def side(t):
+                        return function(*(values[:index] + [t] + values[index + 1:]), base=base)[0]
+                    return side
+
+                left_value = mpmath.diff(side_at(left_function), point)
+                right_value = mpmath.diff(side_at(right_function), point)
+                error = 0
+            else:
+                left_value, left_error = left_function(*values)
+                right_value, right_error = right_function(*values)
+                error = left_error + right_error
+        except Inconclusive:
+            continue
+        except Exception:
+            # e.g. undefined functions
+            continue
+
+        valid = compare(left_value, right_value, error, comparator)
+        if valid is None:
+            continue
+        if not valid:
+            return 'False'
+        n_conclusive += 1
+        if n_conclusive >= needed:
+            return 'True'
+    return None
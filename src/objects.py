@@ -6,6 +6,8 @@ __status__      = "Production"
 
 
 import re
+import time
+import sympy
 from src.helper import get_as_long_as_correct_parentheses_from_right, get_as_long_as_correct_parentheses_from_left
 
 
@@ -37,6 +39,8 @@ class Equation:
 
     # For statistics purposes:
     results_dict = {}
+    reasons_dict = {}
+    backend_dict = {}
 
     def __init__(self, left_presentation, right_presentation, left_content, right_content, comparator, lets, check_equation):
         """
@@ -44,8 +48,8 @@ class Equation:
         
         :param left_presentation: 
         :param right_presentation: 
-        :param left_content: 
-        :param right_content: 
+        :param left_content: left side (already cut with correct parentheses)
+        :param right_content: right side (already cut with correct parentheses)
         :param comparator: 
         :param lets: 
         :param check_equation: 
@@ -56,12 +60,19 @@ class Equation:
         self.comparator = Comparator(comparator)
         self.lets = lets
         self.res = ''
+        self.reason = ''
+        self.backend = ''
+        # Number of samples of the numerical test:
+        self.samples = 0
+        # Seconds the check may take at most (None: `args.sympy_timeout` resp. `args.wa_timeout`):
+        self.sympy_timeout = None
+        self.wa_timeout = None
         self.interpretation_of_equation_to_latex = ''
 
         self.check_equation = check_equation
 
-        self.left_content = get_as_long_as_correct_parentheses_from_right(left_content)
-        self.right_content = get_as_long_as_correct_parentheses_from_left(right_content)
+        self.left_content = left_content
+        self.right_content = right_content
 
 
     def __str__(self):
@@ -74,29 +85,72 @@ class Equation:
         """
         return self.left_content + str(self.comparator) + self.right_content
 
-    def compute_result(self):
+    def is_skipped(self):
         """
-        Computes and saves the result of the check using `check_equation`.
+        :return: True if the Equation is not checked at all (e.g. an equation within a text within a formula)
         """
         if r'\text' in self.left_presentation + self.right_presentation:
             # Avoid the case of an equation within a text within a formula
-            return
+            return True
         if len((self.left_content + self.right_content).replace(' ', '')) <= 2 and \
             (
                 'i' in (self.left_content + self.right_content) or
                 'j' in (self.left_content + self.right_content)
             ):
+            return True
+        return False
+
+    def should_be_checked(self):
+        """
+        :return: True if `compute_result` will call `check_equation` for the Equation
+        """
+        return not self.is_skipped() and \
+            self.left_content.replace(' ', '') != '' and self.right_content.replace(' ', '') != ''
+
+    def compute_result(self, sympy_timeout=None, wa_timeout=None):
+        """
+        Computes and saves the result of the check using `check_equation`.
+
+        :param sympy_timeout: seconds the check of SymPy may take at most (None: `args.sympy_timeout`)
+        :param wa_timeout: seconds the check of WolframAlpha may take at most (None: `args.wa_timeout`)
+        """
+        if self.is_skipped():
             return
 
-        if self.left_content.replace(' ', '') != '' and self.right_content.replace(' ', '') != '':
+        self.sympy_timeout = sympy_timeout
+        self.wa_timeout = wa_timeout
+
+        if self.should_be_checked():
             self.res = self.check_equation(query=self, lets=self.lets)
         else:
             self.res = 'Parentheses Error'
+        self.count_result()
+
+    def skip(self):
+        """
+        Marks the Equation as not checked because of the time budget.
+        """
+        if self.is_skipped():
+            return
+        self.res = 'Skipped'
+        self.count_result()
+
+    def count_result(self):
         # For statistics purposes:
         if self.res in Equation.results_dict:
             Equation.results_dict[self.res] += 1
         else:
             Equation.results_dict[self.res] = 1
+        if self.backend:
+            if self.backend in Equation.backend_dict:
+                Equation.backend_dict[self.backend] += 1
+            else:
+                Equation.backend_dict[self.backend] = 1
+        if self.reason:
+            if self.reason in Equation.reasons_dict:
+                Equation.reasons_dict[self.reason] += 1
+            else:
+                Equation.reasons_dict[self.reason] = 1
 
     def get_result_comparator(self):
         """
@@ -118,6 +172,8 @@ class Equation:
         #     result_comparator += r'\text{\color{orange}?~}'
         if self.res.find("new") != -1:
             result_comparator += r'\text{\color{blue} def}'
+        if self.res == 'Skipped':
+            result_comparator += r'\text{\color{gray} skipped}'
         # if self.res.replace("True", '').replace('False', '').replace('new', '').replace('None', '').replace(' ', '') != '':
         #     result_comparator += r'\text{' + self.res.replace("True", '').replace('False', '').replace('new', '').replace('None', '') + r'}'
 
@@ -166,6 +222,136 @@ class Let:
         return self.left + ' ' + str(self.between) + ' ' + self.right
 
 
+# Nodes which bind variables, the definitions of these variables are not substituted within them
+BINDING_NODES = (sympy.Integral, sympy.Sum, sympy.Product, sympy.Limit, sympy.Derivative)
+
+
+def substitute_definitions(expr, definitions):
+    """
+    Substitutes the definitions, but not for the variables bound by an integral, sum, product, limit or derivative
+    (after `x := 2`, `\\int_0^1 x dx` stays the integral of x). The limits of these nodes are substituted, and a
+    derivative w.r.t. a defined variable is evaluated at its definition.
+
+    :param expr: SymPy expression
+    :param definitions: dict Symbol -> SymPy expression
+    :return: the expression with the definitions substituted
+    """
+    if not definitions or not isinstance(expr, sympy.Basic):
+        return expr
+    if not expr.has(*BINDING_NODES):
+        return expr.xreplace(definitions)
+    if isinstance(expr, (sympy.Integral, sympy.Sum, sympy.Product)):
+        limits = []
+        inner = definitions
+        for limit in expr.limits:
+            # The limits are in the scope of the variables of the limits before them:
+            limits.append((limit[0],) + tuple(substitute_definitions(bound, inner) for bound in limit[1:]))
+            inner = {symbol: value for symbol, value in inner.items() if symbol != limit[0]}
+        return expr.func(substitute_definitions(expr.function, inner), *limits)
+    if isinstance(expr, sympy.Limit):
+        content, variable, point, direction = expr.args
+        inner = {symbol: value for symbol, value in definitions.items() if symbol != variable}
+        return sympy.Limit(substitute_definitions(content, inner), variable,
+                           substitute_definitions(point, definitions), str(direction))
+    if isinstance(expr, sympy.Derivative):
+        variables = set(expr.variables)
+        inner = {symbol: value for symbol, value in definitions.items() if symbol not in variables}
+        derivative = sympy.Derivative(substitute_definitions(expr.expr, inner), *expr.variable_count)
+        defined = list(dict.fromkeys(variable for variable in expr.variables if variable in definitions))
+        if defined:
+            return sympy.Subs(derivative, defined, [definitions[variable] for variable in defined])
+        return derivative
+    return expr.func(*[substitute_definitions(arg, definitions) for arg in expr.args])
+
+
+class Lets(list):
+    """
+    Lets class.
+
+    List of the (Let)s of a namespace with an index from the first identifier of the left side of each Let to the Let.
+
+    A Let can only be applied to a query if its left side occurs in the query and is not (part of) a LaTeX command,
+    so only the Lets whose identifier occurs as a token of the query are candidates.
+
+    For SymPy, the Lets also keep a table of the parsed definitions (Symbol -> SymPy expression), which are substituted
+    using one `xreplace` (see `substitute_definitions` for the variables bound by integrals, sums, limits, ...).
+    """
+
+    # Tokens of a query: LaTeX commands and the single letters which are not part of a command
+    token_regex = re.compile(r'\\[^\W\d_]*|[^\W\d_]')
+
+    def __init__(self):
+        super().__init__()
+        # identifier -> list of Lets (None: Lets which do not begin with a letter and are always candidates)
+        self.index = {}
+        # Let -> position of insertion, to keep the order of the list
+        self.order = {}
+        self.counter = 0
+        # Symbol -> SymPy expression (in terms of the symbols which have not been defined before)
+        self.definitions = {}
+        # SymPy expression -> expression with the definitions substituted
+        self.substituted = {}
+
+    @staticmethod
+    def identifier(let):
+        """
+        :return: first letter of the left side, None if it does not begin with a letter, '\\' if it is a command
+        """
+        if let.left[:1].isalpha():
+            return let.left[0]
+        if let.left[:1] == '\\':
+            # `is_latex_command` rejects such a Let for every query
+            return '\\'
+        return None
+
+    def append(self, let):
+        super().append(let)
+        self.index.setdefault(Lets.identifier(let), []).append(let)
+        self.order[let] = self.counter
+        self.counter += 1
+
+    def remove(self, let):
+        super().remove(let)
+        self.index[Lets.identifier(let)].remove(let)
+        del self.order[let]
+
+    def define(self, symbol, expr):
+        """
+        Adds a parsed definition (the definitions made before are substituted in it, so that one substitution is
+        sufficient for chains of definitions).
+
+        :param symbol: SymPy Symbol which is defined
+        :param expr: SymPy expression
+        """
+        self.definitions[symbol] = self.substitute(expr)
+        self.substituted = {}
+
+    def substitute(self, expr):
+        """
+        :param expr: SymPy expression
+        :return: the expression with the definitions substituted
+        """
+        if not self.definitions:
+            return expr
+        if expr not in self.substituted:
+            self.substituted[expr] = substitute_definitions(expr, self.definitions)
+        return self.substituted[expr]
+
+    def candidates(self, query):
+        """
+        Lets which may be applicable to the query (in the order of the list).
+
+        :param query: query string
+        :return: list of Lets
+        """
+        keys = set(token for token in Lets.token_regex.findall(query) if token[0] != '\\')
+        keys.add(None)
+        candidates = []
+        for key in keys:
+            candidates += self.index.get(key, [])
+        return sorted(candidates, key=lambda let: self.order[let])
+
+
 class Comparator:
     """
     Comparator class.
@@ -278,29 +464,22 @@ class LaTeXMathmode:
         self.equations = []
         self.end = end
 
-        last_part = ''
-        last_parts = ''
+        # Split once at every comparator; each Equation consists of two neighbouring segments (as long as the
+        # parentheses are correct), so the whole chain `a = b = c = d` is linear work.
         delimiters = r'(=)|(\\equiv)|(\\neq)|(\\geq)|(\\leq)|(:=)|(=:)|(<)|(>)'  # needs to be double-escaped because of use in re.split()
-        search_begin = 0
-        match = None
-        while re.search(delimiters, self.content[search_begin:]) != None:
-            match = re.search(delimiters, self.content[search_begin:])
-            next_match = re.search(delimiters, self.content[search_begin + match.end():])
-            next_start = 0
-            if next_match:
-                next_start = search_begin + next_match.start()
-            else:
-                next_start = len(self.content)
-
-            eq = Equation(self.content[search_begin:search_begin + match.start()], self.content[search_begin + match.end():next_start], # presentation
-                          self.content[            :search_begin + match.start()], self.content[search_begin + match.end():          ], # content
-                          self.content[search_begin + match.start():search_begin + match.end()], # comparator
+        matches = list(re.finditer(delimiters, self.content))
+        for i, match in enumerate(matches):
+            begin = matches[i - 1].end() if i > 0 else 0
+            next_start = matches[i + 1].start() if i + 1 < len(matches) else len(self.content)
+
+            eq = Equation(self.content[begin:match.start()], self.content[match.end():next_start], # presentation
+                          get_as_long_as_correct_parentheses_from_right(self.content, match.start()),
+                          get_as_long_as_correct_parentheses_from_left(self.content, match.end()), # content
+                          match.group(0), # comparator
                           lets, check_equation)
 
             self.equations.append(eq)
 
-            search_begin += match.end()
-
     def __str__(self):
         equations = ''
         if len(self.equations):
@@ -346,6 +525,10 @@ class LaTeXDocument:
         import src.helper
         self.args = args
 
+        # Equations selected by `schedule` and the beginning of the time budget:
+        self.scheduled = None
+        self.schedule_start = None
+
         def removeComments(string):
             res = ""
             regex = r"(?<!\\)%"
@@ -403,7 +586,7 @@ class LaTeXDocument:
         def namespace_to_text_and_math(leaf):
             # Helper function
             if leaf.type == 'namespace':
-                lets = []
+                lets = Lets()
                 node = LaTeXTreeNode('', 'namespace', [], lets=lets)
                 is_mathmode_that_began_with = ''
                 current_math = ''
@@ -441,7 +624,17 @@ class LaTeXDocument:
         """
         return self.head + str(self.tree) + self.tail
 
-    def work_on_mathmodes(self):
+    def work_on_mathmodes(self, estimate_cost=None):
+        """
+        Checks all equations of the document (within `args.time_budget` seconds if it is set).
+
+        :param estimate_cost: function(Equation) returning the estimated seconds of its check (required for the time
+                              budget)
+        """
+        if self.args.time_budget is not None and estimate_cost is not None:
+            self.work_on_mathmodes_within_budget(estimate_cost)
+            return
+
         def fun2(node):
             # lets = []
             def work_on_mathmode_incl_lets(mathmode):
@@ -454,6 +647,104 @@ class LaTeXDocument:
 
         self.tree.do_for_every(fun2)
 
+    def schedule(self, estimate_cost=None):
+        """
+        Selects the equations which are checked within `args.time_budget` seconds (the budget begins here, so that the
+        estimation is charged, too).
+
+        If the estimated costs of all equations fit into the budget, they are checked in the order of the document (like
+        without a budget). Otherwise the equations with the highest value per estimated second are selected (the last
+        equation of a mathmode, usually the final result, has the double value) and checked from the cheapest to the
+        most expensive one (in the order of the document if the lets are considered).
+
+        :param estimate_cost: function(Equation) returning the estimated seconds of its check
+        :return: list of the Equations in the order in which they are checked (all Equations without a budget)
+        """
+        if self.args.time_budget is None or estimate_cost is None:
+            return self.get_equations()
+        if self.scheduled is not None:
+            return self.scheduled
+
+        self.schedule_start = time.perf_counter()
+        budget = self.args.time_budget
+        equations = [equation for equation in self.get_equations() if not equation.is_skipped()]
+        costs = {equation: estimate_cost(equation) if equation.should_be_checked() else 0 for equation in equations}
+        values = {}
+        for mathmode in self.get_mathmodes():
+            for equation in mathmode.equations:
+                values[equation] = 2 if equation is mathmode.equations[-1] else 1
+
+        if sum(costs.values()) <= budget:
+            order = equations
+        else:
+            selected = []
+            total = 0
+            for equation in sorted(equations, key=lambda equation: costs[equation] / values[equation]):
+                if total + costs[equation] <= budget:
+                    selected.append(equation)
+                    total += costs[equation]
+            if self.args.lets:
+                # Definitions have to be made before they are used:
+                order = [equation for equation in equations if equation in selected]
+            else:
+                order = selected
+        if self.args.verbose:
+            print('Estimated cost: ' + str(round(sum(costs.values()), 3)) + ' seconds, ' + str(len(order)) + ' of '
+                  + str(len(equations)) + ' equations are scheduled within ' + str(budget) + ' seconds.')
+        self.scheduled = order
+        return order
+
+    def work_on_mathmodes_within_budget(self, estimate_cost):
+        """
+        Checks the equations selected by `schedule` within `args.time_budget` seconds.
+
+        Each check is limited to the remaining time (besides `args.sympy_timeout` and `args.wa_timeout`); the equations
+        which are not reached are marked as 'Skipped'.
+
+        :param estimate_cost: function(Equation) returning the estimated seconds of its check
+        """
+        order = self.schedule(estimate_cost)
+        budget = self.args.time_budget
+
+        reached = set()
+        for equation in order:
+            remaining = budget - (time.perf_counter() - self.schedule_start)
+            if remaining <= 0:
+                break
+            reached.add(equation)
+            equation.compute_result(sympy_timeout=min(self.args.sympy_timeout or remaining, remaining),
+                                    wa_timeout=min(self.args.wa_timeout or remaining, remaining))
+
+        for equation in self.get_equations():
+            if equation not in reached:
+                equation.skip()
+
+    def get_mathmodes(self):
+        """
+        :return: list of all LaTeXMathmodes of the document (in the order of the document)
+        """
+        mathmodes = []
+        def fun2(node):
+            def collect(mathmode):
+                if mathmode.type == 'mathmode':
+                    mathmodes.append(mathmode.content)
+                return mathmode
+            if node.type == 'namespace':
+                node.do_for_every(collect)
+            return node
+
+        self.tree.do_for_every(fun2)
+        return mathmodes
+
+    def get_equations(self):
+        """
+        :return: list of all Equations of the document (in the order of the document)
+        """
+        equations = []
+        for mathmode in self.get_mathmodes():
+            equations.extend(mathmode.equations)
+        return equations
+
     def do_for_every_leaf_with_type(self, fun, type):
         def fun2(node):
             # Applies @fun on every child if the node has type @type
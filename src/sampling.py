@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__      = "Felix Petersen"
+__status__      = "Production"
+
+
+import math
+import sympy
+
+
+# Range of the magnitudes of the random values: 10^(-MAGNITUDE) to 10^MAGNITUDE (log-uniform)
+MAGNITUDE = 1
+# Number of points which are drawn (and checked against the domain) at once:
+BATCH_SIZE = 16
+# Maximal number of drawn points per valid point before the sampler gives up:
+MAX_REJECTIONS = 10
+# Minimal absolute value of a denominator:
+MIN_DENOMINATOR = 1e-9
+
+# Kinds of constraints: the argument has to be ...
+NONNEGATIVE = '>= 0'
+POSITIVE = '> 0'
+NONZERO = '!= 0'
+UNIT_INTERVAL = 'in [-1, 1]'
+
+CONSTRAINT_FUNCTIONS = {
+    sympy.log: POSITIVE,
+    sympy.asin: UNIT_INTERVAL,
+    sympy.acos: UNIT_INTERVAL,
+}
+
+
+def domain_constraints(expr):
+    """
+    Infers the constraints of the domain of an expression from its tree: arguments of square roots and other fractional
+    powers with an even denominator have to be nonnegative, arguments of logarithms positive and denominators
+    (powers with a negative exponent) nonzero.
+
+    >>> x = sympy.Symbol('x')
+    >>> domain_constraints(sympy.sqrt(x) + 1 / (x - 1))
+    [(x, '>= 0'), (x - 1, '!= 0')]
+
+    :param expr: SymPy expression
+    :return: list of tuples of the argument and the kind of the constraint
+    """
+    constraints = []
+    for node in sympy.preorder_traversal(expr):
+        constraint = None
+        if isinstance(node, sympy.Pow) and node.exp.is_number:
+            if node.exp.is_Rational and not node.exp.is_Integer and node.exp.q % 2 == 0:
+                constraint = (node.base, NONNEGATIVE if node.exp > 0 else POSITIVE)
+            elif node.exp.is_negative:
+                constraint = (node.base, NONZERO)
+        elif isinstance(node, tuple(CONSTRAINT_FUNCTIONS)):
+            constraint = (node.args[0], CONSTRAINT_FUNCTIONS[node.func])
+        if constraint is not None and constraint[0].free_symbols and constraint not in constraints:
+            constraints.append(constraint)
+    return constraints
+
+
+def symbol_signs(symbols, constraints):
+    """
+    Signs of the symbols which are directly restricted by a constraint like `\\sqrt{x}`, `\\log(-x)` or by their
+    assumptions.
+
+    :return: dict of symbol -> 1 (positive values) resp. -1 (negative values)
+    """
+    signs = {}
+    for symbol in symbols:
+        if symbol.is_nonnegative:
+            signs[symbol] = 1
+        elif symbol.is_nonpositive:
+            signs[symbol] = -1
+    for argument, kind in constraints:
+        if kind not in [NONNEGATIVE, POSITIVE]:
+            continue
+        coefficient, rest = argument.as_coeff_Mul()
+        if rest in symbols and coefficient != 0:
+            signs[rest] = 1 if coefficient > 0 else -1
+    return signs
+
+
+def compile_constraint(symbols, argument, kind):
+    """
+    :return: function(*values) returning True if the point is within the domain of the constraint
+    """
+    function = sympy.lambdify(symbols, argument, 'math', dummify=True)
+
+    def is_valid(*values):
+        value = function(*values)
+        if isinstance(value, complex):
+            return False
+        if not math.isfinite(value):
+            return False
+        if kind == NONNEGATIVE:
+            return value >= 0
+        if kind == POSITIVE:
+            return value > 0
+        if kind == NONZERO:
+            return abs(value) > MIN_DENOMINATOR
+        return -1 <= value <= 1
+
+    return is_valid
+
+
+class Sampler:
+    """
+    Draws random points within the domain of an equation.
+
+    The values are log-uniformly distributed between 10^(-MAGNITUDE) and 10^MAGNITUDE with a random sign (or the sign
+    implied by the domain). Points are drawn in batches of `BATCH_SIZE` and the points outside of the domain are
+    rejected.
+    """
+
+    # For statistics purposes: number of drawn and rejected points
+    statistics = {'drawn': 0, 'rejected': 0}
+
+    def __init__(self, symbols, expressions, rng):
+        """
+        :param symbols: list of the Symbols
+        :param expressions: list of the SymPy expressions whose domains are considered
+        :param rng: `random.Random`
+        """
+        self.symbols = symbols
+        self.rng = rng
+        constraints = []
+        for expr in expressions:
+            for constraint in domain_constraints(expr):
+                if constraint not in constraints:
+                    constraints.append(constraint)
+        self.signs = symbol_signs(symbols, constraints)
+        self.integers = set(symbol for symbol in symbols if symbol.is_integer)
+        self.checks = []
+        for argument, kind in constraints:
+            try:
+                self.checks.append(compile_constraint(symbols, argument, kind))
+            except Exception:
+                # e.g. functions which can not be translated; the point is checked when it is evaluated
+                pass
+        self.batch = []
+
+    def draw_value(self, symbol):
+        value = 10 ** self.rng.uniform(-MAGNITUDE, MAGNITUDE)
+        if symbol in self.integers:
+            value = max(1, round(value))
+        return value * self.signs.get(symbol, self.rng.choice([-1, 1]))
+
+    def is_valid(self, point):
+        for check in self.checks:
+            try:
+                if not check(*point):
+                    return False
+            except (ArithmeticError, ValueError, TypeError):
+                return False
+            except Exception:
+                # e.g. undefined functions
+                continue
+        return True
+
+    def draw(self):
+        """
+        :return: list of values of the symbols (in the order of `symbols`) within the domain or None if no valid point
+                 could be found
+        """
+        attempts = 0
+        while not self.batch:
+            if attempts >= MAX_REJECTIONS * BATCH_SIZE:
+                return None
+            candidates = [[self.draw_value(symbol) for symbol in self.symbols] for _ in range(BATCH_SIZE)]
+            self.batch = [point for point in candidates if self.is_valid(point)]
+            attempts += BATCH_SIZE
+            Sampler.statistics['drawn'] += BATCH_SIZE
+            Sampler.statistics['rejected'] += BATCH_SIZE - len(self.batch)
+            self.batch.reverse()
+        return self.batch.pop()
@@ -6,15 +6,50 @@ __status__      = "Production"
 
 
 import src.latex2sympy.process_latex as latex2sympy
+import src.latex2sympy.prescan as prescan
 import src.objects
+import src.numeric
+import src.intervals
+import src.matrices
+import src.doit_cache
+import src.cost
+import src.sampling
 import sympy
+import math
 import random
+import signal
+import time
+from collections import OrderedDict
+
+
+class SympyTimeout(BaseException):
+    """
+    Raised when a SymPy check takes longer than `args.sympy_timeout`.
+
+    It is no `Exception`, so that it is not caught by the `except Exception` within SymPy or `sympy_query`.
+    """
+    pass
+
 
 class SP:
     """
     Sympy helper class
     """
 
+    # For statistics purposes (numerical tests): number of tests, samples and tests which stopped early
+    numerical_statistics = {'tests': 0, 'samples': 0, 'stopped early': 0}
+
+    # Maximal number of samples of the numerical test:
+    MAX_SAMPLES = 40
+    # Number of agreeing samples (without any disagreeing) after which the numerical test stops: by the rule of three,
+    # a region of at least 3/12 = 25% of the samples where the equation is false would have been hit with 95% confidence
+    AGREEING_SAMPLES = 12
+    # Relative tolerance for the comparison of the sides at a sample:
+    TOLERANCE = 1e-9
+    # Maximal number of parsed segments resp. simplified expressions which are kept (the least recently used ones are
+    # dropped):
+    MAX_CACHED = 1024
+
     def __init__(self, args):
         """
         Initializer of the Sympy helper class.
@@ -23,77 +58,364 @@ class SP:
         """
         self.args = args
 
+        # Neighbouring equations of a chain `a = b = c` share their segments, so each segment is parsed only once
+        # (and repeated equations are simplified only once):
+        self.parsed_segments = OrderedDict()
+        self.simplified = OrderedDict()
+
+        # Evaluated integrals, sums, products, limits and derivatives (shared by all documents):
+        self.doit_cache = src.doit_cache.get_doit_cache(args.doit_cache)
+
+        # Timings of the strategies, which determine their order (shared by all documents):
+        self.timings = src.cost.get_timings(args.timings)
+
+    def get_rng(self, query):
+        """
+        Random number generator of an equation, seeded by `args.seed` and the equation itself (so that the results do
+        not depend on the order of the equations and are the same on every run).
+
+        :param query: Equation object
+        :return: `random.Random`
+        """
+        return random.Random(str(self.args.seed) + '!!!' + str(query))
+
+    def parse_segments(self, segments):
+        """
+        Parses the LaTeX segments (using `process_sympy_many` for the ones which have not been parsed yet).
+
+        :param segments: list of LaTeX strings
+        :return: list of `(expr, exception)` tuples
+        """
+        results = {}
+        new_segments = []
+        for segment in set(segments):
+            if segment in self.parsed_segments:
+                self.parsed_segments.move_to_end(segment)
+                results[segment] = self.parsed_segments[segment]
+            else:
+                new_segments.append(segment)
+        for segment, result in zip(new_segments, latex2sympy.process_sympy_many(new_segments)):
+            results[segment] = result
+            SP.remember(self.parsed_segments, segment, result)
+        return [results[segment] for segment in segments]
+
+    def simplify(self, expr):
+        """
+        :param expr: SymPy expression (after the evaluation of the heavy nodes)
+        :return: `sympy.simplify(expr)` (cached by the expression)
+        """
+        if expr in self.simplified:
+            self.simplified.move_to_end(expr)
+            return self.simplified[expr]
+        simplified = sympy.simplify(expr)
+        SP.remember(self.simplified, expr, simplified)
+        return simplified
+
+    @staticmethod
+    def remember(cache, key, value):
+        """
+        Adds an entry to one of the bounded (LRU) caches.
+
+        :param cache: `OrderedDict`
+        """
+        cache[key] = value
+        if len(cache) > SP.MAX_CACHED:
+            cache.popitem(last=False)
+
     def test_sympy_simplify(self, left, right, comparator):
-        sub = comparator.is_valid_sub(sympy.simplify(left-right))
-        if sympy.simplify(right) != 0:
-            div = comparator.is_valid_div(sympy.simplify(left/right))
+        sub = comparator.is_valid_sub(self.simplify(left-right))
+        if self.simplify(right) != 0:
+            div = comparator.is_valid_div(self.simplify(left/right))
         else:
             div = sub
         return sub, div
 
-    def test_sympy_numerical(self, left, right, comparator):
+    def test_sympy_sample(self, left, right, comparator):
+        """
+        Compares the sides at one sample (where all symbols have been substituted).
+
+        :return: True (agreement), False (confident disagreement) or None (the sample is not valid, e.g. not real)
+        """
+        left_value = left.evalf()
+        right_value = right.evalf()
+        if not (left_value.is_number and right_value.is_number):
+            # e.g. undefined functions
+            return self.test_sympy_simplify(left, right, comparator)[0] # Use only the `sub'
+        try:
+            left_value = complex(left_value)
+            right_value = complex(right_value)
+        except (TypeError, ValueError):
+            return None
+        if not all(math.isfinite(part) for part in [left_value.real, left_value.imag, right_value.real, right_value.imag]):
+            return None
+        scale = max(1, abs(left_value), abs(right_value))
+        if str(comparator) in ['=', '\\equiv', '\\neq']:
+            equal = abs(left_value - right_value) <= SP.TOLERANCE * scale
+            return equal if str(comparator) != '\\neq' else not equal
+        if abs(left_value.imag) > SP.TOLERANCE * scale or abs(right_value.imag) > SP.TOLERANCE * scale:
+            return None
+        return comparator.is_valid_sub(left_value.real - right_value.real)
+
+    def test_sympy_numerical(self, left, right, comparator, rng):
+        """
+        Tests the equation at random values of the symbols within the domain of both sides (adaptive sequential
+        sampling).
+
+        The test stops at the first disagreeing sample if no sample has agreed so far, and after `AGREEING_SAMPLES`
+        agreeing samples if none has disagreed; else `MAX_SAMPLES` samples are used.
+
+        :param rng: `random.Random` for the values of the symbols
+        :return: tuple of the ratio of the agreeing samples (None if there was no valid sample) and the number of samples
+        """
         left_symbols = left.free_symbols
         right_symbols = right.free_symbols
-        symbols = left_symbols | right_symbols
+        symbols = sorted(left_symbols | right_symbols, key=str)
         n_true = 0
         n_false = 0
+        n_samples = 0
         if self.args.verbose:
-            print("Symbols in numerical test: " + symbols)
-        for sign in [-1, 1]:
-            for integer in range(20):
-                substitutions = []
-                for symbol in symbols:
-                    value = (integer/2)**(random.uniform(0, 10)) * sign
-                    substitutions.append((symbol, value))
-                if self.test_sympy_simplify(left.subs(substitutions), right.subs(substitutions), comparator)[0]: # Use only the `sub'
-                    n_true += 1
-                else:
-                    n_false += 1
+            print("Symbols in numerical test: " + str(symbols))
+        sampler = src.sampling.Sampler(symbols, [left, right], rng)
+        while n_samples < SP.MAX_SAMPLES:
+            point = sampler.draw()
+            if point is None:
+                # The domain is (almost) empty
+                break
+            n_samples += 1
+            substitutions = list(zip(symbols, point))
+            try:
+                agree = self.test_sympy_sample(left.subs(substitutions), right.subs(substitutions), comparator)
+            except Exception:
+                agree = None
+            if agree is None:
+                continue
+            if agree:
+                n_true += 1
+            else:
+                n_false += 1
+            if (n_false == 1 and n_true == 0) or (n_true == SP.AGREEING_SAMPLES and n_false == 0):
+                SP.numerical_statistics['stopped early'] += 1
+                break
+        SP.numerical_statistics['tests'] += 1
+        SP.numerical_statistics['samples'] += n_samples
         if self.args.verbose:
+            print("Samples:     " + str(n_samples))
             print("True tests:  " + str(n_true))
             print("False tests: " + str(n_false))
-        return n_true/(n_true + n_false)
+        if n_true + n_false == 0:
+            return None, n_samples
+        return n_true/(n_true + n_false), n_samples
 
     def sympy_query(self, query, lets):
+        """
+        Checks the equation using SymPy (within `query.sympy_timeout` resp. `args.sympy_timeout` seconds, if set).
+
+        :param query: Equation object to be checked
+        :param lets: Lets (their definitions are considered and extended if `args.lets` is set)
+        :return: result, e.g. 'True', 'False', 'None' or 'Timeout'
+        """
+        seconds = query.sympy_timeout or self.args.sympy_timeout
+        if not seconds:
+            return self.sympy_check(query, lets)
+
+        def timeout(signum, frame):
+            raise SympyTimeout()
+
+        handler = signal.signal(signal.SIGALRM, timeout)
+        signal.setitimer(signal.ITIMER_REAL, seconds)
+        try:
+            return self.sympy_check(query, lets)
+        except SympyTimeout:
+            if self.args.verbose:
+                print(str(query) + ' (timeout)')
+            return 'Timeout'
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, handler)
+
+    def sympy_matrix_check(self, query):
+        """
+        Checks an equation containing matrix environments (see `src.matrices.check_matrix_equation`).
+
+        :param query: Equation object to be checked
+        :return: result
+        """
+        if self.args.verbose:
+            print(str(query))
+        if ':' in str(query.comparator):
+            return 'new'
+        res, reason = src.matrices.check_matrix_equation(query.left_content, query.right_content, query.comparator,
+                                                         self.parse_segments, self.get_rng(query))
+        query.reason = reason
+        if self.args.verbose:
+            print('Matrix evaluation: ' + res + (' (' + reason + ')' if reason else ''))
+        return res
+
+    def define(self, symbol, expr, lets):
+        """
+        Adds a definition to the Lets (only a single symbol can be defined).
+
+        :param symbol: parsed side which is defined
+        :param expr: parsed definition
+        :param lets: Lets
+        """
+        if isinstance(symbol, sympy.Symbol):
+            lets.define(symbol, expr)
+            if self.args.verbose:
+                print('Definition: ' + str(symbol) + ' := ' + str(lets.definitions[symbol]))
+
+    def strategy_numeric(self, query, left, right, rng):
+        """
+        Numerical evaluation of integrals, sums, products and limits (their symbolic simplification is often very slow).
+
+        :return: 'True', 'False' or None if it is inconclusive
+        """
+        res = src.numeric.check_numerically(left, right, query.comparator, rng)
+        if res is not None and self.args.verbose:
+            print('Numerical evaluation: ' + res)
+        return res
+
+    def strategy_interval(self, query, left, right, rng):
+        """
+        Interval arithmetic for inequalities (the simplification of `left - right` is often not comparable to 0).
+
+        :return: 'True', 'False' or None if it is inconclusive
+        """
+        res, counterexample = src.intervals.check_inequality(left, right, query.comparator)
+        if res is not None and self.args.verbose:
+            print('Interval arithmetic: ' + res)
+            if counterexample:
+                print('Counterexample: ' + str(counterexample))
+        return res
+
+    def strategy_simplify(self, query, left, right, rng):
+        """
+        Symbolic simplification of `left - right` and `left / right` (and the numerical test if `args.test_numerical`
+        is set).
+
+        :return: result, e.g. 'True', 'False' or 'sub and div different' (followed by the result of the numerical test)
+        """
+        # Each distinct integral, sum, product, limit and derivative is only evaluated once:
+        left = self.doit_cache.apply(left)
+        right = self.doit_cache.apply(right)
+
+        # Simplification tests:
+        sub, div = self.test_sympy_simplify(left, right, query.comparator)
+        if sub == div:
+            if sub:
+                res = 'True'
+            else:
+                res = 'False'
+        else:
+            res = 'sub and div different'
+
+        # Numerical tests:
+        if self.args.test_numerical:
+            numerical, query.samples = self.test_sympy_numerical(left, right, query.comparator, rng)
+            if numerical is None:
+                res += ' None'
+            elif numerical == 0:
+                res += ' False'
+            elif numerical == 1:
+                res += ' True'
+            else:
+                res += ' ' + str(numerical)
+
+        return res
+
+    def estimate_cost(self, query):
+        """
+        Estimates the seconds which `sympy_check` needs for the equation (before it is checked).
+
+        :param query: Equation object
+        :return: seconds
+        """
+        if src.matrices.matrix_environment_regex.search(query.left_content + query.right_content):
+            return src.cost.MATRIX_COST
+        left_content = src.objects.query_replacer(query.left_content)
+        right_content = src.objects.query_replacer(query.right_content)
+        if ':' in str(query.comparator) or \
+                prescan.find_unsupported(left_content) or prescan.find_unsupported(right_content):
+            return src.cost.REJECT_COST
+        (left, left_error), (right, right_error) = self.parse_segments([left_content, right_content])
+        if left_error or right_error:
+            return src.cost.REJECT_COST
+        return self.timings.estimate(src.cost.features(left, right, query.comparator), query.comparator)
+
+    def sympy_check(self, query, lets):
+
+        # Matrices are evaluated numerically (before `query_replacer`, which removes the `\\` and `&` of the matrices):
+        if src.matrices.matrix_environment_regex.search(query.left_content + query.right_content):
+            return self.sympy_matrix_check(query)
 
         # Remove irrelevant commands (it is here because else it would be conflicting the matrix translation for WA)
         query.left_content = src.objects.query_replacer(query.left_content)
         query.right_content = src.objects.query_replacer(query.right_content)
 
-        if '\\infty' in str(query):
+        # Reject what the grammar does not support before building the parser:
+        reason = prescan.find_unsupported(query.left_content) or prescan.find_unsupported(query.right_content)
+        if reason:
+            query.reason = reason
+            if self.args.verbose:
+                print(str(query) + ' (' + reason + ')')
             return 'None'
 
         if self.args.verbose:
             print((str(query)))
         try:
-            left = latex2sympy.process_sympy(query.left_content)
-            right = latex2sympy.process_sympy(query.right_content)
+            (left, left_error), (right, right_error) = self.parse_segments([query.left_content, query.right_content])
+            if left_error or right_error:
+                raise left_error or right_error
 
             query.interpretation_of_equation_to_latex = sympy.latex(left) + ' ' + str(query.comparator) + ' ' + sympy.latex(right)
 
             if ':' in str(query.comparator):
+                if self.args.lets:
+                    if str(query.comparator) == '=:':
+                        self.define(right, left, lets)
+                    else:
+                        self.define(left, right, lets)
                 return 'new'
 
-            # Simplification tests:
-            sub, div = self.test_sympy_simplify(left, right, query.comparator)
-            if sub == div:
-                if sub:
-                    res = 'True'
-                else:
-                    res = 'False'
-            else:
-                res = 'sub and div different'
-
-            # Numerical tests:
-            if self.args.test_numerical:
-                numerical = self.test_sympy_numerical(left, right, query.comparator)
-                if numerical == 0:
-                    res += ' False'
-                elif numerical == 1:
-                    res += ' True'
-                else:
-                    res += ' ' + str(numerical)
+            if self.args.lets:
+                # Like for WolframAlpha, an equation whose left side is a symbol which is not defined is a definition,
+                # but only if all the symbols of the right side are defined (otherwise it is checked):
+                if str(query.comparator) == '=' and isinstance(left, sympy.Symbol) and \
+                        left not in lets.definitions and right.free_symbols <= lets.definitions.keys():
+                    self.define(left, right, lets)
+                    return 'new'
+                left = lets.substitute(left)
+                right = lets.substitute(right)
 
+            # The strategies are tried from the cheapest one (per decisive result) on until one is decisive:
+            rng = self.get_rng(query)
+            features = src.cost.features(left, right, query.comparator)
+            route = self.timings.route(features, query.comparator)
+            if self.args.verbose:
+                print('Route: ' + ', '.join(route))
+            res = None
+            error = None
+            for i, strategy in enumerate(route):
+                start = time.perf_counter()
+                try:
+                    strategy_res = getattr(self, 'strategy_' + strategy)(query, left, right, rng)
+                except SympyTimeout:
+                    # A timeout is recorded as a slow run without a decision:
+                    self.timings.record(features, strategy, time.perf_counter() - start, False)
+                    raise
+                except Exception as e:
+                    error = error or e
+                    strategy_res = None
+                decisive = src.cost.is_decisive(strategy, strategy_res, route[i + 1:])
+                self.timings.record(features, strategy, time.perf_counter() - start, decisive)
+                if strategy_res is not None:
+                    res = strategy_res
+                if decisive:
+                    break
+            if res is None:
+                if error:
+                    raise error
+                res = 'None'
             return res
         except Exception as e:
 
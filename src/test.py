@@ -0,0 +1,474 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__      = "Felix Petersen"
+__status__      = "Production"
+
+# Checks of the strategies and backends whose results decide the verdicts.
+# Run from the root of the repository: `python -m src.test`
+
+
+import os
+import json
+import time
+import random
+import argparse
+import tempfile
+
+import sympy
+
+import src.cost
+import src.numeric
+import src.doit_cache
+import src.intervals
+import src.matrices
+import src.sympy
+import src.wa
+import src.wa_client
+import src.backends
+import src.objects
+import src.latex2sympy.process_latex as latex2sympy
+
+
+x = sympy.Symbol('x')
+
+
+# These inequalities should be decided by the interval arithmetic as follows (None: undecided)
+INTERVAL_CASES = [
+    ("x^2 + 1", ">", "0", 'True'),
+    ("\\sin(x)", "\\leq", "1", 'True'),
+    ("\\sqrt{x}", "\\leq", "x + 1", 'True'),
+    ("\\log(x)", "<", "x", 'True'),
+    ("x", "<", "x + 1", 'True'),
+    ("\\frac{1}{x^2 + 1}", "\\leq", "1", 'True'),
+    ("x^2", "<", "0", 'False'),
+    ("3", "<", "2", 'False'),
+    ("x^2", "\\geq", "x", 'False'),
+    ("n^2", "\\geq", "n", None),
+    ("x", "<", "2000000", None),
+    ("x^2 - 30x", "\\geq", "-300", None),
+]
+
+# These equations should be decided by the numerical evaluation as follows
+NUMERIC_CASES = [
+    ("\\int_0^1 x^2 dx", "\\frac{1}{3}", 'True'),
+    ("\\int_0^1 x^2 dx", "\\frac{1}{2}", 'False'),
+    ("\\int x dx", "\\frac{x^2}{2}", 'True'),
+    ("\\int x dx", "x^2", 'False'),
+    ("\\sum_{i=1}^n i", "\\frac{n \\cdot (n+1)}{2}", 'True'),
+    ("\\sum_{i=1}^n i", "n^2", 'False'),
+    ("\\sum_{i=0}^{\\infty} \\frac{1}{2^i}", "2", 'True'),
+    ("\\sum_{i=0}^{\\infty} \\frac{1}{2^i}", "3", 'False'),
+    ("\\prod_{n=2}^{\\infty} (1-\\frac{1}{n^2})", "\\frac{1}{2}", 'True'),
+    ("\\lim_{x\\to\\infty} \\frac{1}{x}", "0", 'True'),
+    ("\\lim_{x\\to\\infty} \\frac{1}{x}", "1", 'False'),
+]
+
+# These results should (not) end the route of the strategies: (strategy, result, remaining strategies, decisive)
+DECISIVE_CASES = [
+    ('simplify', 'True', ['numeric'], True),
+    ('simplify', 'False', ['numeric'], False),
+    ('simplify', 'False', [], True),
+    ('simplify', 'sub and div different', [], False),
+    ('numeric', 'False', ['simplify'], True),
+    ('interval', None, ['simplify'], False),
+]
+
+# These equations should get the same verdicts whatever the order of the strategies is
+ROUTED_EQUATIONS = [
+    ("\\int_0^1 x^2 dx", "=", "\\frac{1}{3}"),
+    ("\\sum_{i=1}^n i", "=", "\\frac{n \\cdot (n+1)}{2}"),
+    ("\\sum_{i=0}^{\\infty} \\frac{1}{2^i}", "=", "2"),
+    ("\\sqrt{x}", "\\leq", "x + 1"),
+    ("x^2", "\\geq", "2x"),
+    ("x", "<", "2000000"),
+]
+
+# Equations checked in this order with the lets and their expected results
+LET_EQUATIONS = [
+    ("x", ":=", "2", 'new'),
+    ("\\int_0^1 x dx", "=", "\\frac{1}{2}", 'True'),
+    ("\\sum_{x=1}^x x", "=", "3", 'True'),
+    ("w", "=", "x + 1", 'new'),
+    ("w", "=", "3", 'True'),
+    ("y", "=", "2z", 'False'),
+]
+
+# These pairs of queries must not share their stored results
+DIFFERENT_QUERIES = [
+    ("{{1},{2}}=x", "{1,2}=x"),
+    ("{{5}} =5", "5=5"),
+    ("x=12", "x=1 2"),
+    ("x^{10}", "x^10"),
+]
+
+# These pairs of queries should share their stored results
+SAME_QUERIES = [
+    ("\\left( a \\times {b} \\right) = \\dfrac{x}{2}", "(a \\cdot b)=\\frac x 2"),
+    ("\\sqrt{x} + y", "\\sqrt x+y"),
+]
+
+
+def sp_args(**kwargs):
+    args = argparse.Namespace(verbose=False, lets=False, test_numerical=False, sympy_timeout=None, doit_cache=None,
+                              timings=None, seed=0, wa_fallback_sympy=True, wolfram_alpha_concurrency=2)
+    for key, value in kwargs.items():
+        setattr(args, key, value)
+    return args
+
+
+def equation(left, comparator, right):
+    return src.objects.Equation(left, right, left, right, comparator, src.objects.Lets(), None)
+
+
+def check_interval_cases():
+    """
+    The boxes evaluated at once (numpy) have to give the same verdicts as the boxes evaluated one by one.
+    """
+    passed = True
+    numpy = src.intervals.numpy
+    for batch in [True, False]:
+        src.intervals.numpy = numpy if batch else None
+        try:
+            for left, comparator, right, expected in INTERVAL_CASES:
+                res, _ = src.intervals.check_inequality(latex2sympy.process_sympy(left),
+                                                        latex2sympy.process_sympy(right), comparator)
+                if res != expected:
+                    print("ERROR: interval arithmetic decided \"%s %s %s\" as %s" % (left, comparator, right, res))
+                    passed = False
+        finally:
+            src.intervals.numpy = numpy
+    return passed
+
+
+def check_numeric_cases():
+    passed = True
+    for left, right, expected in NUMERIC_CASES:
+        res = src.numeric.check_numerically(latex2sympy.process_sympy(left), latex2sympy.process_sympy(right), '=',
+                                            random.Random(0))
+        if res != expected:
+            print("ERROR: numerical evaluation decided \"%s = %s\" as %s" % (left, right, res))
+            passed = False
+    # Without symbols the sides are evaluated only once:
+    return passed and list(src.numeric.sample_points([], set(), random.Random(0))) == [[]]
+
+
+def check_placeholder_order():
+    """
+    Evaluated products of matrix placeholders have to keep the order of the matrices.
+    """
+    placeholders = [sympy.Symbol(src.matrices.placeholder_name(i)) for i in range(30)]
+    return list(sympy.Mul(*placeholders).args) == placeholders
+
+
+def check_decisive():
+    passed = True
+    for strategy, result, remaining, expected in DECISIVE_CASES:
+        if src.cost.is_decisive(strategy, result, remaining) != expected:
+            print("ERROR: %s of %s should%s be decisive" % (result, strategy, '' if expected else ' not'))
+            passed = False
+    return passed
+
+
+def check_routes():
+    """
+    The verdicts with the simplification routed first have to be the same as with the default route.
+    """
+    file = os.path.join(tempfile.mkdtemp(), 'timings.json')
+    timings = {}
+    for kind in ['heavy', 'inequality']:
+        for size in ['small', 'medium', 'large']:
+            timings[kind + ' ' + size] = {'numeric': [10, 100.0, 10], 'interval': [10, 100.0, 10],
+                                          'simplify': [10, 0.01, 10]}
+    with open(file, 'w') as f:
+        json.dump(timings, f)
+    default = src.sympy.SP(sp_args())
+    reversed_route = src.sympy.SP(sp_args(timings=file))
+    for left, comparator, right in ROUTED_EQUATIONS:
+        if default.sympy_query(equation(left, comparator, right), src.objects.Lets()) != \
+                reversed_route.sympy_query(equation(left, comparator, right), src.objects.Lets()):
+            print("ERROR: the route changed the verdict of \"%s %s %s\"" % (left, comparator, right))
+            return False
+    return True
+
+
+def check_loaded_timings():
+    """
+    The timings recorded during the run must not change the route.
+    """
+    timings = src.cost.Timings()
+    features = src.cost.features(sympy.Integral(x, x), x ** 2 / 2, '=')
+    route = timings.route(features, '=')
+    for _ in range(10):
+        timings.record(features, route[0], 100.0, False)
+    return timings.route(features, '=') == route
+
+
+def check_doit_cache_persistence():
+    file = os.path.join(tempfile.mkdtemp(), 'doit.json')
+    integral = sympy.Integral(x ** 2, (x, 0, 1))
+    cache = src.doit_cache.DoitCache(file)
+    value = cache.apply(integral)
+    cache.save()
+    hits = src.doit_cache.DoitCache.statistics['hits']
+    loaded = src.doit_cache.DoitCache(file)
+    return loaded.apply(integral) == value == sympy.Rational(1, 3) and \
+        src.doit_cache.DoitCache.statistics['hits'] == hits + 1
+
+
+def check_lets():
+    """
+    An equation is a definition only if its right side is defined, and the definitions are not substituted for the
+    variables bound by integrals, sums, ...
+    """
+    sp = src.sympy.SP(sp_args(lets=True))
+    lets = src.objects.Lets()
+    passed = True
+    for left, comparator, right, expected in LET_EQUATIONS:
+        res = sp.sympy_query(equation(left, comparator, right), lets)
+        if res != expected:
+            print("ERROR: \"%s %s %s\" was checked as %s" % (left, comparator, right, res))
+            passed = False
+    return passed
+
+
+def check_time_budget():
+    """
+    The remaining time is passed to each check (without changing `args`), and the equations which are not reached are
+    marked as 'Skipped' (even if a Let made from them has been used).
+    """
+    args = argparse.Namespace(verbose=False, lets=False, mirror_interpretation=False, time_budget=0.3,
+                              sympy_timeout=None, wa_timeout=5)
+    timeouts = []
+
+    def check_equation(query, lets):
+        timeouts.append((query.sympy_timeout, query.wa_timeout, args.sympy_timeout, args.wa_timeout))
+        equations[-1].is_used()
+        time.sleep(0.2)
+        return 'True'
+
+    document = src.objects.LaTeXDocument('\\begin{document}$a = b$ $c = d$ $e = f$\\end{document}', args,
+                                         check_equation)
+    equations = document.get_equations()
+    document.work_on_mathmodes(lambda equation: 0)
+    return [equation.res for equation in equations] == ['True', 'True', 'Skipped'] and \
+        all(sympy_timeout <= 0.3 and wa_timeout <= 0.3 and (args_sympy, args_wa) == (None, 5)
+            for sympy_timeout, wa_timeout, args_sympy, args_wa in timeouts)
+
+
+class FakeTransport:
+    """
+    Answers every query with a result 'True' (or raises the given exception).
+    """
+
+    body = b'<queryresult success="true" error="false" numpods="1"><pod title="Result">' \
+           b'<subpod><plaintext>True</plaintext></subpod></pod></queryresult>'
+
+    def __init__(self, exception=None):
+        self.exception = exception
+        self.calls = 0
+
+    def get(self, params):
+        self.calls += 1
+        if self.exception:
+            raise self.exception
+        return FakeTransport.body
+
+
+def check_single_flight():
+    """
+    Identical queries which are in flight at the same time have to be sent only once.
+    """
+    transport = FakeTransport()
+    client = src.wa_client.WAClient('test flight', transport=transport, concurrency=1)
+    futures = [client.submit('x=x') for _ in range(5)]
+    return all(future.result().result_texts() == ['True'] for future in futures) and transport.calls == 1
+
+
+def check_cancel_shared():
+    """
+    A query which is shared must not be cancelled by one of its callers.
+    """
+    client = src.wa_client.WAClient('test cancel', transport=src.wa_client.StubTransport('fixed:0.2'),
+                                    concurrency=1)
+    client.submit('a')
+    shared = client.submit('b')
+    client.submit('b')
+    return not client.cancel('b', shared) and shared.result().success == 'false'
+
+
+def check_circuit_breaker():
+    """
+    After `breaker_threshold` failures no more queries are sent until the cooldown has passed.
+    """
+    transport = FakeTransport(exception=OSError('unreachable'))
+    client = src.wa_client.WAClient('test breaker', transport=transport, breaker_threshold=2, breaker_cooldown=60,
+                                    failure_ttl=0)
+    for input in ['a', 'b', 'c', 'd']:
+        try:
+            client.fetch(input)
+        except src.wa_client.WAUnavailable:
+            pass
+    return transport.calls == 2
+
+
+def check_stub_transport():
+    client = src.wa_client.WAClient('test stub', transport=src.wa_client.make_transport('stub'))
+    return client.query('x=x').success == 'false'
+
+
+def check_record_and_replay():
+    file = os.path.join(tempfile.mkdtemp(), 'cassette.json')
+    recorder = src.wa_client.RecordTransport(FakeTransport(), src.wa_client.Cassette(file))
+    client = src.wa_client.WAClient('test record', transport=recorder)
+    if client.query('x=x').result_texts() != ['True']:
+        return False
+    client = src.wa_client.WAClient('test replay', transport=src.wa_client.make_transport('replay', cassette=file),
+                                    breaker_threshold=1, breaker_cooldown=0)
+    if client.query('x=x').result_texts() != ['True']:
+        return False
+    # A probe which hits a missing recording must not keep the circuit breaker half-open:
+    client.breaker.failure()
+    try:
+        client.query('y=y')
+        return False
+    except src.wa_client.NotRecorded:
+        pass
+    return not client.breaker.probing and client.breaker.allow()
+
+
+def check_canonical_queries():
+    passed = True
+    for a, b in DIFFERENT_QUERIES + SAME_QUERIES:
+        if (src.wa.canonical_query(a) == src.wa.canonical_query(b)) != ((a, b) in SAME_QUERIES):
+            print("ERROR: wrong canonical forms of \"%s\" and \"%s\"" % (a, b))
+            passed = False
+    return passed
+
+
+class FakeSP:
+    def __init__(self, result, seconds=0):
+        self.result = result
+        self.seconds = seconds
+
+    def sympy_query(self, query, lets):
+        # Busy, like SymPy (the race mode interrupts SymPy between two bytecodes, not within `time.sleep`):
+        end = time.perf_counter() + self.seconds
+        while time.perf_counter() < end:
+            pass
+        return self.result
+
+
+class FakeWA:
+    def __init__(self, result, seconds=0):
+        self.result = result
+        self.seconds = seconds
+        self.queries = []
+        self.definitions = []
+
+    def wa_query(self, query, lets):
+        self.queries.append(str(query))
+        time.sleep(self.seconds)
+        return self.result
+
+    def lets_may_apply(self, query, lets):
+        return False
+
+    def prepare_content(self, content):
+        return content
+
+    def consider_as_let(self, query, lets):
+        self.definitions.append(str(query))
+
+    def finish(self):
+        pass
+
+
+# Results of SymPy and WolframAlpha and the expected (result, backend) in the hybrid resp. race mode
+HYBRID_CASES = [
+    ('True', 'False', ('True', 'SymPy')),
+    ('None', 'True', ('True', 'WolframAlpha')),
+    ('sub and div different', 'False', ('False', 'WolframAlpha')),
+    ('None', 'Unavailable', ('None', 'SymPy')),
+]
+RACE_CASES = [
+    # (SymPy result, its seconds, WolframAlpha result, its seconds, expected)
+    ('True', 0, 'False', 0.5, ('True', 'SymPy')),
+    ('None', 0, 'True', 0.2, ('True', 'WolframAlpha')),
+    ('True', 5, 'False', 0, ('False', 'WolframAlpha')),
+    ('None', 0, 'Unavailable', 0, ('None', 'SymPy')),
+]
+
+
+def check_hybrid():
+    for sp_result, wa_result, expected in HYBRID_CASES:
+        backends = src.backends.Backends(sp_args(), FakeWA(wa_result), FakeSP(sp_result))
+        query = equation('a', '=', 'b')
+        result = backends.hybrid_query(query, src.objects.Lets())
+        backends.finish()
+        if (result, query.backend) != expected:
+            print("ERROR: hybrid mode chose %s instead of %s" % ((result, query.backend), expected))
+            return False
+    return True
+
+
+def check_hybrid_definitions():
+    """
+    The definitions SymPy has recorded are not queried, but added to the lets of WolframAlpha.
+    """
+    wa = FakeWA('None')
+    backends = src.backends.Backends(sp_args(lets=True), wa, FakeSP('new'))
+    for comparator in [':=', '=']:
+        backends.hybrid_query(equation('y', comparator, '2x'), src.objects.Lets())
+    backends.finish()
+    return wa.queries == [] and len(wa.definitions) == 2
+
+
+def check_race():
+    for sp_result, sp_seconds, wa_result, wa_seconds, expected in RACE_CASES:
+        backends = src.backends.Backends(sp_args(), FakeWA(wa_result, wa_seconds), FakeSP(sp_result, sp_seconds))
+        query = equation('a', '=', 'b')
+        start = time.perf_counter()
+        result = backends.race_query(query, src.objects.Lets())
+        backends.finish()
+        if (result, query.backend) != expected or time.perf_counter() - start > 2:
+            print("ERROR: race mode chose %s instead of %s" % ((result, query.backend), expected))
+            return False
+    return True
+
+
+CHECKS = [
+    check_interval_cases,
+    check_numeric_cases,
+    check_placeholder_order,
+    check_lets,
+    check_doit_cache_persistence,
+    check_decisive,
+    check_routes,
+    check_loaded_timings,
+    check_time_budget,
+    check_single_flight,
+    check_hybrid,
+    check_hybrid_definitions,
+    check_cancel_shared,
+    check_race,
+    check_circuit_breaker,
+    check_stub_transport,
+    check_record_and_replay,
+    check_canonical_queries,
+]
+
+if __name__ == "__main__":
+    total = 0
+    passed = 0
+    for check in CHECKS:
+        total += 1
+        try:
+            if check():
+                passed += 1
+            else:
+                print("ERROR: %s failed" % check.__name__)
+        except Exception as e:
+            print("ERROR: Exception in %s: %s" % (check.__name__, e))
+
+    print("%d/%d CHECKS PASSED" % (passed, total))
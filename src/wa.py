@@ -5,17 +5,97 @@ __author__      = "Felix Petersen"
 __status__      = "Production"
 
 
-import wolframalpha
 appid = 'W536E7-TAGL5UQE8E'#mail@
 # appid = '83RUHP-RQ2E2R3E65'#@uni-konstanz.de
 # U2YPK6-9K5JY5YK6Y#mathematica
-waclient = wolframalpha.Client(app_id=appid)
 
 # Use unverified:
 import ssl
 ssl._create_default_https_context = ssl._create_unverified_context
 
+import os
+import re
+import time
+import threading
+import concurrent.futures
+
 import src.helper
+import src.wa_client
+
+
+matrix_environment_regex = re.compile(r'\\(begin|end)\{(matrix|bmatrix|pmatrix)\}')
+query_token_regex = re.compile(r'\\[a-zA-Z]+|\\.|\S', re.DOTALL)
+
+# Estimated seconds of a check whose result is stored resp. of a call of the API:
+STORED_RESULT_COST = 0.001
+QUERY_COST = 1.0
+
+# Commands which are written differently but mean the same for WolframAlpha:
+CANONICAL_COMMANDS = {'\\times': '\\cdot', '\\dfrac': '\\frac', '\\tfrac': '\\frac'}
+
+
+def canonical_query(query):
+    """
+    Canonical form of a query for the lookup of stored results.
+
+    `\\left` and `\\right` are dropped, synonymous commands are unified and the braces of a LaTeX group (after a
+    command, `^`, `_` or another group) around a single letter, digit or command are removed. Braces of WolframAlpha
+    lists like `{{1},{2}}` are kept. Whitespace is dropped, except for a single space between two letters or digits
+    (so that e.g. `12` and `1 2` stay different). Digits are single tokens, so that e.g. `x^{10}` and `x^10` stay
+    different, too.
+
+    >>> canonical_query(r"\\left( a \\times {b} \\right) = \\dfrac{x}{2}")
+    '(a\\\\cdot b)=\\\\frac x 2'
+    >>> canonical_query(r"{{1},{2}} = x  12"), canonical_query(r"{1,2}=x 1 2")
+    ('{{1},{2}}=x 12', '{1,2}=x 1 2')
+
+    :param query: query string
+    :return: canonical key
+    """
+    # Tuples of the token, whether it is separated from the previous one (by whitespace or removed braces) and whether
+    # it is the content of a removed group:
+    tokens = []
+    separated = False
+    end = 0
+    for match in query_token_regex.finditer(query):
+        token = match.group()
+        separated = separated or match.start() > end
+        end = match.end()
+        if token in ['\\left', '\\right']:
+            separated = True
+            continue
+        token = CANONICAL_COMMANDS.get(token, token)
+        if token == '}' and len(tokens) >= 3 and tokens[-2][0] == '{' and is_single_token(tokens[-1][0]) and \
+                (is_command(tokens[-3][0]) or tokens[-3][0] in ['^', '_', '}'] or tokens[-3][2]):
+            tokens[-2:] = [(tokens[-1][0], True, True)]
+            separated = True
+            continue
+        tokens.append((token, separated, False))
+        separated = False
+
+    result = ''
+    for token, separated, _ in tokens:
+        if result and ((separated and result[-1].isalnum() and token[0].isalnum()) or
+                       (is_command_end(result) and token[0].isalpha())):
+            result += ' '
+        result += token
+    return result
+
+
+def is_command(token):
+    return token[0] == '\\' and token[1:].isalpha()
+
+
+def is_command_end(text):
+    """
+    :return: True if the text ends with a command of letters (which a following letter would extend)
+    """
+    match = re.search(r'\\[a-zA-Z]+$', text)
+    return match is not None
+
+
+def is_single_token(token):
+    return token.isalnum() or is_command(token)
 
 
 def is_latex_command(pos, text):
@@ -51,6 +131,20 @@ def alpha_len(text):
     return len
 
 
+def lets_in_query(let_set, query):
+    """
+    Checks whether all lets of the subset are in the query and none of them is a command.
+
+    :param let_set: list of Lets
+    :param query: query string
+    :return: True or False
+    """
+    for let in let_set:
+        if query.find(let.left) == -1 or is_latex_command(query.find(let.left), query):
+            return False
+    return True
+
+
 def powerset(input, max):
     """
     Returns the powerset of `input` with the constraint, that each subset has max `max` elements.
@@ -81,6 +175,9 @@ class WA:
     WolframAlpha API helper class
     """
 
+    # For statistics purposes (lookups in the 'args.wolfram_alpha_results' file):
+    stored_results_statistics = {'lookups': 0, 'exact hits': 0, 'canonical hits': 0}
+
     def __init__(self, args):
         """
         Initializer of the WolframAlpha API helper class.
@@ -88,6 +185,99 @@ class WA:
         :param args: `args`
         """
         self.args = args
+        transport = src.wa_client.make_transport(args.wa_transport, url=args.wolfram_alpha_url,
+                                                 cassette=args.wa_cassette, latency=args.wa_latency)
+        self.client = src.wa_client.WAClient(args.wa_appid or appid, url=args.wolfram_alpha_url,
+                                             rate=args.wolfram_alpha_rate,
+                                             concurrency=args.wolfram_alpha_concurrency,
+                                             failure_ttl=args.wa_failure_ttl,
+                                             breaker_threshold=args.wa_breaker_threshold,
+                                             breaker_cooldown=args.wa_breaker_cooldown,
+                                             transport=transport)
+
+        # Futures of the queries which have been sent in advance (by `prefetch`):
+        self.prefetched = {}
+        # Guards `prefetched`, the stored results and the results file (in the race mode WolframAlpha is queried by
+        # several worker threads):
+        self.lock = threading.Lock()
+
+        # Results of the 'args.wolfram_alpha_results' file: query -> result resp. canonical query -> result
+        self.stored_results = {}
+        self.stored_canonical_results = {}
+        if self.args.wolfram_alpha_results and os.path.isfile(self.args.wolfram_alpha_results):
+            with open(self.args.wolfram_alpha_results, "r") as file:
+                for line in file.readlines():
+                    if '!!!' in line:
+                        self.store_result(line.split('!!!')[0], line.split('!!!')[1].replace('\n', ''))
+
+    def prepare_content(self, content):
+        """
+        Converts the matrices and removes irrelevant commands of one side of an equation.
+
+        :param content: LaTeX code of one side
+        :return: content as it is sent to WolframAlpha
+        """
+        # convert the matrices:
+        content = self.wa_mod_matrix(content)
+
+        # Remove irrelevant commands (it is here because else it would be conflicting the matrix translation for WA)
+        return src.objects.query_replacer(content)
+
+    def prefetch(self, equations):
+        """
+        Sends the queries of all (independent) equations concurrently, so that they are in flight together.
+
+        Only the first query of each equation is known in advance; the queries considering the lets are sent later.
+
+        :param equations: list of Equations which will be checked
+        """
+        for equation in equations:
+            if not equation.should_be_checked():
+                continue
+            self.prefetch_query(self.prepare_content(equation.left_content) + str(equation.comparator)
+                                + self.prepare_content(equation.right_content))
+
+    def prefetch_query(self, query):
+        """
+        Sends the query in advance unless it has already been sent or its result is stored.
+
+        :param query: query string
+        :return: True if the query has been sent
+        """
+        with self.lock:
+            if query in self.prefetched or self.get_stored_result(query) != '':
+                return False
+            self.prefetched[query] = self.client.submit(query)
+        return True
+
+    def cancel_prefetched(self, queries):
+        """
+        Cancels the prefetched queries whose results have not been used (as far as they have not been sent yet and
+        no other query waits for them).
+
+        :param queries: list of query strings
+        """
+        for query in queries:
+            with self.lock:
+                future = self.prefetched.pop(query, None)
+            if future is not None:
+                self.client.cancel(query, future)
+
+    def finish(self):
+        """
+        Cancels the prefetched queries which have not been used (e.g. of skipped equations).
+        """
+        with self.lock:
+            queries = list(self.prefetched)
+        self.cancel_prefetched(queries)
+
+    def lets_may_apply(self, query, lets):
+        """
+        :param query: Equation object
+        :param lets: List of (Let)s
+        :return: True if at least one of the lets may be substituted in the query
+        """
+        return any(lets_in_query([let], str(query)) for let in lets.candidates(str(query)))
 
     def consider_as_let(self, query, lets):
         left = query.left_content
@@ -114,63 +304,69 @@ class WA:
         :return: 
         """
 
-        # convert the matrices:
-        query.left_content = self.wa_mod_matrix(query.left_content)
-        query.right_content = self.wa_mod_matrix(query.right_content)
+        query.left_content = self.prepare_content(query.left_content)
+        query.right_content = self.prepare_content(query.right_content)
 
-        # Remove irrelevant commands (it is here because else it would be conflicting the matrix translation for WA)
-        query.left_content = src.objects.query_replacer(query.left_content)
-        query.right_content = src.objects.query_replacer(query.right_content)
+        # The check (incl. the lets) is limited to `query.wa_timeout` resp. `args.wa_timeout` seconds:
+        timeout = query.wa_timeout or self.args.wa_timeout
+        deadline = time.monotonic() + timeout if timeout else None
 
         # Get the result from the API / file
-        result = self.wa_query_call(query)
+        result = self.wa_query_call(query, deadline)
 
         # Consider lets:
         if self.args.lets:
-            if result != 'True':
+            if result != 'True' and result != 'Unavailable':
                 # The `max` at powerset defines how many lets should be maximal considered.
-                for let_set in powerset(lets, max=2)[:-1]:
-
-                    def lets_in_query():
-                        # Checks whether all lets of the subset are in the query and none of them is a command.
+                # Only the Lets whose identifier occurs in the query can pass `lets_in_query`:
+                let_sets = [let_set for let_set in powerset(lets.candidates(str(query)), max=2)[:-1]
+                            if lets_in_query(let_set, str(query))]
+
+                temp_queries = []
+                for let_set in let_sets:
+                    temp_query = str(query)
+                    for let in let_set:
+                        temp_query = temp_query.replace(let.left, let.right)
+                    temp_queries.append(temp_query)
+
+                # The following substitutions are sent speculatively while waiting for the current one, but the
+                # results are interpreted in the sequential order (so the chosen subset is the same).
+                window = max(1, self.args.wolfram_alpha_concurrency)
+                speculative = []
+                for i, let_set in enumerate(let_sets):
+                    for next_query in temp_queries[i:i + window]:
+                        if self.prefetch_query(next_query):
+                            speculative.append(next_query)
+
+                    result = self.wa_query_call(temp_queries[i], deadline)
+
+                    if self.args.verbose:
+                        print('\n')
                         for let in let_set:
-                            if str(query).find(let.left) == -1 or is_latex_command(str(query).find(let.left), str(query)):
-                                return False
-                        return True
-
-                    if lets_in_query():
-
-                        temp_query = str(query)
-
+                            print('Let "'+str(let)+'" found in: '+str(query))
+                        print('Lets:')
+                        for current_let in lets:
+                            print(current_let)
+                        print(result)
+                    if result == 'False':
+                        for let in let_set:
+                            let.is_used()
+                            lets.remove(let)
+                        if str(query.comparator) in ['=', ':=', '=:']:
+                            self.consider_as_let(query, lets)
+                        break
+                    elif result == 'None':
+                        # Test others if there was no result... later it will be interpreted...
+                        pass
+                    elif result == 'True':
                         for let in let_set:
-                            temp_query = temp_query.replace(let.left, let.right)
-
-                        result = self.wa_query_call(temp_query)
-
-                        if self.args.verbose:
-                            print('\n')
-                            for let in let_set:
-                                print('Let "'+str(let)+'" found in: '+str(query))
-                            print('Lets:')
-                            for current_let in lets:
-                                print(current_let)
-                            print(result)
-                        if result == 'False':
-                            for let in let_set:
-                                let.is_used()
-                                lets.remove(let)
-                            if str(query.comparator) in ['=', ':=', '=:']:
-                                self.consider_as_let(query, lets)
-                            break
-                        elif result == 'None':
-                            # Test others if there was no result... later it will be interpreted...
-                            pass
-                        elif result == 'True':
-                            for let in let_set:
-                                let.is_used()
-                            break
-                        else:
-                            break
+                            let.is_used()
+                        break
+                    else:
+                        break
+
+                # Cancel the speculative queries which are not needed anymore
+                self.cancel_prefetched(speculative)
 
             if result == 'None' and str(query.comparator) in ['=', ':=', '=:']:
                 # TODO: Maybe additional delete a let that has the same left...
@@ -178,29 +374,66 @@ class WA:
 
         return result
 
-    def wa_query_call(self, query):
+    def wa_query_call(self, query, deadline=None):
         """
         Checks whether the WolframAlpha query has already been requested and is in the 'args.wolfram_alpha_results' file.
 
         If not => call to WolframAlpha and write to the 'args.wolfram_alpha_results' file.
+        (Except if WolframAlpha is unavailable, so that the query is tried again the next time.)
 
         :param query: 
         :return: 
         """
-        result = ''
-        if self.args.wolfram_alpha_results:
-            with open(self.args.wolfram_alpha_results, "r") as file:
-                for line in file.readlines():
-                    if line.split('!!!')[0] == str(query):
-                        result = line.split('!!!')[1].replace('\n', '')
+        result = self.get_stored_result(str(query), statistics=True)
         if result == '':
-            result = self.wolframalpha_get_short_plain_result(str(query))
-            if self.args.wolfram_alpha_results:
-                with open(self.args.wolfram_alpha_results, "a") as file:
-                    file.write('\n' + str(query) + '!!!' + result)
+            result = self.wolframalpha_get_short_plain_result(str(query), deadline)
+            if self.args.wolfram_alpha_results and result != 'Unavailable':
+                with self.lock:
+                    with open(self.args.wolfram_alpha_results, "a") as file:
+                        file.write('\n' + str(query) + '!!!' + result)
+                    self.store_result(str(query), result)
         return result
 
-    def wolframalpha_get_short_plain_result(self, query):
+    def store_result(self, query, result):
+        self.stored_results[query] = result
+        self.stored_canonical_results[canonical_query(query)] = result
+
+    def estimate_cost(self, query):
+        """
+        Estimates the seconds of the check of the equation using WolframAlpha (before it is checked).
+
+        :param query: Equation object
+        :return: seconds
+        """
+        wa_query = self.prepare_content(query.left_content) + str(query.comparator) + self.prepare_content(query.right_content)
+        if self.get_stored_result(wa_query):
+            return STORED_RESULT_COST
+        return QUERY_COST
+
+    def get_stored_result(self, query, statistics=False):
+        """
+        Looks the query up in the results of the 'args.wolfram_alpha_results' file (first exactly, then canonically).
+
+        The query itself is still sent to WolframAlpha if there is no stored result.
+
+        :param query: query string
+        :param statistics: count the lookup for the statistics
+        :return: result stored in the 'args.wolfram_alpha_results' file or '' if there is none
+        """
+        if not self.args.wolfram_alpha_results:
+            return ''
+        result = self.stored_results.get(query, '')
+        if statistics:
+            WA.stored_results_statistics['lookups'] += 1
+            if result != '':
+                WA.stored_results_statistics['exact hits'] += 1
+        if result == '':
+            result = self.stored_canonical_results.get(canonical_query(query), '')
+            if statistics and result != '':
+                WA.stored_results_statistics['canonical hits'] += 1
+        return result
+
+    def wolframalpha_get_short_plain_result(self, query, deadline=None):
         """
         Queries the query from WolframAlpha and interprets + returns the result.
     
@@ -210,29 +443,43 @@ class WA:
         'False'
     
         :param query: 
-        :return: Interpretation of the WolframAlphas APIs result
+        :param deadline: `time.monotonic()` until which the result is awaited or None
+        :return: Interpretation of the WolframAlphas APIs result ('Unavailable' if WolframAlpha could not be reached in
+                 time)
         """
         try:
-            res = waclient.query(query)
+            with self.lock:
+                future = self.prefetched.pop(query, None)
+            if future is None or future.cancelled():
+                # A cancelled query must not be stored as a result, so it is sent again:
+                future = self.client.submit(query)
+            res = future.result(timeout=max(0, deadline - time.monotonic()) if deadline is not None else None)
+        except concurrent.futures.TimeoutError:
+            # The query keeps running (other callers may share it), only its result is not awaited:
+            if self.args.verbose:
+                print("WolframAlpha did not answer in time.")
+                print("Query =", query)
+            return 'Unavailable'
+        except src.wa_client.WAUnavailable as e:
+            if self.args.verbose:
+                print("WolframAlpha is unavailable:", e)
+                print("Query =", query)
+            return 'Unavailable'
         except Exception as e:
-            print("Exception at 'waclient.query(query)':", e)
+            print("Exception at 'self.client.query(query)':", e)
             print("Query =", query)
 
         result = "None"
 
         try:
             if res.success == 'true':
-                for pod in res.pod:
-                    if pod.title == 'Result':
-                        for sub in pod.subpods:
-                            result = sub.plaintext.replace('^', ' (carret) ').replace('{', '').replace('}', '').replace('\\',
-                                                                                                                        'backslash').replace('&', '\\&').replace('_', '\\_')
+                for text in res.result_texts():
+                    result = text.replace('^', ' (carret) ').replace('{', '').replace('}', '').replace('\\',
+                                                                                                  'backslash').replace('&', '\\&').replace('_', '\\_')
             else:
-                if 'tips' in res:
-                    if 'tip' in res['tips']:
-                        if '@text' in res['tips']['tip']:
-                            result = res['tips']['tip']['@text'].replace('^', ' (carret) ').replace('{', '').replace('}', '').replace('\\',
-                                                                                                                        'backslash').replace('&', '\\&').replace('_', '\\_')
+                if res.tip_text() is not None:
+                    result = res.tip_text().replace('^', ' (carret) ').replace('{', '').replace('}', '').replace('\\',
+                                                                                                             'backslash').replace('&', '\\&').replace('_', '\\_')
         except Exception:
             pass
         try:
@@ -257,6 +504,15 @@ class WA:
         # Recursion:
         input = self.wa_mod_matrix(input)
 
+        return self.format_wa_matrix(input)
+
+    def format_wa_matrix(self, input):
+        """
+        Converts the content of a LaTeX matrix (without matrices in it) to a WolframAlpha matrix.
+
+        :param input: Content of a LaTeX matrix (without '\begin{...}')
+        :return: Matrix in WolframAlpha style
+        """
         input = input.replace('  ', ' ').replace('\n', '')
         res = '{'
         for row in input.split('\\\\'):
@@ -276,11 +532,47 @@ class WA:
         res = res.replace(', ', ',').replace(' ,', ',').replace('{ ', '{').replace(' }', '}')
         return " " + res + " "
 
-
     def wa_mod_matrix(self, latex):
         """
         Main function for converting LaTeX matrices to WolframAlpha matrices.
+
+        The matrix environments are converted in one pass from the inside out (using a stack of the open environments).
+        Malformed environments and matrices of the same type nested in each other are converted by
+        `wa_mod_matrix_sequential` (so that the result is the same as before).
     
+        :param latex: LaTeX code which possibly contains matrices
+        :return: input, while matrices are converted into WolframAlpha matrices
+        """
+        # Stack of the open environments: (matrix type, parts of the content)
+        stack = [(None, [])]
+        pos = 0
+        for match in matrix_environment_regex.finditer(latex):
+            stack[-1][1].append(latex[pos:match.start()])
+            pos = match.end()
+            kind, matrix_type = match.groups()
+            if kind == 'begin':
+                if any(open_type == matrix_type for open_type, _ in stack):
+                    return self.wa_mod_matrix_sequential(latex)
+                stack.append((matrix_type, []))
+            else:
+                if stack[-1][0] != matrix_type:
+                    return self.wa_mod_matrix_sequential(latex)
+                _, parts = stack.pop()
+                stack[-1][1].append(self.format_wa_matrix(''.join(parts)))
+        if len(stack) != 1:
+            return self.wa_mod_matrix_sequential(latex)
+        stack[0][1].append(latex[pos:])
+        result = ''.join(stack[0][1])
+
+        if matrix_environment_regex.search(result):
+            # An environment has been formed by the conversion (e.g. by removing line breaks)
+            return self.wa_mod_matrix_sequential(latex)
+        return result
+
+    def wa_mod_matrix_sequential(self, latex):
+        """
+        Converts the matrices type by type, always the first environment (with the content up to the next end).
+
         :param latex: LaTeX code which possibly contains matrices
         :return: input, while matrices are converted into WolframAlpha matrices
         """
@@ -289,4 +581,4 @@ class WA:
                 latex = src.helper.apply_between_on_first_without_before_and_after(self.latex_to_wa_matrix, r'\begin{' + matrix_type + '}',
                                                                                    r'\end{' + matrix_type + '}', latex)
 
-        return latex
\ No newline at end of file
+        return latex
@@ -0,0 +1,539 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__      = "Felix Petersen"
+__status__      = "Production"
+
+
+import json
+import time
+import queue
+import random
+import threading
+import http.client
+import urllib.parse
+import xml.etree.ElementTree as ElementTree
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+API_URL = 'https://api.wolframalpha.com/v2/query'
+# Maximal number of answered queries which are kept for coalescing (the least recently used ones are dropped):
+MAX_ANSWERS = 1024
+
+
+class RateLimiter:
+    """
+    Token bucket which limits the number of queries per second.
+    """
+
+    def __init__(self, rate, burst=1):
+        """
+        :param rate: queries per second (0 for no limit)
+        :param burst: number of queries which may be sent at once
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class AppIdQuota:
+    """
+    Rate and concurrency cap of one app id.
+    """
+
+    def __init__(self, rate, concurrency):
+        self.rate_limiter = RateLimiter(rate)
+        self.semaphore = threading.BoundedSemaphore(concurrency)
+
+
+# The quotas are shared by all clients with the same app id (e.g. all files in folder mode):
+quotas = {}
+quotas_lock = threading.Lock()
+
+
+def get_quota(appid, rate, concurrency):
+    with quotas_lock:
+        if appid not in quotas:
+            quotas[appid] = AppIdQuota(rate, concurrency)
+        return quotas[appid]
+
+
+class WAUnavailable(Exception):
+    """
+    WolframAlpha could not be reached or did not answer properly (in contrast to an answer without a result).
+    """
+    pass
+
+
+class CircuitOpen(WAUnavailable):
+    """
+    The query has not been sent because of too many failures in a row.
+    """
+    pass
+
+
+class CircuitBreaker:
+    """
+    Fails fast after `threshold` failures in a row, until a probe succeeds.
+
+    After `cooldown` seconds one query is let through as a probe (half-open); if it succeeds, the circuit is closed
+    again, else it stays open for another `cooldown`.
+    """
+
+    def __init__(self, threshold=5, cooldown=30):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """
+        :return: True if a query may be sent
+        """
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if not self.probing and time.monotonic() - self.opened_at >= self.cooldown:
+                self.probing = True
+                return True
+            return False
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+
+# Like the quotas, the circuit breakers are shared by all clients with the same app id:
+breakers = {}
+
+
+def get_breaker(appid, threshold, cooldown):
+    with quotas_lock:
+        if appid not in breakers:
+            breakers[appid] = CircuitBreaker(threshold, cooldown)
+        return breakers[appid]
+
+
+class SingleFlight:
+    """
+    Coalesces identical queries: the first caller of a query sends it, every other caller shares its Future.
+
+    Answers stay shared after they have arrived (up to `max_answers`, least recently used first out), so back-to-back
+    identical queries are not sent again either.
+    Failed queries are remembered for `failure_ttl` seconds (negative cache) and then tried again; queries which
+    have not been sent because of an open circuit and cancelled queries are forgotten at once. A query can only be
+    cancelled as long as no other caller shares it.
+    """
+
+    def __init__(self, failure_ttl=60, max_answers=MAX_ANSWERS):
+        self.futures = OrderedDict()
+        self.failed = {}
+        self.failure_ttl = failure_ttl
+        self.max_answers = max_answers
+        # Queries whose Future has been returned to more than one caller:
+        self.shared = set()
+        # Reentrant, because cancelling a Future calls `handle_failed` in the same thread:
+        self.lock = threading.RLock()
+        # Number of queries which have not been sent because an identical one was in flight or answered:
+        self.saved_calls = 0
+
+    def do(self, key, submit):
+        """
+        :param key: exact query string
+        :param submit: function which sends the query and returns a Future
+        :return: Future of the answer
+        """
+        with self.lock:
+            if key in self.failed and time.monotonic() - self.failed[key] > self.failure_ttl:
+                del self.futures[key]
+                del self.failed[key]
+            if key in self.futures:
+                self.saved_calls += 1
+                self.shared.add(key)
+                self.futures.move_to_end(key)
+                return self.futures[key]
+            future = submit()
+            self.futures[key] = future
+            self.shared.discard(key)
+            self.drop_answers()
+
+        def handle_failed(future):
+            if future.cancelled() or isinstance(future.exception(), CircuitOpen):
+                with self.lock:
+                    if self.futures.get(key) is future:
+                        del self.futures[key]
+            elif future.exception() is not None:
+                with self.lock:
+                    if self.futures.get(key) is future:
+                        self.failed[key] = time.monotonic()
+
+        future.add_done_callback(handle_failed)
+        return future
+
+    def cancel(self, key, future):
+        """
+        Cancels the query if it has not been sent yet and no other caller waits for it.
+
+        :param key: exact query string
+        :param future: Future returned by `do`
+        :return: True if the query has been cancelled
+        """
+        with self.lock:
+            if self.futures.get(key) is not future or key in self.shared:
+                return False
+            return future.cancel()
+
+    def drop_answers(self):
+        """
+        Drops the least recently used finished queries beyond `max_answers` (queries in flight are kept, their callers
+        are still waiting). Has to be called with the lock.
+        """
+        for key in list(self.futures):
+            if len(self.futures) <= self.max_answers:
+                break
+            if self.futures[key].done():
+                del self.futures[key]
+                self.failed.pop(key, None)
+                self.shared.discard(key)
+
+
+# Like the quotas, identical queries are coalesced across all clients with the same app id:
+flights = {}
+
+
+def get_flight(appid, failure_ttl=60):
+    with quotas_lock:
+        if appid not in flights:
+            flights[appid] = SingleFlight(failure_ttl)
+        return flights[appid]
+
+
+# Like the quotas, the worker threads are shared by all clients with the same app id (instead of a pool per file
+# which would never be shut down):
+executors = {}
+
+
+def get_executor(appid, concurrency):
+    with quotas_lock:
+        if appid not in executors:
+            executors[appid] = ThreadPoolExecutor(max_workers=concurrency)
+        return executors[appid]
+
+
+def get_saved_calls():
+    """
+    :return: number of API calls saved by coalescing identical queries (for statistics purposes)
+    """
+    with quotas_lock:
+        return sum(flight.saved_calls for flight in flights.values())
+
+
+class ConnectionPool:
+    """
+    Pool of persistent HTTP(S) connections to one host.
+    """
+
+    def __init__(self, url, timeout=30):
+        parsed = urllib.parse.urlsplit(url)
+        self.scheme = parsed.scheme
+        self.host = parsed.hostname
+        self.port = parsed.port
+        self.path = parsed.path
+        self.timeout = timeout
+        self.idle = queue.LifoQueue()
+
+    def new_connection(self):
+        if self.scheme == 'https':
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def get(self, params):
+        """
+        Sends a GET request using an idle connection (or a new one).
+
+        :param params: dict of the query parameters
+        :return: body of the response
+        """
+        try:
+            connection = self.idle.get_nowait()
+        except queue.Empty:
+            connection = self.new_connection()
+        try:
+            connection.request('GET', self.path + '?' + urllib.parse.urlencode(params))
+            response = connection.getresponse()
+            body = response.read()
+        except Exception:
+            connection.close()
+            raise
+        if response.status != 200:
+            connection.close()
+            raise IOError('HTTP status ' + str(response.status) + ' ' + response.reason)
+        self.idle.put(connection)
+        return body
+
+
+class NotRecorded(WAUnavailable):
+    """
+    The query is not in the cassette of the replay transport.
+    """
+    pass
+
+
+def parse_latency(spec):
+    """
+    Parses a latency distribution like 'fixed:0.5', 'uniform:0.2,1.5' or 'lognormal:0.8,0.5' (median, sigma).
+
+    :param spec: latency specification (in seconds) or None
+    :return: function returning a latency (using the given `random.Random`)
+    """
+    if not spec:
+        return lambda rng: 0
+    kind, _, values = spec.partition(':')
+    values = [float(value) for value in values.split(',')]
+    if kind == 'fixed':
+        return lambda rng: values[0]
+    if kind == 'uniform':
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == 'lognormal':
+        return lambda rng: values[0] * rng.lognormvariate(0, values[1])
+    raise ValueError('Unknown latency distribution: ' + spec)
+
+
+class Cassette:
+    """
+    JSON file with the recorded responses (body) per query (input).
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.lock = threading.Lock()
+        try:
+            with open(file_name, 'r') as file:
+                self.responses = json.load(file)
+        except FileNotFoundError:
+            self.responses = {}
+
+    def get(self, input):
+        with self.lock:
+            if input not in self.responses:
+                raise NotRecorded('Query not recorded: ' + input)
+            return self.responses[input].encode('utf-8')
+
+    def put(self, input, body):
+        with self.lock:
+            self.responses[input] = body.decode('utf-8')
+            with open(self.file_name, 'w') as file:
+                json.dump(self.responses, file, indent=1, ensure_ascii=False)
+
+
+class RecordTransport:
+    """
+    Sends the queries using another transport and records the responses in a cassette.
+    """
+
+    def __init__(self, transport, cassette):
+        self.transport = transport
+        self.cassette = cassette
+
+    def get(self, params):
+        body = self.transport.get(params)
+        self.cassette.put(params['input'], body)
+        return body
+
+
+class ReplayTransport:
+    """
+    Serves the responses recorded in a cassette (after an injected latency), without any network access.
+    """
+
+    def __init__(self, cassette, latency=None, seed=0):
+        self.cassette = cassette
+        self.latency = parse_latency(latency)
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def get(self, params):
+        with self.lock:
+            latency = self.latency(self.rng)
+        time.sleep(latency)
+        return self.cassette.get(params['input'])
+
+
+class StubTransport:
+    """
+    Answers every query (after an injected latency) with a response without result, e.g. for load tests.
+    """
+
+    body = b'<queryresult success="false" error="false" numpods="0"></queryresult>'
+
+    def __init__(self, latency=None, seed=0):
+        self.latency = parse_latency(latency)
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def get(self, params):
+        with self.lock:
+            latency = self.latency(self.rng)
+        time.sleep(latency)
+        return StubTransport.body
+
+
+def make_transport(mode, url=API_URL, cassette=None, latency=None):
+    """
+    :param mode: 'http', 'record', 'replay' or 'stub'
+    :param url: URL of the API (for 'http' and 'record')
+    :param cassette: file of the recorded responses (for 'record' and 'replay')
+    :param latency: injected latency distribution (for 'replay' and 'stub'), see `parse_latency`
+    :return: transport
+    """
+    if mode == 'http':
+        return ConnectionPool(url)
+    if mode == 'record':
+        return RecordTransport(ConnectionPool(url), Cassette(cassette))
+    if mode == 'replay':
+        return ReplayTransport(Cassette(cassette), latency)
+    if mode == 'stub':
+        return StubTransport(latency)
+    raise ValueError('Unknown transport: ' + mode)
+
+
+class WAClient:
+    """
+    Client for the WolframAlpha API with pooled connections and a rate and concurrency cap per app id.
+
+    Queries can be sent concurrently using `submit`.
+    """
+
+    def __init__(self, appid, url=API_URL, rate=2, concurrency=4, failure_ttl=60, breaker_threshold=5,
+                 breaker_cooldown=30, transport=None):
+        """
+        :param appid: WolframAlpha app id
+        :param url: URL of the API (e.g. a local stub server for testing)
+        :param rate: maximal queries per second for the app id
+        :param concurrency: maximal number of queries of the app id in flight
+        :param failure_ttl: seconds for which a failed query is not sent again
+        :param breaker_threshold: number of failures in a row after which no queries are sent anymore
+        :param breaker_cooldown: seconds after which a probe query is sent again
+        :param transport: object with a `get(params)` method returning the body (default: ConnectionPool of `url`)
+        """
+        self.appid = appid
+        self.transport = transport if transport is not None else ConnectionPool(url)
+        self.quota = get_quota(appid, rate, concurrency)
+        self.flight = get_flight(appid, failure_ttl)
+        self.breaker = get_breaker(appid, breaker_threshold, breaker_cooldown)
+        self.executor = get_executor(appid, concurrency)
+
+    def fetch(self, input):
+        """
+        Sends the query to WolframAlpha (blocking, without coalescing).
+
+        :param input: query
+        :return: QueryResult
+        :raises WAUnavailable: if WolframAlpha could not be reached or the circuit is open
+        """
+        if not self.breaker.allow():
+            raise CircuitOpen('WolframAlpha is unavailable (too many failures in a row)')
+        try:
+            with self.quota.semaphore:
+                self.quota.rate_limiter.acquire()
+                body = self.transport.get({'appid': self.appid, 'input': input})
+            result = QueryResult(body)
+        except NotRecorded:
+            # A missing recording is no failure of WolframAlpha (and a probe has to end either way):
+            self.breaker.success()
+            raise
+        except Exception as e:
+            self.breaker.failure()
+            raise WAUnavailable(str(e))
+        self.breaker.success()
+        return result
+
+    def query(self, input):
+        """
+        Queries WolframAlpha (blocking).
+
+        :param input: query
+        :return: QueryResult
+        """
+        return self.submit(input).result()
+
+    def submit(self, input):
+        """
+        Sends the query in the background (unless an identical query is already in flight or answered).
+
+        :param input: query
+        :return: Future of the QueryResult
+        """
+        return self.flight.do(input, lambda: self.executor.submit(self.fetch, input))
+
+    def cancel(self, input, future):
+        """
+        Cancels a query sent by `submit` unless it is already running or shared with another caller.
+
+        :param input: query
+        :param future: Future returned by `submit`
+        """
+        return self.flight.cancel(input, future)
+
+
+class QueryResult:
+    """
+    Parsed XML answer of the WolframAlpha API.
+    """
+
+    def __init__(self, xml):
+        self.root = ElementTree.fromstring(xml)
+        if self.root.tag == 'error':
+            raise ValueError('Error ' + str(self.root.findtext('code')) + ': ' + str(self.root.findtext('msg')))
+        if self.root.get('error') == 'true':
+            raise ValueError('Error ' + str(self.root.findtext('error/code')) + ': '
+                             + str(self.root.findtext('error/msg')))
+        self.success = self.root.get('success')
+
+    def result_texts(self):
+        """
+        :return: plaintexts of the subpods of the 'Result' pods
+        """
+        texts = []
+        for pod in self.root.findall('pod'):
+            if pod.get('title') == 'Result':
+                for sub in pod.findall('subpod'):
+                    texts.append(sub.findtext('plaintext') or None)
+        return texts
+
+    def tip_text(self):
+        """
+        :return: text of the tip if there is exactly one tip, else None
+        """
+        tips = self.root.findall('tips/tip')
+        if len(tips) == 1:
+            return tips[0].get('text')
+        return None
@@ -28,8 +28,12 @@ header_comment = "%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
 
 
 def check_equation(query, lets):
+    if args.race:
+        return backends.race_query(query, lets)
+    if args.hybrid:
+        return backends.hybrid_query(query, lets)
     if args.wolfram_alpha:
-        return wa.wa_query(query, lets)
+        return backends.wa_query(query, lets)
     elif args.sympy:
         return sp.sympy_query(query, lets)
     return 'None'
@@ -53,14 +57,36 @@ if __name__ == '__main__':
     parser.add_argument('-say', '--say', help='let the program tell if it has finished (using `say` command)', action="store_true", default=False)
     parser.add_argument('-wa', '--wolfram_alpha', help='use WolframAlpha for the correction', action="store_true", default=False)
     parser.add_argument('-sp', '--sympy', help='use SymPy for the correction', action="store_true", default=False)
-    parser.add_argument('-l', '--lets', help='[WolframAlpha only] consider previous equations as definitions', action="store_true", default=False)
+    parser.add_argument('-hy', '--hybrid', help='use SymPy first and WolframAlpha only for the equations SymPy can not decide', action="store_true", default=False)
+    parser.add_argument('-race', '--race', help='check every equation using SymPy and WolframAlpha at the same time and use the first decisive result', action="store_true", default=False)
+    parser.add_argument('-l', '--lets', help='consider previous equations as definitions', action="store_true", default=False)
     parser.add_argument('-ans', '--wolfram_alpha_results', help='[WolframAlpha only] define a file to store / reuse the results from the WolframAlpha API', type=str)
+    parser.add_argument('-wa_url', '--wolfram_alpha_url', help='[WolframAlpha only] URL of the WolframAlpha API', type=str, default='https://api.wolframalpha.com/v2/query')
+    parser.add_argument('-wa_con', '--wolfram_alpha_concurrency', help='[WolframAlpha only] maximal number of queries in flight at once', type=int, default=4)
+    parser.add_argument('-wa_rate', '--wolfram_alpha_rate', help='[WolframAlpha only] maximal number of queries per second (0 for no limit)', type=float, default=2)
+    parser.add_argument('-wa_id', '--wa_appid', help='[WolframAlpha only] WolframAlpha app id', type=str)
+    parser.add_argument('-wa_tr', '--wa_transport', help='[WolframAlpha only] how the queries are answered: `http` (default), `record` (http + save the responses in the cassette), `replay` (only from the cassette) or `stub` (no results)', choices=['http', 'record', 'replay', 'stub'], default='http')
+    parser.add_argument('-wa_cas', '--wa_cassette', help='[WolframAlpha only] JSON file of the recorded responses (for `-wa_tr record` / `replay`)', type=str)
+    parser.add_argument('-wa_lat', '--wa_latency', help='[WolframAlpha only] injected latency of `-wa_tr replay` / `stub` in seconds: `fixed:S`, `uniform:A,B` or `lognormal:MEDIAN,SIGMA`', type=str)
+    parser.add_argument('-wa_to', '--wa_timeout', help='[WolframAlpha only] maximal number of seconds for the check of one equation (result \'Unavailable\')', type=float)
+    parser.add_argument('-wa_fb', '--wa_fallback_sympy', help='[WolframAlpha only] use SymPy if WolframAlpha is unavailable', action="store_true", default=False)
+    parser.add_argument('-wa_ttl', '--wa_failure_ttl', help='[WolframAlpha only] seconds for which a failed query is not sent again', type=float, default=60)
+    parser.add_argument('-wa_bt', '--wa_breaker_threshold', help='[WolframAlpha only] number of failures in a row after which WolframAlpha is considered unavailable', type=int, default=5)
+    parser.add_argument('-wa_bc', '--wa_breaker_cooldown', help='[WolframAlpha only] seconds after which WolframAlpha is tried again once it is considered unavailable', type=float, default=30)
     parser.add_argument('-num', '--test_numerical', help='[SymPy only] test the equations numerical, too', action="store_true", default=False)
+    parser.add_argument('-sp_to', '--sympy_timeout', help='[SymPy only] maximal number of seconds for the check of one equation (result \'Timeout\')', type=float)
+    parser.add_argument('-sp_dc', '--doit_cache', help='[SymPy only] JSON file in which the evaluated integrals, sums, products, limits and derivatives are stored for later runs', type=str)
+    parser.add_argument('-sp_ti', '--timings', help='[SymPy only] JSON file in which the timings of the strategies are stored (they determine the order of the strategies and the estimated costs in later runs)', type=str)
+    parser.add_argument('-seed', '--seed', help='[SymPy only] seed of the random values of the numerical tests', type=int, default=0)
     parser.add_argument('-mirror', '--mirror_interpretation', help='[SymPy only] show the interpretation of the formulae backconverted to LaTeX behind the formula, too', action="store_true", default=False)
+    parser.add_argument('-tb', '--time_budget', help='maximal number of seconds for the checks of one document (the equations which are estimated to be the most valuable per second are checked, the others are marked as skipped)', type=float)
+    parser.add_argument('-dry', '--dry_run', help='only print the estimated cost of the check of each document (nothing is checked or written)', action="store_true", default=False)
     parser.add_argument('-wait', '--wait_for_output', help='wait for the user to press [Enter] before writing / outputting the result', action="store_true", default=False)
     parser.add_argument('-gui', '--gui', help='start the GUI (also possible using `./texEqCheck.py GUI`)', action="store_true", default=False)
     parser.add_argument('-stat', '--statistics', help='print out statistics about the results (how many equations could be checked, etc.)', action="store_true", default=False)
     args = parser.parse_args()
+    if args.wa_transport in ['record', 'replay'] and not args.wa_cassette:
+        parser.error('-wa_tr ' + args.wa_transport + ' requires a cassette (-wa_cas)')
 
     import src
 
@@ -98,6 +124,7 @@ if __name__ == '__main__':
         # Checker initialization (because `args` is required)
         wa = src.wa.WA(args)
         sp = src.sympy.SP(args)
+        backends = src.backends.Backends(args, wa, sp)
 
         # Check whether the input file is correct:
         file_dir = "./" + args.input_file_dir
@@ -122,8 +149,36 @@ if __name__ == '__main__':
         # Parses the document down to the math modes with top-down approach
         latex_document = src.objects.LaTeXDocument(content, args, check_equation)
 
+        # Estimated seconds of the check of an Equation:
+        if args.wolfram_alpha and not (args.hybrid or args.race):
+            estimate_cost = wa.estimate_cost
+        else:
+            estimate_cost = sp.estimate_cost
+
+        # Estimates the cost without checking anything
+        if args.dry_run:
+            equations = [equation for equation in latex_document.get_equations() if equation.should_be_checked()]
+            cost = sum(estimate_cost(equation) for equation in equations)
+            print("Estimated cost of \"" + file_dir + "\": " + str(round(cost, 3)) + " seconds for "
+                  + str(len(equations)) + " equations.")
+            continue
+
+        # Selects the equations which are checked (within the time budget)
+        schedule = latex_document.schedule(estimate_cost)
+
+        # Sends the independent WolframAlpha queries concurrently in advance
+        if (args.wolfram_alpha or args.race) and not args.hybrid:
+            wa.prefetch(schedule)
+
         # Executes the correction
-        latex_document.work_on_mathmodes()
+        latex_document.work_on_mathmodes(estimate_cost)
+
+        # Waits for the WolframAlpha queries which are still running
+        backends.finish()
+
+        # Stores the evaluated integrals etc. for later runs
+        sp.doit_cache.save()
+        sp.timings.save()
 
         # Takes the modified document back
         content = header_comment + str(latex_document)
@@ -144,7 +199,8 @@ if __name__ == '__main__':
             print(content)
 
     # Resume:
-    print(str(len(files)) + " files have been corrected.\n")
+    if not args.dry_run:
+        print(str(len(files)) + " files have been corrected.\n")
 
     # Statistics about the results
     if args.statistics:
@@ -162,11 +218,47 @@ if __name__ == '__main__':
                    + " of these "
                    + str(src.objects.Equation.results_dict['True'] + src.objects.Equation.results_dict['False'])
                    + " equations equations are true." )
+        if 'Skipped' in src.objects.Equation.results_dict:
+            print(str(src.objects.Equation.results_dict['Skipped'])
+                  + " of "
+                  + str(sum)
+                  + " equations have been skipped because of the time budget.")
         if 'Parentheses Error' in src.objects.Equation.results_dict:
             print(str(src.objects.Equation.results_dict['Parentheses Error'])
                   + " of "
                   + str(sum)
                   + " equations had a parentheses error.")
+        if (args.wolfram_alpha or args.hybrid or args.race) and src.wa_client.get_saved_calls():
+            print(str(src.wa_client.get_saved_calls())
+                  + " WolframAlpha API calls have been saved by sharing the results of identical queries.")
+        if src.sympy.SP.numerical_statistics['tests']:
+            statistics = src.sympy.SP.numerical_statistics
+            print(str(statistics['samples']) + " samples have been used in " + str(statistics['tests'])
+                  + " numerical tests (" + str(statistics['stopped early']) + " of them stopped early).")
+            if src.sampling.Sampler.statistics['rejected']:
+                print(str(src.sampling.Sampler.statistics['rejected']) + " of " + str(src.sampling.Sampler.statistics['drawn'])
+                      + " random points have been rejected because they were outside of the domain.")
+        if src.doit_cache.DoitCache.statistics['hits']:
+            statistics = src.doit_cache.DoitCache.statistics
+            print(str(statistics['hits']) + " of " + str(statistics['hits'] + statistics['misses'])
+                  + " integrals, sums, products, limits and derivatives have been taken from the cache.")
+        if src.wa.WA.stored_results_statistics['lookups']:
+            statistics = src.wa.WA.stored_results_statistics
+            print(str(statistics['exact hits'] + statistics['canonical hits']) + " of " + str(statistics['lookups'])
+                  + " WolframAlpha queries have been found in the results file ("
+                  + str(statistics['canonical hits']) + " of them only by their canonical form).")
+        if args.hybrid or args.race:
+            print("Decisions per backend:")
+            print(src.objects.Equation.backend_dict)
+        if args.race:
+            for backend in src.backends.Backends.latencies:
+                latencies = sorted(src.backends.Backends.latencies[backend])
+                if latencies:
+                    print(backend + " latency: median " + str(round(latencies[len(latencies) // 2], 3))
+                          + " s, max " + str(round(latencies[-1], 3)) + " s (" + str(len(latencies)) + " checks)")
+        if src.objects.Equation.reasons_dict:
+            print("Reasons why equations could not be checked:")
+            print(src.objects.Equation.reasons_dict)
 
     if args.say:
         os.system('say "equation checker has finished"')